@@ -1,9 +1,12 @@
 from __future__ import absolute_import, division, print_function
 
-from joblib import delayed, Parallel
+from joblib import delayed, effective_n_jobs, Parallel
 import numpy as np
 from sklearn.base import BaseEstimator, ClassifierMixin, RegressorMixin
-from sklearn.tree import DecisionTreeClassifier, DecisionTreeRegressor
+from sklearn.feature_selection import mutual_info_classif
+from sklearn.metrics import r2_score
+import copy
+from functools import partial
 import multiprocessing
 import threading
 import warnings
@@ -11,12 +14,24 @@ warnings.simplefilter('ignore')
 
 # Package imports
 # from externals.six.moves import range
-from feature_selectors import (permutation_test_mc, permutation_test_mi,
-                               permutation_test_dcor, permutation_test_pcor,
-                               permutation_test_rdc)
-from feature_selectors import mc_fast, mi, pcor, py_dcor
-from scorers import gini_index, mse
-from utils import bayes_boot_probs, logger
+from executors import get_executor
+from feature_selectors import (_approximate_pvalue, _check_method, chi2_test,
+                               kendall_test, kruskal_test, linear_test,
+                               permutation_test_anova,
+                               permutation_test_approx_wdcor,
+                               permutation_test_compressed_dcor,
+                               permutation_test_hsic,
+                               permutation_test_mc, permutation_test_mi,
+                               permutation_test_pcor, permutation_test_rdc,
+                               spearman_test, xi_test)
+from feature_selectors import mc_fast, mi, pcor
+from scorers import (approx_wdcor, category_codes, compressed_dcor, cramers_v,
+                     kendall_tau, kruskal_stat, linear_statistic, mc_matrix,
+                     pcor_matrix, rank, rdc_fast, rff_hsic, spearman, xicor,
+                     table_split_gini, table_split_mse)
+from utils import (bayes_boot_probs, constant_columns, Dataset,
+                   estimate_margin, logger, partition_rows, reject_null,
+                   take_rows, wilson_interval, Workspace)
 
 
 ###################
@@ -44,6 +59,8 @@ class Node(object):
     value : 1d array-like or float
         For classification trees, estimate of each class probability
         For regression trees, central tendency estimate
+        Internal nodes also keep the estimate of their samples so that the
+        tree can be pruned at the node
 
     left_child : tuple
         For left child node, two element tuple with first element a 2d array of
@@ -52,9 +69,15 @@ class Node(object):
     right_child : tuple
         For right child node, two element tuple with first element a 2d array of
         features and second element a 1d array of labels
+
+    categories : 1d array-like
+        For splits on categorical features, categories sent to the left child.
+        All other categories, including ones not seen during training, are
+        sent to the right child. None for splits on threshold
     """
     def __init__(self, col=None, col_pval=None, threshold=None, impurity=None,
-                 value=None, left_child=None, right_child=None):
+                 value=None, left_child=None, right_child=None,
+                 categories=None):
         self.col         = col
         self.col_pval    = col_pval
         self.threshold   = threshold
@@ -62,6 +85,343 @@ class Node(object):
         self.value       = value
         self.left_child  = left_child
         self.right_child = right_child
+        self.categories  = categories
+
+
+class FlatTree(object):
+    """Array representation of fitted tree used for vectorized traversal
+
+    Parameters
+    ----------
+    root : Node
+        Root node of fitted tree
+
+    Attributes
+    ----------
+    left : 1d array-like
+        Index of left child for each node, -1 for terminal nodes
+
+    right : 1d array-like
+        Index of right child for each node, -1 for terminal nodes
+
+    col : 1d array-like
+        Splitting column for each node, -1 for terminal nodes
+
+    threshold : 1d array-like
+        Splitting threshold for each node
+
+    col_pval : 1d array-like
+        Probability value of splitting column for each node, nan for terminal
+        nodes
+
+    depth : 1d array-like
+        Depth of each node, 0 for root node
+
+    value : 2d array-like
+        Node estimates with one row per node. For regression trees there is one
+        column
+
+    categorical : 1d array-like
+        Whether each node splits on categories
+
+    categories : list
+        Categories sent to the left child for each node, None for nodes that
+        split on threshold
+    """
+    def __init__(self, root):
+        nodes, stack = [], [(root, 0)]
+        while stack:
+            node, depth = stack.pop()
+            nodes.append((node, depth))
+            if node.left_child is not None:
+                stack.append((node.right_child, depth+1))
+                stack.append((node.left_child, depth+1))
+
+        # Map nodes to indices in order of traversal
+        ids            = dict((id(node), i) for i, (node, _) in enumerate(nodes))
+        n_nodes        = len(nodes)
+        self.left      = np.full(n_nodes, -1, dtype=int)
+        self.right     = np.full(n_nodes, -1, dtype=int)
+        self.col       = np.full(n_nodes, -1, dtype=int)
+        self.threshold = np.zeros(n_nodes)
+        self.col_pval  = np.full(n_nodes, np.nan)
+        self.depth     = np.zeros(n_nodes, dtype=int)
+        self.value     = np.array([np.ravel(node.value) for node, _ in nodes],
+                                  dtype=float)
+        self.categories  = [node.categories for node, _ in nodes]
+        self.categorical = np.array([c is not None for c in self.categories],
+                                    dtype=bool)
+
+        for i, (node, depth) in enumerate(nodes):
+            self.depth[i] = depth
+            if node.left_child is None: continue
+            self.left[i]      = ids[id(node.left_child)]
+            self.right[i]     = ids[id(node.right_child)]
+            self.col[i]       = node.col
+            self.threshold[i] = node.threshold
+            self.col_pval[i]  = node.col_pval
+
+
+    def _go_left(self, X, active, current, rows=None, replace=None):
+        """Evaluates splitting rules of current nodes for active samples
+
+        Parameters
+        ----------
+        X : 2d array-like
+            Array of features
+
+        active : 1d array-like
+            Positions of samples still being routed
+
+        current : 1d array-like
+            Current node of each active sample
+
+        rows : 1d array-like
+            If given, position i refers to row rows[i] of X
+
+        replace : tuple
+            If given, (col, values) where values replaces feature col with one
+            value per position
+
+        Returns
+        -------
+        go_left : 1d array-like
+            Boolean array that is True if sample follows left branch
+        """
+        cols   = self.col[current]
+        values = X[active if rows is None else rows[active], cols]
+        if replace is not None:
+            mask         = cols == replace[0]
+            values[mask] = replace[1][active[mask]]
+
+        with np.errstate(invalid='ignore'):
+            go_left = values <= self.threshold[current]
+
+        # Splits on categories send listed categories to the left child
+        categorical = self.categorical[current]
+        if categorical.any():
+            for node in np.unique(current[categorical]):
+                at_node          = current == node
+                go_left[at_node] = np.isin(values[at_node],
+                                           self.categories[node])
+        return go_left
+
+
+    def apply(self, X, alpha=None, max_depth=None, rows=None, start=None,
+              replace=None):
+        """Finds node reached by each sample
+
+        Parameters
+        ----------
+        X : 2d array-like
+            Array of features
+
+        alpha : float
+            If given, samples stop at the first node whose splitting column has
+            a probability value larger than alpha
+
+        max_depth : int
+            If given, samples stop at nodes with depth max_depth
+
+        rows : 1d array-like
+            If given, only routes these rows of X without copying them
+
+        start : 1d array-like
+            If given, node where each sample starts instead of the root node
+
+        replace : tuple
+            If given, (col, values) where values replaces feature col with one
+            value per routed sample
+
+        Returns
+        -------
+        node : 1d array-like
+            Index of node reached by each sample
+        """
+        n      = X.shape[0] if rows is None else len(rows)
+        node   = np.zeros(n, dtype=int) if start is None else np.array(start)
+        active = np.arange(n)
+        while active.size:
+            current = node[active]
+            keep    = self.left[current] != -1
+            if alpha is not None: keep &= self.col_pval[current] <= alpha
+            if max_depth is not None: keep &= self.depth[current] < max_depth
+            active, current = active[keep], current[keep]
+
+            # Follow left branch if feature value less than or equal to threshold
+            go_left      = self._go_left(X, active, current, rows, replace)
+            node[active] = np.where(go_left, self.left[current],
+                                    self.right[current])
+
+        return node
+
+
+    def visits(self, X, rows=None):
+        """Finds the internal nodes on the path of each sample
+
+        Parameters
+        ----------
+        X : 2d array-like
+            Array of features
+
+        rows : 1d array-like
+            If given, only routes these rows of X without copying them
+
+        Returns
+        -------
+        node : 1d array-like
+            Index of node reached by each sample
+
+        samples : list
+            List with one array per node holding the positions of samples that
+            pass through the node, empty for terminal nodes
+        """
+        n          = X.shape[0] if rows is None else len(rows)
+        node       = np.zeros(n, dtype=int)
+        active     = np.arange(n)
+        pos, nodes = [np.zeros(0, dtype=int)], [np.zeros(0, dtype=int)]
+        while active.size:
+            current         = node[active]
+            keep            = self.left[current] != -1
+            active, current = active[keep], current[keep]
+            pos.append(active)
+            nodes.append(current)
+
+            go_left      = self._go_left(X, active, current, rows)
+            node[active] = np.where(go_left, self.left[current],
+                                    self.right[current])
+
+        # Group sample positions by node
+        pos, nodes = np.concatenate(pos), np.concatenate(nodes)
+        order      = np.argsort(nodes, kind='mergesort')
+        bounds     = np.searchsorted(nodes[order], np.arange(len(self.left)+1))
+        samples    = [pos[order[bounds[i]:bounds[i+1]]]
+                      for i in range(len(self.left))]
+        return node, samples
+
+
+    def apply_depths(self, X, max_depth):
+        """Finds node reached by each sample at every depth in one traversal
+
+        Parameters
+        ----------
+        X : 2d array-like
+            Array of features
+
+        max_depth : int
+            Maximum depth to traverse
+
+        Returns
+        -------
+        nodes : 2d array-like
+            Array with shape (max_depth+1, n_samples) where row d holds the
+            node reached by each sample when stopping at depth d
+        """
+        nodes  = np.zeros((max_depth+1, X.shape[0]), dtype=int)
+        node   = np.zeros(X.shape[0], dtype=int)
+        active = np.arange(X.shape[0])
+        for depth in range(1, max_depth+1):
+            current         = node[active]
+            keep            = self.left[current] != -1
+            active, current = active[keep], current[keep]
+            go_left         = self._go_left(X, active, current)
+            node[active]    = np.where(go_left, self.left[current],
+                                       self.right[current])
+            nodes[depth]    = node
+
+        return nodes
+
+
+class FeatureMask(object):
+    """Immutable bitset of features available for selection in a subtree.
+    Muting or protecting a feature returns a new mask, so each node passes its
+    mask down to its children without changing the mask of other subtrees
+
+    Parameters
+    ----------
+    p : int
+        Number of features
+
+    available : int
+        Bitset of available features, all features if None
+
+    protected : int
+        Bitset of protected features, which are never muted
+
+    n_available : int
+        Number of available features, computed if None
+    """
+    __slots__ = ('p', 'available', 'protected', 'n_available')
+
+    def __init__(self, p, available=None, protected=0, n_available=None):
+        self.p           = int(p)
+        self.available   = (1 << self.p) - 1 if available is None else available
+        self.protected   = protected
+        self.n_available = self.p if available is None and n_available is None \
+                                  else n_available
+        if self.n_available is None:
+            self.n_available = bin(self.available).count('1')
+
+
+    def is_available(self, col):
+        """Whether feature is available"""
+        return bool((self.available >> int(col)) & 1)
+
+
+    def is_protected(self, col):
+        """Whether feature is protected"""
+        return bool((self.protected >> int(col)) & 1)
+
+
+    def mute(self, col):
+        """Removes feature from available features unless it is protected
+
+        Parameters
+        ----------
+        col : int
+            Integer index of column to remove
+
+        Returns
+        -------
+        mask : FeatureMask
+            Mask without feature, same mask if feature is protected or already
+            muted
+        """
+        if self.is_protected(col) or not self.is_available(col): return self
+        return FeatureMask(self.p, self.available & ~(1 << int(col)),
+                           self.protected, self.n_available-1)
+
+
+    def protect(self, col):
+        """Adds feature to protected features
+
+        Parameters
+        ----------
+        col : int
+            Integer index of column to protect
+
+        Returns
+        -------
+        mask : FeatureMask
+            Mask with feature protected
+        """
+        if self.is_protected(col): return self
+        return FeatureMask(self.p, self.available,
+                           self.protected | (1 << int(col)), self.n_available)
+
+
+    def features(self):
+        """Available features
+
+        Returns
+        -------
+        cols : 1d array-like
+            Sorted integer indices of available features
+        """
+        data = self.available.to_bytes((self.p+7)//8, 'little')
+        bits = np.unpackbits(np.frombuffer(data, dtype=np.uint8),
+                             bitorder='little')[:self.p]
+        return np.flatnonzero(bits)
 
 
 class CITreeBase(object):
@@ -102,10 +462,47 @@ class CITreeBase(object):
 
     random_state : int
         Sets seed for random number generator
+
+    max_test_samples : int
+        Maximum number of samples used by the permutation tests of a node. If a
+        node has more samples, the feature is selected on a random subsample
+        of this size while the split is still found on all samples. None uses
+        all samples
+
+    prescreen : bool
+        Whether to compute the raw association statistic of every candidate
+        feature before permutation testing and test features in descending
+        order of it. With early_stopping, the strongest feature is then usually
+        selected after a single permutation test
+
+    racing : bool
+        Whether to race candidate features. Permutations are run in rounds of
+        doubling size with the same permuted labels for every feature, and
+        features whose p-value confidence interval lies above that of the
+        current leader are dropped, so the remaining permutations are only
+        spent on contenders. Not available with the hybrid selector
+
+    categorical_features : list
+        Integer indices or boolean mask of integer coded categorical features.
+        For classification they are tested with a chi-square test of their
+        contingency table with the labels, asymptotic when every expected
+        count is at least 5 and by permutation otherwise. For regression they
+        are tested by permutation of the multiple correlation of the label
+        with the categories. Splits order categories by the node estimate of
+        each category and send a prefix of them to the left child
+
+    available_features : list
+        Integer indices of features the tree may select, for example the
+        survivors of the screening stage of a forest. None uses all features
     """
+    # Whether permutation tests of selector reuse a Workspace
+    _uses_workspace = False
+
     def __init__(self, min_samples_split=2, alpha=.05, max_depth=-1,
                  max_feats=-1, n_permutations=100, early_stopping=False,
-                 muting=True, verbose=0, n_jobs=-1, random_state=None):
+                 muting=True, verbose=0, n_jobs=-1, random_state=None,
+                 max_test_samples=None, prescreen=False, racing=False,
+                 categorical_features=None, available_features=None):
 
         # Error checking
         if alpha <= 0 or alpha > 1:
@@ -116,6 +513,9 @@ class CITreeBase(object):
         if not isinstance(max_feats, int) and max_feats not in ['sqrt', 'log', 'all', -1]:
             raise ValueError("%s not a valid argument for max_feats" % \
                              str(max_feats))
+        if max_test_samples is not None and max_test_samples < 1:
+            raise ValueError("max_test_samples (%s) should be >= 1" % \
+                             str(max_test_samples))
 
         # Define attributes
         self.alpha             = float(alpha)
@@ -126,8 +526,18 @@ class CITreeBase(object):
         self.muting            = muting
         self.verbose           = verbose
         self.n_jobs            = n_jobs
+        self.max_test_samples  = max_test_samples
+        self.prescreen         = prescreen
+        self.racing            = racing
         self.root              = None
         self.splitter_counter_ = 0
+        self._workspace        = None
+        self._test_buffer      = None
+        self._split_buffers    = None
+        self._data             = None
+
+        self.categorical_features = categorical_features
+        self.available_features   = available_features
 
         if max_depth == -1:
             self.max_depth = np.inf
@@ -141,41 +551,287 @@ class CITreeBase(object):
             self.random_state = int(random_state)
 
 
-    def _mute_feature(self, col_to_mute):
-        """Removes variable from being selected
+    def _prescreen(self, X, y, col_idx):
+        """Orders columns by descending raw association statistic
 
         Parameters
         ----------
-        col_to_mute : int
-            Integer index of column to remove
+        X : 2d array-like
+            Array of features
+
+        y : 1d array-like
+            Array of labels
+
+        col_idx : list
+            Columns of X to examine for feature selection
+
+        Returns
+        -------
+        col_idx : 1d array-like
+            Columns of X in the order they should be tested
         """
-        # Remove feature from protected features array
-        idx = np.where(self.available_features_ == col_to_mute)[0]
+        stats = self._statistics(X[:, col_idx], y, col_idx)
+        return np.asarray(col_idx)[np.argsort(-stats, kind='mergesort')]
 
-        # Mute feature if not in protected set
-        if idx in self.protected_features_:
-            return
-        else:
-            self.available_features_ = np.delete(self.available_features_, idx)
-
-            # Recalculate actual number for max_feats before fitting
-            p = self.available_features_.shape[0]
-            if self.max_feats == 'sqrt':
-                self.max_feats = int(np.sqrt(p))
-            elif self.max_feats == 'log':
-                self.max_feats = int(np.log(p+1))
-            elif self.max_feats in ['all', -1]:
-                self.max_feats = p
-            else:
-                self.max_feats = int(self.max_feats)
 
-            # Check to make sure max_feats is not larger than the number of remaining
-            # features
-            if self.max_feats > len(self.available_features_):
-                self.max_feats = len(self.available_features_)
+    def _statistics(self, X, y, cols):
+        """Computes raw association statistic of each column with label
 
+        Parameters
+        ----------
+        X : 2d array-like
+            Array of candidate features
+
+        y : 1d array-like
+            Array of labels
+
+        cols : 1d array-like
+            Column of original features for each column of X
+
+        Returns
+        -------
+        stats : 1d array-like
+            Statistic of each column, categorical columns use
+            _categorical_statistic
+        """
+        stats       = np.zeros(len(cols))
+        categorical = self.is_categorical_[cols]
+        if not categorical.all():
+            stats[~categorical] = self._numeric_statistics(X[:, ~categorical], y)
+        for j in np.where(categorical)[0]:
+            stats[j] = self._categorical_statistic(X[:, j], y)
+        return stats
+
+
+    def _numeric_statistics(self, X, y):
+        """Computes raw association statistic of each numeric column with label"""
+        raise NotImplementedError("_numeric_statistics method not callable from "
+                                  "base class")
+
+
+    def _categorical_statistic(self, x, y):
+        """Computes association statistic of categorical column with label"""
+        raise NotImplementedError("_categorical_statistic method not callable "
+                                  "from base class")
+
+
+    def _categorical_test(self, x, y):
+        """Tests association of categorical column with label"""
+        raise NotImplementedError("_categorical_test method not callable from "
+                                  "base class")
+
+
+    def _category_target(self, y):
+        """Values averaged within categories to order them for splitting"""
+        raise NotImplementedError("_category_target method not callable from "
+                                  "base class")
+
+
+    def _order_categories(self, x, y):
+        """Orders categories of feature by average of _category_target
+
+        Parameters
+        ----------
+        x : 1d array-like
+            Array of category codes
+
+        y : 1d array-like
+            Array of labels
+
+        Returns
+        -------
+        order : 1d array-like
+            Categories in ascending order of average target
+
+        ranks : 1d array-like
+            Rank of category of each sample in order
+        """
+        levels, codes = np.unique(x, return_inverse=True)
+        codes         = codes.ravel()
+        counts        = np.bincount(codes, minlength=len(levels))
+        means         = np.bincount(codes, weights=self._category_target(y),
+                                    minlength=len(levels))/counts
+        order         = np.argsort(means, kind='mergesort')
+        ranks         = np.empty(len(levels), dtype=float)
+        ranks[order]  = np.arange(len(levels))
+        return levels[order], ranks[codes]
+
+
+    def _racing_selector(self, X, y, col_idx, mask, batch_size=16, z=2.576):
+        """Selects feature most correlated with y by racing permutation tests
+        across columns
+
+        Note: Every round applies the same permutations of y to all remaining
+              columns. A column is dropped once the lower bound of its p-value
+              interval exceeds the smallest upper bound. The selected column
+              always runs every permutation, so its p-value does not depend on
+              alpha or on when the race stopped
+
+        Parameters
+        ----------
+        X : 2d array-like
+            Array of features
+
+        y : 1d array-like
+            Array of labels
+
+        col_idx : list
+            Columns of X to examine for feature selection
+
+        mask : FeatureMask
+            Features available in subtree
+
+        batch_size : int
+            Number of permutations in first round, doubled every round
+
+        z : float
+            Quantile of standard normal distribution for Wilson intervals
+
+        Returns
+        -------
+        best_col : int
+            Best column from feature selection
+
+        best_pval : float
+            Probability value from all permutations run on best column
+
+        mask : FeatureMask
+            Features available in subtree after muting
+        """
+        # Select random column from start and update
+        best_col = np.random.choice(col_idx)
+        if self.prescreen: col_idx = self._prescreen(X, y, col_idx)
+
+        # Mute constant features and drop them from race
+        constant, alive = constant_columns(X), []
+        for col in col_idx:
+            if constant[col]:
+                if mask.n_available > 1:
+                    mask = mask.mute(col)
+                    if self.verbose:
+                        logger("tree", "Constant values, muting feature %d" % col)
+                continue
+            alive.append(col)
+        if not alive or not self.n_permutations: return best_col, np.inf, mask
+
+        alive  = np.array(alive)
+        theta  = self._statistics(X[:, alive], y, alive)
+        counts = np.zeros(len(alive))
+        rng    = np.random.RandomState(self.random_state)
+        b      = 0
+        while b < self.n_permutations:
+
+            # Shared permutations for all remaining columns
+            size = min(max(b, batch_size), self.n_permutations - b)
+            for _ in range(size):
+                y_p     = y[rng.permutation(len(y))]
+                counts += self._statistics(X[:, alive], y_p, alive) >= theta
+            b += size
+
+            # Drop columns dominated by current leader
+            lower, upper = wilson_interval(counts, b, z=z)
+            keep         = lower <= upper.min()
+            alive, theta, counts, lower, upper = \
+                alive[keep], theta[keep], counts[keep], lower[keep], upper[keep]
+
+            if self.early_stopping and upper.min() < self.alpha:
+                if self.verbose: logger("tree", "Early stopping")
+                break
+
+        # If variable muting, only columns that ran every permutation qualify
+        if self.muting and b == self.n_permutations:
+            for col in alive[counts == b]:
+                if mask.n_available > 1:
+                    mask = mask.mute(col)
+                    if self.verbose: logger("tree", "ASL = 1.0, muting feature %d" % col)
+
+        # Ties go to first column in testing order
+        best = np.argmin(counts)
+
+        # Finish remaining permutations of selected column after early stopping
+        col, count = alive[best:best+1], counts[best]
+        for _ in range(self.n_permutations - b):
+            y_p    = y[rng.permutation(len(y))]
+            count += self._statistics(X[:, col], y_p, col)[0] >= theta[best]
+        return alive[best], count/self.n_permutations, mask
+
+
+    def _linear_selector(self, X, y, col_idx, mask):
+        """Selects feature with smallest asymptotic p-value of the quadratic
+        Strasser-Weber linear statistic, computed for all numeric columns in
+        one vectorized pass without permutations
+
+        Parameters
+        ----------
+        X : 2d array-like
+            Array of features
 
-    def _selector(self, X, y, col_idx):
+        y : 1d array-like
+            Array of labels
+
+        col_idx : list
+            Columns of X to examine for feature selection
+
+        mask : FeatureMask
+            Features available in subtree
+
+        Returns
+        -------
+        best_col : int
+            Best column from feature selection
+
+        best_pval : float
+            Asymptotic probability value of best column
+
+        mask : FeatureMask
+            Features available in subtree after muting
+        """
+        # Select random column from start and update
+        best_col = np.random.choice(col_idx)
+
+        # Mute constant features
+        constant, cols = constant_columns(X), []
+        for col in col_idx:
+            if constant[col]:
+                if mask.n_available > 1:
+                    mask = mask.mute(col)
+                    if self.verbose:
+                        logger("tree", "Constant values, muting feature %d" % col)
+                continue
+            cols.append(col)
+        if not cols: return best_col, np.inf, mask
+
+        # Categorical columns keep their own test and rank after numeric
+        # columns with the same p-value
+        cols        = np.array(cols)
+        pvals       = np.zeros(len(cols))
+        stats       = np.full(len(cols), -np.inf)
+        categorical = self.is_categorical_[cols]
+        if not categorical.all():
+            pvals[~categorical], stats[~categorical] = \
+                linear_test(X[:, cols[~categorical]], self._influence(y))
+        for j in np.where(categorical)[0]:
+            pvals[j] = self._categorical_test(X[:, cols[j]], y)
+
+        # If variable muting
+        if self.muting:
+            for col in cols[pvals == 1.0]:
+                if mask.n_available > 1:
+                    mask = mask.mute(col)
+                    if self.verbose: logger("tree", "p = 1.0, muting feature %d" % col)
+
+        # P-values underflow for strong features, so break ties by statistic
+        best = np.lexsort((-stats, pvals))[0]
+        return cols[best], pvals[best], mask
+
+
+    def _influence(self, y):
+        """Influence function of label for linear statistics"""
+        raise NotImplementedError("_influence method not callable from base "
+                                  "class")
+
+
+    def _selector(self, X, y, col_idx, mask):
         """Find feature most correlated with label"""
         raise NotImplementedError("_splitter method not callable from base class")
 
@@ -185,7 +841,91 @@ class CITreeBase(object):
         raise NotImplementedError("_splitter method not callable from base class")
 
 
-    def _build_tree(self, X, y, depth=0):
+    def _split_levels(self, X, col, x=None, rows=None):
+        """Sorted distinct values of the split variable at a node and the code
+        of each node sample. Features come from the sort cached by the data
+        set of the fit, other values such as ranks of categories are sorted
+
+        Parameters
+        ----------
+        X : 2d array-like
+            Array of features
+
+        col : int
+            Column of X to split on
+
+        x : 1d array-like
+            Values to split on instead of X[:, col], None for X[:, col]
+
+        rows : 1d array-like
+            Indices of node samples in the data set of the fit, None if unknown
+
+        Returns
+        -------
+        levels : 1d array-like
+            Sorted distinct values
+
+        codes : 1d array-like
+            Index in levels of the value of each node sample
+        """
+        if x is None and rows is not None and self._data is not None:
+            return self._data.node_levels(col, rows)
+
+        if x is None: x = X[:, col]
+        levels, codes = np.unique(x, return_inverse=True)
+        return levels, codes.ravel().astype(np.int64)
+
+
+    def _partition(self, X, y, rows, go_left, depth):
+        """Splits node data into left and right child data. Features of both
+        children are written into one buffer per depth, which every node at
+        that depth reuses since children of earlier nodes at the same depth
+        are fully built by then
+
+        Parameters
+        ----------
+        X : 2d array-like
+            Array of features
+
+        y : 1d array-like
+            Array of labels
+
+        rows : 1d array-like
+            Indices of node samples in the data set of the fit, None if unknown
+
+        go_left : 1d array-like
+            Boolean array, True for samples sent to the left child
+
+        depth : int
+            Depth of node
+
+        Returns
+        -------
+        left : tuple
+            Left child node data consisting of three elements: (features,
+            labels, indices)
+
+        right : tuple
+            Right child node data consisting of three elements: (features,
+            labels, indices)
+        """
+        buf = None
+        if self._split_buffers is not None:
+            while len(self._split_buffers) <= depth:
+                self._split_buffers.append(None)
+            buf = self._split_buffers[depth]
+            if buf is None or buf.shape[1] < len(y):
+                buf = np.empty((X.shape[1], len(y)), dtype=X.dtype)
+                self._split_buffers[depth] = buf
+
+        X_left, X_right = partition_rows(X, go_left, out=buf)
+        rows_left       = None if rows is None else rows[go_left]
+        rows_right      = None if rows is None else rows[~go_left]
+        return (X_left, y[go_left], rows_left), \
+               (X_right, y[~go_left], rows_right)
+
+
+    def _build_tree(self, X, y, rows=None, depth=0, mask=None):
         """Recursively builds tree
 
         Parameters
@@ -196,19 +936,28 @@ class CITreeBase(object):
         y : 1d array-like
             Array of labels
 
+        rows : 1d array-like
+            Indices of node samples in the data set of the fit, None if unknown
+
         depth : int
             Depth of current recursive call
 
+        mask : FeatureMask
+            Features available in subtree, all features if None
+
         Returns
         -------
         Node : object
             Child node or terminal node in recursive splitting
         """
-        n, p = X.shape
+        n, p  = X.shape
+        value = self.node_estimate(y)
+        if mask is None: mask = FeatureMask(p)
 
         # Check for stopping criteria
         if n > self.min_samples_split and \
            depth < self.max_depth and \
+           mask.n_available > 0 and \
            not np.all(y == y[0]):
 
             # Controls randomness of column sampling
@@ -216,26 +965,51 @@ class CITreeBase(object):
             np.random.seed(self.random_state*self.splitter_counter_)
 
             # Find column with strongest association with outcome
-            try:
-                col_idx = np.random.choice(self.available_features_,
-                                           size=self.max_feats, replace=False)
-            except:
-                col_idx = np.random.choice(self.available_features_,
-                                           size=len(self.available_features_),
-                                           replace=False)
-            col, col_pval = self._selector(X, y, col_idx)
+            col_idx = np.random.choice(mask.features(),
+                                       size=min(self.max_feats_, mask.n_available),
+                                       replace=False)
+
+            # Permutation tests on random subsample of large nodes, gathered
+            # into the buffer shared by all nodes
+            if self.max_test_samples is not None and n > self.max_test_samples:
+                sub              = np.random.choice(n, size=self.max_test_samples,
+                                                    replace=False)
+                X_test           = take_rows(X, sub, out=self._test_buffer)
+                col, col_pval, _ = self._selector(X_test, y[sub], col_idx,
+                                                  mask)
+
+                # Columns that are constant or have p-value 1 on the subsample
+                # may still be informative in the subtree, so only columns
+                # constant on the whole node are muted
+                constant = constant_columns(X)
+                for c in col_idx:
+                    if constant[c] and mask.n_available > 1:
+                        mask = mask.mute(c)
+            else:
+                col, col_pval, mask = self._selector(X, y, col_idx, mask)
 
             # Add selected feature to protected features
-            if col not in self.protected_features_:
-                self.protected_features_.append(col)
+            if not mask.is_protected(col):
+                mask = mask.protect(col)
                 if self.verbose > 1:
-                    logger("tree", "Added feature %d to protected set, size "
-                           "= %d" % (col, len(self.protected_features_)))
+                    logger("tree", "Added feature %d to protected set" % col)
 
             if col_pval <= self.alpha:
 
-                # Find best split among selected variable
-                impurity, threshold, left, right = self._splitter(X, y, n, col)
+                # Find best split among selected variable, categories are
+                # split on their rank when ordered by node estimate
+                categories = None
+                if self.is_categorical_[col]:
+                    order, ranks = self._order_categories(X[:, col], y)
+                    impurity, threshold, left, right = \
+                        self._splitter(X, y, n, col, x=ranks, rows=rows,
+                                       depth=depth)
+                    if left:
+                        categories = order[:int(np.floor(threshold))+1]
+                        threshold  = np.nan
+                else:
+                    impurity, threshold, left, right = \
+                        self._splitter(X, y, n, col, rows=rows, depth=depth)
                 if left and right and len(left[0]) > 0 and len(right[0]) > 0:
 
                     # Build subtrees for the right and left branches
@@ -243,29 +1017,115 @@ class CITreeBase(object):
                         logger("tree", "Building left subtree with "
                                        "%d samples at depth %d" % \
                                        (len(left[0]), depth+1))
-                    left_child = self._build_tree(*left, depth=depth+1)
+                    left_child = self._build_tree(*left, depth=depth+1,
+                                                  mask=mask)
 
                     if self.verbose:
                         logger("tree", "Building right subtree with "
                                        "%d samples at depth %d" % \
                                         (len(right[0]), depth+1))
-                    right_child = self._build_tree(*right, depth=depth+1)
+                    right_child = self._build_tree(*right, depth=depth+1,
+                                                   mask=mask)
 
-                    # Return all arguments to constructor except value
+                    # Keep value so tree can be pruned at this node
                     return Node(col=col, col_pval=col_pval, threshold=threshold,
                                 left_child=left_child, right_child=right_child,
-                                impurity=impurity)
-
-        # Calculate terminal node value
-        if self.verbose: logger("tree", "Root node reached at depth %d" % depth)
-        value = self.node_estimate(y)
+                                impurity=impurity, value=value,
+                                categories=categories)
 
         # Terminal node, no other values to pass to constructor
+        if self.verbose: logger("tree", "Root node reached at depth %d" % depth)
         return Node(value=value)
 
 
-    def fit(self, X, y=None):
-        """Trains model
+    def _setup_features(self, p):
+        """Sets boolean mask of categorical features and available features
+
+        Parameters
+        ----------
+        p : int
+            Number of features
+
+        Returns
+        -------
+        mask : FeatureMask
+            Features available at root
+        """
+        # Boolean mask of categorical features
+        self.is_categorical_ = np.zeros(p, dtype=bool)
+        if self.categorical_features is not None:
+            cat = np.asarray(self.categorical_features)
+            if cat.dtype == bool:
+                if cat.shape != (p,):
+                    raise ValueError("Boolean categorical_features should have "
+                                     "one element per feature (%d)" % p)
+                self.is_categorical_ = cat.copy()
+            else:
+                if cat.size and (cat.min() < 0 or cat.max() >= p):
+                    raise ValueError("categorical_features should be indices "
+                                     "in [0, %d)" % p)
+                self.is_categorical_[cat.astype(int)] = True
+
+        # Features available at root
+        if self.available_features is None:
+            self.available_features_ = np.arange(p)
+            return FeatureMask(p)
+
+        cols = np.unique(np.asarray(self.available_features, dtype=int))
+        if cols.size and (cols.min() < 0 or cols.max() >= p):
+            raise ValueError("available_features should be indices in [0, %d)"
+                             % p)
+        self.available_features_ = cols
+        return FeatureMask(p, sum(1 << int(col) for col in cols),
+                           n_available=len(cols))
+
+
+    def marginal_pvalues(self, X, y, method='approximate'):
+        """P-values of the association of every feature with the label on all
+        samples, using the raw statistic of the selector. Every permutation of
+        y is shared by all features, so each permutation costs one pass of the
+        statistics over the columns
+
+        Parameters
+        ----------
+        X : 2d array-like
+            Array of features
+
+        y : 1d array-like
+            Array of labels
+
+        method : str
+            'permutation' for the fraction of permutations at least as large
+            as the observed statistic, 'approximate' for the tail of a Pearson
+            type III distribution fit to their moments, which resolves the
+            small p-values that multiple testing corrections of many features
+            need
+
+        Returns
+        -------
+        pvals : 1d array-like
+            Achieved significance level of each feature, 1.0 for constant
+            features
+        """
+        _check_method(method)
+        p, cols = X.shape[1], np.arange(X.shape[1])
+        self._setup_features(p)
+        if not self.n_permutations: return np.ones(p)
+
+        theta   = self._statistics(X, y, cols)
+        theta_p = np.zeros((self.n_permutations, p))
+        rng     = np.random.RandomState(self.random_state)
+        for b in range(self.n_permutations):
+            theta_p[b] = self._statistics(X, y[rng.permutation(len(y))], cols)
+
+        if method == 'approximate':
+            return np.array([_approximate_pvalue(theta[j], theta_p[:, j])
+                             for j in range(p)])
+        return np.mean(theta_p >= theta, axis=0)
+
+
+    def fit(self, X, y=None):
+        """Trains model
 
         Parameters
         ----------
@@ -283,28 +1143,222 @@ class CITreeBase(object):
         if self.verbose:
             logger("tree", "Building root node with %d samples" % X.shape[0])
 
-        # Calculate actual number for max_feats before fitting
-        p = X.shape[1]
+        # Column-major copy of features so column reads are contiguous, its
+        # sorted features are shared by the splitters of all nodes
+        data = Dataset(X)
+        X    = data.X
+
+        # Features available at root and boolean mask of categorical features
+        p    = X.shape[1]
+        mask = self._setup_features(p)
+
+        # Calculate actual number for max_feats before fitting, screened out
+        # features do not count
+        n_available = mask.n_available
         if self.max_feats == 'sqrt':
-            self.max_feats = int(np.sqrt(p))
+            self.max_feats_ = int(np.sqrt(n_available))
         elif self.max_feats == 'log':
-            self.max_feats = int(np.log(p+1))
+            self.max_feats_ = int(np.log(n_available+1))
         elif self.max_feats in ['all', -1]:
-            self.max_feats = p
+            self.max_feats_ = n_available
         else:
-            self.max_feats = int(self.max_feats)
+            self.max_feats_ = int(self.max_feats)
+        self.max_feats_ = max(1, min(self.max_feats_, n_available))
+
+        # Buffers reused by the permutation tests, test subsamples and child
+        # nodes of every node, released after the build so fitted trees stay
+        # small
+        self._data          = data
+        self._split_buffers = []
+        if self._uses_workspace:
+            self._workspace = Workspace(X.shape[0], self.n_permutations)
+        if self.max_test_samples is not None and X.shape[0] > self.max_test_samples:
+            self._test_buffer = np.empty((p, self.max_test_samples), dtype=X.dtype)
 
         # Begin recursive build
-        self.protected_features_  = []
-        self.available_features_  = np.arange(p, dtype=int)
         self.feature_importances_ = np.zeros(p)
-        self.root                 = self._build_tree(X, y)
+        self.root                 = self._build_tree(X, y, np.arange(X.shape[0]),
+                                                     mask=mask)
+        self._workspace           = None
+        self._test_buffer         = None
+        self._split_buffers       = None
+        self._data                = None
+        self.flat_tree_           = FlatTree(self.root)
         sum_fi                    = np.sum(self.feature_importances_)
         if sum_fi > 0: self.feature_importances_ /= sum_fi
 
         return self
 
 
+    def _prune_node(self, node, alpha):
+        """Recursively copies tree, turning nodes whose splitting column has a
+        probability value larger than alpha into terminal nodes
+
+        Parameters
+        ----------
+        node : Node
+            Current node
+
+        alpha : float
+            Threshold value for probability values
+
+        Returns
+        -------
+        node : Node
+            Copy of pruned node
+        """
+        if node.left_child is None or node.col_pval > alpha:
+            return Node(value=node.value)
+
+        self.feature_importances_[node.col] += node.impurity
+        return Node(col=node.col, col_pval=node.col_pval,
+                    threshold=node.threshold, impurity=node.impurity,
+                    value=node.value,
+                    left_child=self._prune_node(node.left_child, alpha),
+                    right_child=self._prune_node(node.right_child, alpha),
+                    categories=node.categories)
+
+
+    def _check_alphas(self, alphas):
+        """Checks that alphas can be derived from fitted tree
+
+        Parameters
+        ----------
+        alphas : float or 1d array-like
+            Threshold values for probability values
+
+        Returns
+        -------
+        alphas : 1d array-like
+            Array of alphas
+        """
+        alphas = np.atleast_1d(np.asarray(alphas, dtype=float))
+        if np.any(alphas <= 0) or np.any(alphas > self.alpha):
+            raise ValueError("Alphas should be in (0, %.2f], the alpha used to "
+                             "fit the model" % self.alpha)
+        return alphas
+
+
+    def prune(self, alpha):
+        """Derives tree for a smaller alpha without refitting by turning nodes
+        whose splitting column has a probability value larger than alpha into
+        terminal nodes
+
+        Note: The derived tree is the tree a fit with alpha would grow when
+              every node shared by both trees selects the same column. Muted
+              and protected features only propagate to the subtree of a node,
+              so pruned subtrees do not affect the rest of the tree, but this
+              still does not hold in general:
+
+              * With early_stopping, the first column with a probability value
+                less than alpha is selected, so the selected column depends on
+                alpha itself
+
+              * Each node seeds column sampling with the number of nodes grown
+                before it, so after the first pruned node the columns sampled
+                with max_feats, and ties between equal probability values, can
+                differ
+
+              * With max_test_samples, the rows of large nodes that are tested
+                are drawn from the same seed, so after the first pruned node
+                the tested rows and their probability values can differ
+
+              With early_stopping=False, all features and max_test_samples=None,
+              the derived tree matches a refit up to ties between probability
+              values
+
+        Parameters
+        ----------
+        alpha : float
+            Threshold value in (0, alpha used to fit the model]
+
+        Returns
+        -------
+        tree : CITreeBase
+            Pruned copy of tree
+        """
+        alpha = float(self._check_alphas(alpha)[0])
+        tree  = copy.copy(self)
+
+        # Recompute feature importances on retained nodes
+        tree.alpha                = alpha
+        tree.feature_importances_ = np.zeros(len(self.feature_importances_))
+        tree.root                 = tree._prune_node(self.root, alpha)
+        tree.flat_tree_           = FlatTree(tree.root)
+        sum_fi                    = np.sum(tree.feature_importances_)
+        if sum_fi > 0: tree.feature_importances_ /= sum_fi
+
+        return tree
+
+
+    def _predict_value_path(self, X, alphas):
+        """Node estimates for each alpha in grid
+
+        Parameters
+        ----------
+        X : 2d array-like
+            Array of features
+
+        alphas : 1d array-like
+            Threshold values for probability values
+
+        Returns
+        -------
+        values : 3d array-like
+            Array of node estimates with shape (n_alphas, n_samples, n_outputs)
+        """
+        X = np.asarray(X)
+        return np.array([
+            self.flat_tree_.value[self.flat_tree_.apply(X, alpha=alpha)]
+            for alpha in self._check_alphas(alphas)
+            ])
+
+
+    def _predict_value(self, X, max_depth=None):
+        """Node estimates, optionally truncating tree at max_depth
+
+        Parameters
+        ----------
+        X : 2d array-like
+            Array of features
+
+        max_depth : int
+            If given, predictions stop at nodes with depth max_depth
+
+        Returns
+        -------
+        values : 2d array-like
+            Array of node estimates with shape (n_samples, n_outputs)
+        """
+        if max_depth is not None and max_depth < 0:
+            raise ValueError("max_depth (%d) should be >= 0" % max_depth)
+        X = np.asarray(X)
+        return self.flat_tree_.value[self.flat_tree_.apply(X, max_depth=max_depth)]
+
+
+    def _predict_value_depth_path(self, X, depths):
+        """Node estimates for each depth in grid using one traversal
+
+        Parameters
+        ----------
+        X : 2d array-like
+            Array of features
+
+        depths : 1d array-like
+            Depths at which to truncate tree
+
+        Returns
+        -------
+        values : 3d array-like
+            Array of node estimates with shape (n_depths, n_samples, n_outputs)
+        """
+        depths = np.atleast_1d(np.asarray(depths, dtype=int))
+        if np.any(depths < 0):
+            raise ValueError("Depths should be >= 0")
+        nodes = self.flat_tree_.apply_depths(np.asarray(X), int(depths.max()))
+        return self.flat_tree_.value[nodes[depths]]
+
+
     def predict_label(self, X, tree=None):
         """Predicts label
 
@@ -321,14 +1375,17 @@ class CITreeBase(object):
         label : int or float
             Predicted label
         """
-        # If we have a value => return value as the prediction
+        # If we are at a terminal node => return value as the prediction
         if tree is None: tree = self.root
-        if tree.value is not None: return tree.value
+        if tree.left_child is None: return tree.value
 
         # Determine if we will follow left or right branch
         feature_value = X[tree.col]
-        branch        = tree.left_child if feature_value <= tree.threshold \
-                                        else tree.right_child
+        if tree.categories is not None:
+            go_left = feature_value in tree.categories
+        else:
+            go_left = feature_value <= tree.threshold
+        branch = tree.left_child if go_left else tree.right_child
 
         # Test subtree
         return self.predict_label(X, branch)
@@ -355,14 +1412,19 @@ class CITreeBase(object):
         """
         # If we're at leaf => print the label
         if not tree: tree = self.root
-        if tree.value is not None: print("label:", tree.value)
+        if tree.left_child is None: print("label:", tree.value)
 
         # Go deeper down the tree
         else:
             # Print splitting rule
-            print("X[:,%s] %s %s " % (tree.col,
-                                      '<=' if child in [None, 'left'] else '>',
-                                      tree.threshold))
+            if tree.categories is not None:
+                print("X[:,%s] %s %s " % (tree.col,
+                                          'in' if child in [None, 'left'] else 'not in',
+                                          tree.categories.tolist()))
+            else:
+                print("X[:,%s] %s %s " % (tree.col,
+                                          '<=' if child in [None, 'left'] else '>',
+                                          tree.threshold))
 
             # Print the left child
             print("%sL: " % (indent), end="")
@@ -382,6 +1444,10 @@ class CITreeClassifier(CITreeBase, BaseEstimator, ClassifierMixin):
         Variable selector for finding strongest association between a feature
         and the label
 
+    n_fourier : int
+        Number of random Fourier features of each feature used by the hsic
+        selector
+
     Derived from CITreeBase class; see constructor for parameter definitions
 
     """
@@ -396,31 +1462,58 @@ class CITreeClassifier(CITreeBase, BaseEstimator, ClassifierMixin):
                  muting=True,
                  verbose=0,
                  n_jobs=-1,
-                 random_state=None):
+                 random_state=None,
+                 max_test_samples=None,
+                 prescreen=False,
+                 racing=False,
+                 categorical_features=None,
+                 available_features=None,
+                 n_fourier=20):
 
         # Define node estimate
         self.node_estimate = self._estimate_proba
 
         # Define selector
-        if selector not in ['mc', 'mi', 'hybrid']:
+        if selector not in ['mc', 'mi', 'kruskal', 'hsic', 'linear', 'hybrid']:
             raise ValueError("%s not a valid selector, valid selectors are " \
-                             "mc, mi, and hybrid")
-        self.selector = selector
+                             "mc, mi, kruskal, hsic, linear, and hybrid")
+        if n_fourier < 1:
+            raise ValueError("n_fourier (%s) should be >= 1" % str(n_fourier))
+        self.selector  = selector
+        self.n_fourier = int(n_fourier)
+
+        if self.selector == 'linear':
+            if racing:
+                raise ValueError("racing is not available with the linear "
+                                 "selector")
+            self._perm_test = None
+            self._selector  = self._linear_selector
 
-        if self.selector != 'hybrid':
+        elif self.selector != 'hybrid':
             # Wrapper correlation selector
             self._selector = self._cor_selector
 
             # Permutation test based on correlation measure
             if self.selector == 'mc':
-                self._perm_test = permutation_test_mc
+                self._perm_test      = permutation_test_mc
+                self._uses_workspace = True
+            elif self.selector == 'kruskal':
+                self._perm_test = kruskal_test
+            elif self.selector == 'hsic':
+                self._perm_test = partial(permutation_test_hsic,
+                                          n_fourier=self.n_fourier)
             else:
                 self._perm_test = permutation_test_mi
 
         else:
+            if racing:
+                raise ValueError("racing is not available with the hybrid "
+                                 "selector")
             self._perm_test = None
             self._selector  = self._hybrid_selector
 
+        if racing: self._selector = self._racing_selector
+
         super(CITreeClassifier, self).__init__(
                     min_samples_split=min_samples_split,
                     alpha=alpha,
@@ -431,10 +1524,137 @@ class CITreeClassifier(CITreeBase, BaseEstimator, ClassifierMixin):
                     muting=muting,
                     verbose=verbose,
                     n_jobs=n_jobs,
-                    random_state=random_state)
+                    random_state=random_state,
+                    max_test_samples=max_test_samples,
+                    prescreen=prescreen,
+                    racing=racing,
+                    categorical_features=categorical_features,
+                    available_features=available_features)
+
+
+    def _numeric_statistics(self, X, y):
+        """Computes raw association statistic of each numeric column with label
+
+        Parameters
+        ----------
+        X : 2d array-like
+            Array of candidate features
+
+        y : 1d array-like
+            Array of labels
+
+        Returns
+        -------
+        stats : 1d array-like
+            Multiple correlation, mutual information or normalized HSIC of
+            each column. For the hybrid selector, the larger of the first two
+        """
+        if self.selector == 'mc':
+            return mc_matrix(X, y, self.n_classes_)
+        elif self.selector == 'kruskal':
+            codes = np.searchsorted(self.labels_, y).astype(np.int64)
+            return np.array([kruskal_stat(rank(X[:, j]), codes, self.n_classes_)
+                             for j in range(X.shape[1])])
+        elif self.selector == 'hsic':
+            codes = np.searchsorted(self.labels_, y).astype(np.int64)
+            return np.array([rff_hsic(X[:, j], codes, self.n_fourier,
+                                      self.n_classes_, self.random_state)
+                             for j in range(X.shape[1])])
+        elif self.selector == 'linear':
+            return linear_statistic(X, self._influence(y))[0]
+        elif self.selector == 'mi':
+            return mutual_info_classif(X, y, random_state=self.random_state)
+        else:
+            return self._hybrid_statistics(X, y).max(axis=1)
+
+
+    def _hybrid_statistics(self, X, y, cols=None):
+        """Computes observed multiple correlation and mutual information of
+        each column with label, as the permutation tests compute them
+
+        Parameters
+        ----------
+        X : 2d array-like
+            Array of candidate features
+
+        y : 1d array-like
+            Array of labels
+
+        cols : 1d array-like
+            Column of original features for each column of X. If given, both
+            statistics of categorical columns are Cramer's V
+
+        Returns
+        -------
+        theta : 2d array-like
+            Array with one row per column, first column multiple correlation
+            and second column mutual information
+        """
+        theta = np.zeros((X.shape[1], 2))
+        for j in range(X.shape[1]):
+            if cols is not None and self.is_categorical_[cols[j]]:
+                theta[j] = self._categorical_statistic(X[:, j], y)
+            else:
+                theta[j] = mc_fast(X[:, j], y, self.n_classes_), \
+                           mi(X[:, j], y, self.random_state)
+        return theta
+
+
+    def _categorical_statistic(self, x, y):
+        """Cramer's V between categorical column and labels
+
+        Parameters
+        ----------
+        x : 1d array-like
+            Array of category codes
+
+        y : 1d array-like
+            Array of labels
+
+        Returns
+        -------
+        v : float
+            Cramer's V
+        """
+        codes, n_levels = category_codes(x)
+        return cramers_v(codes, y.astype(np.int64), n_levels, self.n_classes_)
+
+
+    def _categorical_test(self, x, y):
+        """Chi-square test between categorical column and labels
+
+        Parameters
+        ----------
+        x : 1d array-like
+            Array of category codes
+
+        y : 1d array-like
+            Array of labels
+
+        Returns
+        -------
+        pval : float
+            Probability value, asymptotic or from permutation test
+        """
+        return chi2_test(x, y, B=self.n_permutations, n_classes=self.n_classes_,
+                         random_state=self.random_state)
+
+
+    def _influence(self, y):
+        """One hot encoded classes"""
+        codes = np.searchsorted(self.labels_, y)
+        return (codes[:, None] == np.arange(self.n_classes_)).astype(float)
 
 
-    def _hybrid_selector(self, X, y, col_idx):
+    def _category_target(self, y):
+        """Indicator of most frequent class in node, categories are ordered by
+        their proportion of it. For two classes this finds the optimal split
+        """
+        return (y == np.argmax(np.bincount(y.astype(int),
+                                           minlength=self.n_classes_))).astype(float)
+
+
+    def _hybrid_selector(self, X, y, col_idx, mask):
         """Selects feature most correlated with y using permutation tests with
         a hybrid of multiple correlation and mutual information measures
 
@@ -449,6 +1669,9 @@ class CITreeClassifier(CITreeBase, BaseEstimator, ClassifierMixin):
         col_idx : list
             Columns of X to examine for feature selection
 
+        mask : FeatureMask
+            Features available in subtree
+
         Returns
         -------
         best_col : int
@@ -457,29 +1680,48 @@ class CITreeClassifier(CITreeBase, BaseEstimator, ClassifierMixin):
 
         best_pval : float
             Probability value from permutation test
+
+        mask : FeatureMask
+            Features available in subtree after muting
         """
         # Select random column from start and update
         best_col, best_pval = np.random.choice(col_idx), np.inf
 
+        # Observed statistics of both measures are computed once per column and
+        # the larger one is passed to its permutation test
+        col_idx = np.asarray(col_idx)
+        if self.prescreen:
+            theta          = self._hybrid_statistics(X[:, col_idx], y, col_idx)
+            order          = np.argsort(-theta.max(axis=1), kind='mergesort')
+            col_idx, theta = col_idx[order], theta[order]
+
         # Iterate over columns
-        for col in col_idx:
-            if mc_fast(X[:, col], y, self.n_classes_) >= mi(X[:, col], y):
-                pval = permutation_test_mc(x=X[:, col],
-                                           y=y,
-                                           n_classes=self.n_classes_,
-                                           B=self.n_permutations,
-                                           random_state=self.random_state)
+        for i, col in enumerate(col_idx):
+            if self.is_categorical_[col]:
+                pval = self._categorical_test(X[:, col], y)
             else:
-                pval = permutation_test_mi(x=X[:, col],
-                                           y=y,
-                                           B=self.n_permutations,
-                                           random_state=self.random_state)
+                theta_i = theta[i] if self.prescreen else \
+                          self._hybrid_statistics(X[:, [col]], y)[0]
+
+                if theta_i[0] >= theta_i[1]:
+                    pval = permutation_test_mc(x=X[:, col],
+                                               y=y,
+                                               n_classes=self.n_classes_,
+                                               B=self.n_permutations,
+                                               random_state=self.random_state,
+                                               theta=theta_i[0])
+                else:
+                    pval = permutation_test_mi(x=X[:, col],
+                                               y=y,
+                                               B=self.n_permutations,
+                                               random_state=self.random_state,
+                                               theta=theta_i[1])
 
             # If variable muting
             if self.muting and \
                pval == 1.0 and \
-               self.available_features_.shape[0] > 1:
-                self._mute_feature(col)
+               mask.n_available > 1:
+                mask = mask.mute(col)
                 if self.verbose: logger("tree", "ASL = 1.0, muting feature %d" % col)
 
             if pval < best_pval:
@@ -488,12 +1730,12 @@ class CITreeClassifier(CITreeBase, BaseEstimator, ClassifierMixin):
                 # If early stopping
                 if self.early_stopping and best_pval < self.alpha:
                     if self.verbose: logger("tree", "Early stopping")
-                    return best_col, best_pval
+                    return best_col, best_pval, mask
 
-        return best_col, best_pval
+        return best_col, best_pval, mask
 
 
-    def _splitter(self, X, y, n, col):
+    def _splitter(self, X, y, n, col, x=None, rows=None, depth=0):
         """Splits data set into two child nodes based on optimized weighted
         gini index
 
@@ -511,6 +1753,16 @@ class CITreeClassifier(CITreeBase, BaseEstimator, ClassifierMixin):
         col : list
             Column of X to search for best split
 
+        x : 1d array-like
+            Values to split on instead of X[:, col], for example ranks of
+            categories
+
+        rows : 1d array-like
+            Indices of node samples in the data set of the fit, None if unknown
+
+        depth : int
+            Depth of node
+
         Returns
         -------
         best_impurity : float
@@ -520,10 +1772,12 @@ class CITreeClassifier(CITreeBase, BaseEstimator, ClassifierMixin):
             X value associated with splitting of data set into two child nodes
 
         left : tuple
-            Left child node data consisting of two elements: (features, labels)
+            Left child node data consisting of three elements: (features,
+            labels, indices)
 
         right : tuple
-            Right child node data consisting of two elements: (features labels)
+            Right child node data consisting of three elements: (features,
+            labels, indices)
         """
         if self.verbose > 1:
             logger("splitter", "Testing splits on feature %d" % col)
@@ -532,35 +1786,31 @@ class CITreeClassifier(CITreeBase, BaseEstimator, ClassifierMixin):
         impurity, threshold = 0.0, None
         left, right         = None, None
 
-        # Call sklearn's optimized implementation of decision tree classifiers
-        # to make split using Gini index
-        base = DecisionTreeClassifier(
-                max_depth=1, min_samples_split=self.min_samples_split
-            ).fit(X[:, col].reshape(-1, 1), y).tree_
-
-        # Make split based on best threshold
-        threshold        = base.threshold[0]
-        idx              = np.where(X[:, col] <= threshold, 1, 0)
-        X_left, y_left   = X[idx==1], y[idx==1]
-        X_right, y_right = X[idx==0], y[idx==0]
-        n_left, n_right  = X_left.shape[0], X_right.shape[0]
+        # Every split between consecutive distinct values is scored on a table
+        # with one row per distinct value, whose codes come from the sort of
+        # the feature cached at the root
+        levels, codes    = self._split_levels(X, col, x=x, rows=rows)
+        best, impurities = table_split_gini(
+                codes, np.searchsorted(self.labels_, y).astype(np.int64),
+                len(levels), self.n_classes_
+            )
+        if best < 0: return impurity, threshold, left, right
+        threshold = (levels[best] + levels[best+1])/2.
 
         # Skip small splits
+        go_left = codes <= best
+        n_left  = int(go_left.sum())
+        n_right = n - n_left
         if n_left < self.min_samples_split or n_right < self.min_samples_split:
             return impurity, threshold, left, right
 
         # Calculate parent and weighted children impurities
-        if len(base.impurity) == 3:
-            node_impurity  = base.impurity[0]
-            left_impurity  = base.impurity[1]*(n_left/float(n))
-            right_impurity = base.impurity[2]*(n_right/float(n))
-        else:
-            node_impurity  = gini_index(y, self.labels_)
-            left_impurity  = gini_index(y_left, self.labels_)*(n_left/float(n))
-            right_impurity = gini_index(y_right, self.labels_)*(n_right/float(n))
+        node_impurity  = impurities[0]
+        left_impurity  = impurities[1]*(n_left/float(n))
+        right_impurity = impurities[2]*(n_right/float(n))
 
         # Define groups and calculate impurity decrease
-        left, right = (X_left, y_left), (X_right, y_right)
+        left, right = self._partition(X, y, rows, go_left, depth)
         impurity    = node_impurity - (left_impurity + right_impurity)
 
         # Update feature importance (mean decrease impurity)
@@ -569,7 +1819,7 @@ class CITreeClassifier(CITreeBase, BaseEstimator, ClassifierMixin):
         return impurity, threshold, left, right
 
 
-    def _cor_selector(self, X, y, col_idx):
+    def _cor_selector(self, X, y, col_idx, mask):
         """Selects feature most correlated with y using permutation tests with
         a correlation measure
 
@@ -584,6 +1834,9 @@ class CITreeClassifier(CITreeBase, BaseEstimator, ClassifierMixin):
         col_idx : list
             Columns of X to examine for feature selection
 
+        mask : FeatureMask
+            Features available in subtree
+
         Returns
         -------
         best_col : int
@@ -592,31 +1845,42 @@ class CITreeClassifier(CITreeBase, BaseEstimator, ClassifierMixin):
 
         best_pval : float
             Probability value from permutation test
+
+        mask : FeatureMask
+            Features available in subtree after muting
         """
         # Select random column from start and update
         best_col, best_pval = np.random.choice(col_idx), np.inf
+        if self.prescreen: col_idx = self._prescreen(X, y, col_idx)
+        work = {} if self._workspace is None else \
+            {'work': self._workspace.buffers}
+        constant = constant_columns(X)
 
         # Iterate over columns
         for col in col_idx:
 
             # Mute feature and continue since constant
-            if np.all(X[:, col] == X[0, col]) and len(self.available_features_) > 1:
-                self._mute_feature(col)
+            if constant[col] and mask.n_available > 1:
+                mask = mask.mute(col)
                 if self.verbose: logger("tree", "Constant values, muting feature %d" \
                                         % col)
                 continue
 
-            pval = self._perm_test(x=X[:, col],
-                                   y=y,
-                                   n_classes=self.n_classes_,
-                                   B=self.n_permutations,
-                                   random_state=self.random_state)
+            if self.is_categorical_[col]:
+                pval = self._categorical_test(X[:, col], y)
+            else:
+                pval = self._perm_test(x=X[:, col],
+                                       y=y,
+                                       n_classes=self.n_classes_,
+                                       B=self.n_permutations,
+                                       random_state=self.random_state,
+                                       **work)
 
             # If variable muting
             if self.muting and \
                pval == 1.0 and \
-               self.available_features_.shape[0] > 1:
-                self._mute_feature(col)
+               mask.n_available > 1:
+                mask = mask.mute(col)
                 if self.verbose: logger("tree", "ASL = 1.0, muting feature %d" % col)
 
             if pval < best_pval:
@@ -625,9 +1889,9 @@ class CITreeClassifier(CITreeBase, BaseEstimator, ClassifierMixin):
                 # If early stopping
                 if self.early_stopping and best_pval < self.alpha:
                     if self.verbose: logger("tree", "Early stopping")
-                    return best_col, best_pval
+                    return best_col, best_pval, mask
 
-        return best_col, best_pval
+        return best_col, best_pval, mask
 
 
     def _estimate_proba(self, y):
@@ -671,7 +1935,35 @@ class CITreeClassifier(CITreeBase, BaseEstimator, ClassifierMixin):
         return self
 
 
-    def predict_proba(self, X):
+    def marginal_pvalues(self, X, y, method='approximate', labels=None):
+        """P-values of the association of every feature with the label on all
+        samples, see CITreeBase.marginal_pvalues
+
+        Parameters
+        ----------
+        X : 2d array-like
+            Array of features
+
+        y : 1d array-like
+            Array of labels
+
+        method : str
+            'permutation' or 'approximate'
+
+        labels : 1d array-like
+            Array of unique class labels
+
+        Returns
+        -------
+        pvals : 1d array-like
+            Achieved significance level of each feature
+        """
+        self.labels_    = labels if labels is not None else np.unique(y)
+        self.n_classes_ = len(self.labels_)
+        return super(CITreeClassifier, self).marginal_pvalues(X, y, method)
+
+
+    def predict_proba(self, X, max_depth=None):
         """Predicts class probabilities for feature vectors X
 
         Parameters
@@ -679,18 +1971,21 @@ class CITreeClassifier(CITreeBase, BaseEstimator, ClassifierMixin):
         X : 2d array-like
             Array of features
 
+        max_depth : int
+            If given, tree is truncated at this depth
+
         Returns
         -------
         class_probs : 2d array-like
             Array of predicted class probabilities
         """
         if self.verbose:
-            logger("test", "Predicting labels for %d samples" % X.shape[0])
+            logger("test", "Predicting labels for %d samples" % len(X))
 
-        return np.array([self.predict_label(sample) for sample in X])
+        return self._predict_value(X, max_depth=max_depth)
 
 
-    def predict(self, X):
+    def predict(self, X, max_depth=None):
         """Predicts class labels for feature vectors X
 
         Parameters
@@ -698,15 +1993,100 @@ class CITreeClassifier(CITreeBase, BaseEstimator, ClassifierMixin):
         X : 2d array-like
             Array of features
 
+        max_depth : int
+            If given, tree is truncated at this depth
+
         Returns
         -------
         y : 1d array-like
             Array of predicted classes
         """
-        y_proba = self.predict_proba(X)
+        y_proba = self.predict_proba(X, max_depth=max_depth)
         return np.argmax(y_proba, axis=1)
 
 
+    def predict_proba_depth_path(self, X, depths):
+        """Predicts class probabilities with tree truncated at each depth in
+        grid using one traversal
+
+        Parameters
+        ----------
+        X : 2d array-like
+            Array of features
+
+        depths : 1d array-like
+            Depths at which to truncate tree
+
+        Returns
+        -------
+        class_probs : 3d array-like
+            Array of predicted class probabilities with shape
+            (n_depths, n_samples, n_classes)
+        """
+        return self._predict_value_depth_path(X, depths)
+
+
+    def predict_depth_path(self, X, depths):
+        """Predicts class labels with tree truncated at each depth in grid
+        using one traversal
+
+        Parameters
+        ----------
+        X : 2d array-like
+            Array of features
+
+        depths : 1d array-like
+            Depths at which to truncate tree
+
+        Returns
+        -------
+        y : 2d array-like
+            Array of predicted classes with shape (n_depths, n_samples)
+        """
+        return np.argmax(self.predict_proba_depth_path(X, depths), axis=2)
+
+
+    def predict_proba_path(self, X, alphas):
+        """Predicts class probabilities for each alpha in grid using the tree
+        fit at the loosest alpha. See prune for when this matches a refit
+
+        Parameters
+        ----------
+        X : 2d array-like
+            Array of features
+
+        alphas : 1d array-like
+            Threshold values in (0, alpha used to fit the model]
+
+        Returns
+        -------
+        class_probs : 3d array-like
+            Array of predicted class probabilities with shape
+            (n_alphas, n_samples, n_classes)
+        """
+        return self._predict_value_path(X, alphas)
+
+
+    def predict_path(self, X, alphas):
+        """Predicts class labels for each alpha in grid using the tree fit at
+        the loosest alpha. See prune for when this matches a refit
+
+        Parameters
+        ----------
+        X : 2d array-like
+            Array of features
+
+        alphas : 1d array-like
+            Threshold values in (0, alpha used to fit the model]
+
+        Returns
+        -------
+        y : 2d array-like
+            Array of predicted classes with shape (n_alphas, n_samples)
+        """
+        return np.argmax(self.predict_proba_path(X, alphas), axis=2)
+
+
 class CITreeRegressor(CITreeBase, BaseEstimator, RegressorMixin):
     """Conditional inference tree regressor
 
@@ -716,6 +2096,19 @@ class CITreeRegressor(CITreeBase, BaseEstimator, RegressorMixin):
         Variable selector for finding strongest association between a feature
         and the label
 
+    n_bins : int
+        Number of equal width intervals each array is cut into by the
+        approx_distance selector
+
+    n_fourier : int
+        Number of random Fourier features of each array used by the hsic
+        selector
+
+    engine : str
+        Implementation of distance correlation used by the distance and hybrid
+        selectors when a feature does not compress, 'numba' or 'c' for the C
+        library that streams over pairs in O(n) memory
+
     Derived from CITreeBase class; see constructor for rest of parameter definitions
 
     """
@@ -730,33 +2123,82 @@ class CITreeRegressor(CITreeBase, BaseEstimator, RegressorMixin):
                  muting=True,
                  verbose=0,
                  n_jobs=-1,
-                 random_state=None):
+                 random_state=None,
+                 max_test_samples=None,
+                 prescreen=False,
+                 racing=False,
+                 categorical_features=None,
+                 available_features=None,
+                 n_bins=32,
+                 n_fourier=20,
+                 engine='numba'):
 
         # Define node estimate
         self.node_estimate = self._estimate_mean
 
         # Define selector
-        if selector not in ['pearson', 'distance', 'rdc', 'hybrid']:
+        if selector not in ['pearson', 'spearman', 'kendall', 'distance',
+                            'approx_distance', 'rdc', 'xi', 'hsic', 'linear',
+                            'hybrid']:
             raise ValueError("%s not a valid selector, valid selectors are " \
-                             "pearson, distance, rdc, and hybrid")
-        self.selector = selector
+                             "pearson, spearman, kendall, distance, " \
+                             "approx_distance, rdc, xi, hsic, linear, and " \
+                             "hybrid")
+        if n_bins < 2:
+            raise ValueError("n_bins (%s) should be >= 2" % str(n_bins))
+        if n_fourier < 1:
+            raise ValueError("n_fourier (%s) should be >= 1" % str(n_fourier))
+        if engine not in ['numba', 'c']:
+            raise ValueError("%s not a valid engine, valid engines are numba "
+                             "and c" % str(engine))
+        self.selector  = selector
+        self.n_bins    = int(n_bins)
+        self.n_fourier = int(n_fourier)
+        self.engine    = engine
+
+        if self.selector == 'linear':
+            if racing:
+                raise ValueError("racing is not available with the linear "
+                                 "selector")
+            self._perm_test = None
+            self._selector  = self._linear_selector
 
-        if self.selector != 'hybrid':
+        elif self.selector != 'hybrid':
             # Wrapper correlation selector
             self._selector = self._cor_selector
 
             # Permutation test based on correlation measure
             if self.selector == 'pearson':
-                self._perm_test = permutation_test_pcor
+                self._perm_test      = permutation_test_pcor
+                self._uses_workspace = True
+            elif self.selector == 'spearman':
+                self._perm_test = spearman_test
+            elif self.selector == 'kendall':
+                self._perm_test = kendall_test
             elif self.selector == 'distance':
-                self._perm_test = permutation_test_dcor
+                self._perm_test      = partial(permutation_test_compressed_dcor,
+                                               engine=self.engine)
+                self._uses_workspace = True
+            elif self.selector == 'approx_distance':
+                self._perm_test = partial(permutation_test_approx_wdcor,
+                                          n_bins=self.n_bins)
+            elif self.selector == 'xi':
+                self._perm_test = xi_test
+            elif self.selector == 'hsic':
+                self._perm_test = partial(permutation_test_hsic,
+                                          n_fourier=self.n_fourier)
             else:
                 self._perm_test = permutation_test_rdc
 
         else:
+            if racing:
+                raise ValueError("racing is not available with the hybrid "
+                                 "selector")
             self._perm_test = None
             self._selector  = self._hybrid_selector
 
+        if racing: self._selector = self._racing_selector
+
         super(CITreeRegressor, self).__init__(
                     min_samples_split=min_samples_split,
                     alpha=alpha,
@@ -767,10 +2209,147 @@ class CITreeRegressor(CITreeBase, BaseEstimator, RegressorMixin):
                     muting=muting,
                     verbose=verbose,
                     n_jobs=n_jobs,
-                    random_state=random_state)
+                    random_state=random_state,
+                    max_test_samples=max_test_samples,
+                    prescreen=prescreen,
+                    racing=racing,
+                    categorical_features=categorical_features,
+                    available_features=available_features)
+
+
+    def _numeric_statistics(self, X, y):
+        """Computes raw association statistic of each numeric column with label
+
+        Parameters
+        ----------
+        X : 2d array-like
+            Array of candidate features
 
+        y : 1d array-like
+            Array of labels
+
+        Returns
+        -------
+        stats : 1d array-like
+            Absolute Pearson correlation, distance correlation, randomized
+            dependence coefficient or normalized HSIC of each column. For the
+            hybrid selector, the larger of Pearson and distance correlation
+        """
+        if self.selector == 'pearson':
+            return np.fabs(pcor_matrix(X, y))
+        elif self.selector == 'spearman':
+            return np.array([np.fabs(spearman(X[:, j], y))
+                             for j in range(X.shape[1])])
+        elif self.selector == 'kendall':
+            return np.array([np.fabs(kendall_tau(X[:, j], y))
+                             for j in range(X.shape[1])])
+        elif self.selector == 'rdc':
+            return np.array([rdc_fast(X[:, j], y) for j in range(X.shape[1])])
+        elif self.selector == 'distance':
+            return np.array([compressed_dcor(X[:, j], y)
+                             for j in range(X.shape[1])])
+        elif self.selector == 'approx_distance':
+            return np.array([approx_wdcor(X[:, j], y, self.n_bins)
+                             for j in range(X.shape[1])])
+        elif self.selector == 'linear':
+            return linear_statistic(X, self._influence(y))[0]
+        elif self.selector == 'xi':
+            return np.array([xicor(X[:, j], y, self.random_state)
+                             for j in range(X.shape[1])])
+        elif self.selector == 'hsic':
+            return np.array([rff_hsic(X[:, j], y, self.n_fourier,
+                                      random_state=self.random_state)
+                             for j in range(X.shape[1])])
+        else:
+            return self._hybrid_statistics(X, y).max(axis=1)
 
-    def _hybrid_selector(self, X, y, col_idx):
+
+    def _hybrid_statistics(self, X, y, cols=None):
+        """Computes observed absolute Pearson and distance correlation of each
+        column with label, as the permutation tests compute them
+
+        Parameters
+        ----------
+        X : 2d array-like
+            Array of candidate features
+
+        y : 1d array-like
+            Array of labels
+
+        cols : 1d array-like
+            Column of original features for each column of X. If given, both
+            statistics of categorical columns are the multiple correlation of
+            the label with the categories
+
+        Returns
+        -------
+        theta : 2d array-like
+            Array with one row per column, first column absolute Pearson
+            correlation and second column distance correlation
+        """
+        theta = np.zeros((X.shape[1], 2))
+        for j in range(X.shape[1]):
+            if cols is not None and self.is_categorical_[cols[j]]:
+                theta[j] = self._categorical_statistic(X[:, j], y)
+            else:
+                theta[j] = np.fabs(pcor(X[:, j], y)), \
+                           np.fabs(compressed_dcor(X[:, j], y))
+        return theta
+
+
+    def _categorical_statistic(self, x, y):
+        """Multiple correlation of label with categories of column
+
+        Parameters
+        ----------
+        x : 1d array-like
+            Array of category codes
+
+        y : 1d array-like
+            Array of labels
+
+        Returns
+        -------
+        cor : float
+            Multiple correlation coefficient
+        """
+        codes, n_levels = category_codes(x)
+        return mc_fast(y, codes, n_levels)
+
+
+    def _categorical_test(self, x, y):
+        """Permutation test between categorical column and labels
+
+        Parameters
+        ----------
+        x : 1d array-like
+            Array of category codes
+
+        y : 1d array-like
+            Array of labels
+
+        Returns
+        -------
+        pval : float
+            Probability value from permutation test
+        """
+        return permutation_test_anova(x, y, B=self.n_permutations,
+                                      random_state=self.random_state)
+
+
+    def _influence(self, y):
+        """Labels as a single column"""
+        return y.reshape(-1, 1).astype(float)
+
+
+    def _category_target(self, y):
+        """Labels, categories are ordered by their mean which finds the optimal
+        split for squared error
+        """
+        return y
+
+
+    def _hybrid_selector(self, X, y, col_idx, mask):
         """Selects feature most correlated with y using permutation tests with
         a hybrid of pearson and distance correlation measures
 
@@ -785,6 +2364,9 @@ class CITreeRegressor(CITreeBase, BaseEstimator, RegressorMixin):
         col_idx : list
             Columns of X to examine for feature selection
 
+        mask : FeatureMask
+            Features available in subtree
+
         Returns
         -------
         best_col : int
@@ -793,29 +2375,49 @@ class CITreeRegressor(CITreeBase, BaseEstimator, RegressorMixin):
 
         best_pval : float
             Probability value from permutation test
+
+        mask : FeatureMask
+            Features available in subtree after muting
         """
         # Select random column from start and update
         best_col, best_pval = np.random.choice(col_idx), np.inf
 
-        # Iterate over columns
-        for col in col_idx:
+        # Observed statistics of both measures are computed once per column and
+        # the larger one is passed to its permutation test
+        col_idx = np.asarray(col_idx)
+        if self.prescreen:
+            theta          = self._hybrid_statistics(X[:, col_idx], y, col_idx)
+            order          = np.argsort(-theta.max(axis=1), kind='mergesort')
+            col_idx, theta = col_idx[order], theta[order]
 
-            if abs(pcor(X[:, col], y)) >= abs(py_dcor(X[:, col], y)):
-                pval = permutation_test_pcor(x=X[:, col],
-                                             y=y,
-                                             B=self.n_permutations,
-                                             random_state=self.random_state)
+        # Iterate over columns
+        for i, col in enumerate(col_idx):
+            if self.is_categorical_[col]:
+                pval = self._categorical_test(X[:, col], y)
             else:
-                pval = permutation_test_dcor(x=X[:, col],
-                                             y=y,
-                                             B=self.n_permutations,
-                                             random_state=self.random_state)
+                theta_i = theta[i] if self.prescreen else \
+                          self._hybrid_statistics(X[:, [col]], y)[0]
+
+                if theta_i[0] >= theta_i[1]:
+                    pval = permutation_test_pcor(x=X[:, col],
+                                                 y=y,
+                                                 B=self.n_permutations,
+                                                 random_state=self.random_state,
+                                                 theta=theta_i[0])
+                else:
+                    pval = permutation_test_compressed_dcor(
+                                x=X[:, col],
+                                y=y,
+                                B=self.n_permutations,
+                                random_state=self.random_state,
+                                theta=theta_i[1],
+                                engine=self.engine)
 
             # If variable muting
             if self.muting and \
                pval == 1.0 and \
-               self.available_features_.shape[0] > 1:
-                self._mute_feature(col)
+               mask.n_available > 1:
+                mask = mask.mute(col)
                 if self.verbose: logger("tree", "ASL = 1.0, muting feature %d" % col)
 
             if pval < best_pval:
@@ -824,12 +2426,12 @@ class CITreeRegressor(CITreeBase, BaseEstimator, RegressorMixin):
                 # If early stopping
                 if self.early_stopping and best_pval < self.alpha:
                     if self.verbose: logger("tree", "Early stopping")
-                    return best_col, best_pval
+                    return best_col, best_pval, mask
 
-        return best_col, best_pval
+        return best_col, best_pval, mask
 
 
-    def _cor_selector(self, X, y, col_idx):
+    def _cor_selector(self, X, y, col_idx, mask):
         """Selects feature most correlated with y using permutation tests with
         a correlation measure
 
@@ -844,6 +2446,9 @@ class CITreeRegressor(CITreeBase, BaseEstimator, RegressorMixin):
         col_idx : list
             Columns of X to examine for feature selection
 
+        mask : FeatureMask
+            Features available in subtree
+
         Returns
         -------
         best_col : int
@@ -852,30 +2457,41 @@ class CITreeRegressor(CITreeBase, BaseEstimator, RegressorMixin):
 
         best_pval : float
             Probability value from permutation test
+
+        mask : FeatureMask
+            Features available in subtree after muting
         """
         # Select random column from start and update
         best_col, best_pval = np.random.choice(col_idx), np.inf
+        if self.prescreen: col_idx = self._prescreen(X, y, col_idx)
+        work = {} if self._workspace is None else \
+            {'work': self._workspace.buffers}
+        constant = constant_columns(X)
 
         # Iterate over columns
         for col in col_idx:
 
             # Mute feature and continue since constant
-            if np.all(X[:, col] == X[0, col]) and len(self.available_features_) > 1:
-                self._mute_feature(col)
+            if constant[col] and mask.n_available > 1:
+                mask = mask.mute(col)
                 if self.verbose: logger("tree", "Constant values, muting feature %d" \
                                         % col)
                 continue
 
-            pval = self._perm_test(x=X[:, col],
-                                   y=y,
-                                   B=self.n_permutations,
-                                   random_state=self.random_state)
+            if self.is_categorical_[col]:
+                pval = self._categorical_test(X[:, col], y)
+            else:
+                pval = self._perm_test(x=X[:, col],
+                                       y=y,
+                                       B=self.n_permutations,
+                                       random_state=self.random_state,
+                                       **work)
 
             # If variable muting
             if self.muting and \
                pval == 1.0 and \
-               self.available_features_.shape[0] > 1:
-                self._mute_feature(col)
+               mask.n_available > 1:
+                mask = mask.mute(col)
                 if self.verbose: logger("tree", "ASL = 1.0, muting feature %d" % col)
 
             if pval < best_pval:
@@ -884,12 +2500,12 @@ class CITreeRegressor(CITreeBase, BaseEstimator, RegressorMixin):
                 # If early stopping
                 if self.early_stopping and best_pval < self.alpha:
                     if self.verbose: logger("tree", "Early stopping")
-                    return best_col, best_pval
+                    return best_col, best_pval, mask
 
-        return best_col, best_pval
+        return best_col, best_pval, mask
 
 
-    def _splitter(self, X, y, n, col):
+    def _splitter(self, X, y, n, col, x=None, rows=None, depth=0):
         """Splits data set into two child nodes based on optimized weighted
         mean squared error
 
@@ -907,6 +2523,16 @@ class CITreeRegressor(CITreeBase, BaseEstimator, RegressorMixin):
         col : list
             Column of X to search for best split
 
+        x : 1d array-like
+            Values to split on instead of X[:, col], for example ranks of
+            categories
+
+        rows : 1d array-like
+            Indices of node samples in the data set of the fit, None if unknown
+
+        depth : int
+            Depth of node
+
         Returns
         -------
         best_impurity : float
@@ -916,10 +2542,12 @@ class CITreeRegressor(CITreeBase, BaseEstimator, RegressorMixin):
             X value associated with splitting of data set into two child nodes
 
         left : tuple
-            Left child node data consisting of two elements: (features, labels)
+            Left child node data consisting of three elements: (features,
+            labels, indices)
 
         right : tuple
-            Right child node data consisting of two elements: (features labels)
+            Right child node data consisting of three elements: (features,
+            labels, indices)
         """
         if self.verbose > 1:
             logger("splitter", "Testing splits on feature %d" % col)
@@ -928,36 +2556,29 @@ class CITreeRegressor(CITreeBase, BaseEstimator, RegressorMixin):
         impurity, threshold = 0.0, None
         left, right         = None, None
 
-        # Call sklearn's optimized implementation of decision tree regressors
-        # to make split using mean squared error
-        base = DecisionTreeRegressor(
-                max_depth=1, min_samples_split=self.min_samples_split
-            ).fit(X[:, col].reshape(-1, 1), y).tree_
-
-        # Make split based on best threshold
-        threshold        = base.threshold[0]
-        idx              = np.where(X[:, col] <= threshold, 1, 0)
-        X_left, y_left   = X[idx==1], y[idx==1]
-        X_right, y_right = X[idx==0], y[idx==0]
-        n_left, n_right  = X_left.shape[0], X_right.shape[0]
+        # Every split between consecutive distinct values is scored on a table
+        # with one row per distinct value, whose codes come from the sort of
+        # the feature cached at the root
+        levels, codes    = self._split_levels(X, col, x=x, rows=rows)
+        best, impurities = table_split_mse(codes, y.astype(float),
+                                            len(levels))
+        if best < 0: return impurity, threshold, left, right
+        threshold = (levels[best] + levels[best+1])/2.
 
         # Skip small splits
+        go_left = codes <= best
+        n_left  = int(go_left.sum())
+        n_right = n - n_left
         if n_left < self.min_samples_split or n_right < self.min_samples_split:
             return impurity, threshold, left, right
 
         # Calculate parent and weighted children impurities
-        if len(base.impurity) == 3:
-            node_impurity  = base.impurity[0]
-            left_impurity  = base.impurity[1]*(n_left/float(n))
-            right_impurity = base.impurity[2]*(n_right/float(n))
-        else:
-            node_impurity  = mse(y)
-            left_impurity  = mse(y_left)*(n_left/float(n))
-            right_impurity = mse(y_right)*(n_right/float(n))
-
+        node_impurity  = impurities[0]
+        left_impurity  = impurities[1]*(n_left/float(n))
+        right_impurity = impurities[2]*(n_right/float(n))
 
         # Define groups and calculate impurity decrease
-        left, right = (X_left, y_left), (X_right, y_right)
+        left, right = self._partition(X, y, rows, go_left, depth)
         impurity    = node_impurity - (left_impurity + right_impurity)
 
         # Update feature importance (mean decrease impurity)
@@ -1002,7 +2623,7 @@ class CITreeRegressor(CITreeBase, BaseEstimator, RegressorMixin):
         return self
 
 
-    def predict(self, X):
+    def predict(self, X, max_depth=None):
         """Predicts labels for feature vectors in X
 
         Parameters
@@ -1010,15 +2631,58 @@ class CITreeRegressor(CITreeBase, BaseEstimator, RegressorMixin):
         X : 2d array-like
             Array of features
 
+        max_depth : int
+            If given, tree is truncated at this depth
+
         Returns
         -------
         y_hat : 1d array-like
             Array of predicted labels
         """
         if self.verbose:
-            logger("test", "Predicting labels for %d samples" % X.shape[0])
+            logger("test", "Predicting labels for %d samples" % len(X))
+
+        return self._predict_value(X, max_depth=max_depth)[:, 0]
+
 
-        return np.array([self.predict_label(sample) for sample in X])
+    def predict_depth_path(self, X, depths):
+        """Predicts labels with tree truncated at each depth in grid using one
+        traversal
+
+        Parameters
+        ----------
+        X : 2d array-like
+            Array of features
+
+        depths : 1d array-like
+            Depths at which to truncate tree
+
+        Returns
+        -------
+        y_hat : 2d array-like
+            Array of predicted labels with shape (n_depths, n_samples)
+        """
+        return self._predict_value_depth_path(X, depths)[:, :, 0]
+
+
+    def predict_path(self, X, alphas):
+        """Predicts labels for each alpha in grid using the tree fit at the
+        loosest alpha. See prune for when this matches a refit
+
+        Parameters
+        ----------
+        X : 2d array-like
+            Array of features
+
+        alphas : 1d array-like
+            Threshold values in (0, alpha used to fit the model]
+
+        Returns
+        -------
+        y_hat : 2d array-like
+            Array of predicted labels with shape (n_alphas, n_samples)
+        """
+        return self._predict_value_path(X, alphas)[:, :, 0]
 
 
 #####################
@@ -1060,7 +2724,26 @@ def stratify_sampled_idx(random_state, y, bayes):
     return idx
 
 
-def stratify_unsampled_idx(random_state, y, bayes):
+def _unsampled_mask(sampled, n):
+    """Mask of indices never drawn in bootstrap sample
+
+    Parameters
+    ----------
+    sampled : 1d array-like
+        Sampled indices
+
+    n : int
+        Sample size
+
+    Returns
+    -------
+    mask : 1d array-like
+        Boolean array that is True for unsampled indices
+    """
+    return np.bincount(sampled, minlength=n) == 0
+
+
+def stratify_unsampled_idx(random_state, y, bayes, sampled=None):
     """Unsampled indices for stratified bootstrap sampling in classification
 
     Parameters
@@ -1074,17 +2757,18 @@ def stratify_unsampled_idx(random_state, y, bayes):
     bayes : bool
         If True, performs Bayesian bootstrap sampling
 
+    sampled : list
+        Output of stratify_sampled_idx. If None, sampled indices are drawn
+        again with random_state
+
     Returns
     -------
     idx : list
         Stratified unsampled indices for each class
     """
-    np.random.seed(random_state)
-    sampled = stratify_sampled_idx(random_state, y, bayes)
-    idx     = []
-    for i, label in enumerate(np.unique(y)):
-        idx.append(np.setdiff1d(np.where(y==label)[0], sampled[i]))
-    return idx
+    if sampled is None: sampled = stratify_sampled_idx(random_state, y, bayes)
+    mask = _unsampled_mask(np.concatenate(sampled), len(y))
+    return [np.where((y==label) & mask)[0] for label in np.unique(y)]
 
 
 def balanced_sampled_idx(random_state, y, bayes, min_class_p):
@@ -1124,7 +2808,7 @@ def balanced_sampled_idx(random_state, y, bayes, min_class_p):
     return idx
 
 
-def balanced_unsampled_idx(random_state, y, bayes, min_class_p):
+def balanced_unsampled_idx(random_state, y, bayes, min_class_p, sampled=None):
     """Unsampled indices for balanced bootstrap sampling in classification
 
     Parameters
@@ -1141,17 +2825,19 @@ def balanced_unsampled_idx(random_state, y, bayes, min_class_p):
     min_class_p : float
         Minimum proportion of class labels
 
+    sampled : list
+        Output of balanced_sampled_idx. If None, sampled indices are drawn
+        again with random_state
+
     Returns
     -------
     idx : list
         Balanced unsampled indices for each class
     """
-    np.random.seed(random_state)
-    sampled = balanced_sampled_idx(random_state, y, bayes, min_class_p)
-    idx     = []
-    for i, label in enumerate(np.unique(y)):
-        idx.append(np.setdiff1d(np.where(y==label)[0], sampled[i]))
-    return idx
+    if sampled is None:
+        sampled = balanced_sampled_idx(random_state, y, bayes, min_class_p)
+    mask = _unsampled_mask(np.concatenate(sampled), len(y))
+    return [np.where((y==label) & mask)[0] for label in np.unique(y)]
 
 
 def normal_sampled_idx(random_state, n, bayes):
@@ -1181,7 +2867,7 @@ def normal_sampled_idx(random_state, n, bayes):
     return np.random.choice(np.arange(n, dtype=int), size=n, replace=True, p=p)
 
 
-def normal_unsampled_idx(random_state, n, bayes):
+def normal_unsampled_idx(random_state, n, bayes, sampled=None):
     """Unsampled indices for bootstrap sampling
 
     Parameters
@@ -1189,23 +2875,64 @@ def normal_unsampled_idx(random_state, n, bayes):
     random_state : int
         Sets seed for random number generator
 
-    y : 1d array-like
-        Array of labels
-
     n : int
         Sample size
 
     bayes : bool
         If True, performs Bayesian bootstrap sampling
 
+    sampled : 1d array-like
+        Output of normal_sampled_idx. If None, sampled indices are drawn again
+        with random_state
+
     Returns
     -------
     idx : list
         Unsampled indices
     """
-    sampled = normal_sampled_idx(random_state, n, bayes)
-    counts  = np.bincount(sampled, minlength=n)
-    return np.arange(n, dtype=int)[counts==0]
+    if sampled is None: sampled = normal_sampled_idx(random_state, n, bayes)
+    return np.where(_unsampled_mask(sampled, n))[0]
+
+
+def _record_inbag(tree, idx, n):
+    """Stores bit-packed in-bag mask of bootstrap sample on tree
+
+    Parameters
+    ----------
+    tree : CITreeBase
+        Fitted conditional inference tree
+
+    idx : 1d array-like
+        Sampled indices
+
+    n : int
+        Sample size
+
+    Returns
+    -------
+    None
+    """
+    tree.inbag_bits_ = np.packbits(~_unsampled_mask(idx, n))
+
+
+def _oob_idx(tree, n):
+    """Out-of-bag indices of tree
+
+    Parameters
+    ----------
+    tree : CITreeBase
+        Fitted conditional inference tree with recorded in-bag mask
+
+    n : int
+        Sample size
+
+    Returns
+    -------
+    idx : 1d array-like
+        Indices not used to fit the tree
+    """
+    inbag = np.unpackbits(tree.inbag_bits_, count=n).astype(bool)
+    return np.where(~inbag)[0]
 
 
 def _parallel_fit_classifier(tree, X, y, n, tree_idx, n_estimators, bootstrap,
@@ -1285,7 +3012,8 @@ def _parallel_fit_classifier(tree, X, y, n, tree_idx, n_estimators, bootstrap,
         # because not all classes may be sampled and when it comes to prediction,
         # the tree models learns a different number of classes across different
         # bootstrap samples
-        tree.fit(X[idx], y[idx], np.unique(y))
+        tree.fit(take_rows(X, idx), y[idx], np.unique(y))
+        _record_inbag(tree, idx, n)
     else:
         tree.fit(X, y)
     
@@ -1347,45 +3075,686 @@ def _parallel_fit_regressor(tree, X, y, n, tree_idx, n_estimators, bootstrap,
         random_state = random_state*(tree_idx+1)
         idx          = normal_sampled_idx(random_state, n, bayes)
 
-        # Train
-        tree.fit(X[idx], y[idx])
-    else:
-        tree.fit(X, y)
-    
-    return tree
+        # Train
+        tree.fit(take_rows(X, idx), y[idx])
+        _record_inbag(tree, idx, n)
+    else:
+        tree.fit(X, y)
+    
+    return tree
+
+
+def _classification_loss(values, y):
+    """Misclassification rate of class probabilities
+
+    Parameters
+    ----------
+    values : 2d array-like
+        Array of class probabilities
+
+    y : 1d array-like
+        Array of class indices
+
+    Returns
+    -------
+    loss : float
+        Fraction of misclassified samples
+    """
+    return np.mean(np.argmax(values, axis=1) != y)
+
+
+def _regression_loss(values, y):
+    """Mean squared error of predictions
+
+    Parameters
+    ----------
+    values : 2d array-like
+        Array of predictions with one column
+
+    y : 1d array-like
+        Array of labels
+
+    Returns
+    -------
+    loss : float
+        Mean squared error
+    """
+    return np.mean((values[:, 0]-y)**2)
+
+
+def _split_indicators(flat, X, rows):
+    """Evaluates every split of a tree once for the given samples, so the cells
+    of any set of conditioning features are read from its columns
+
+    Parameters
+    ----------
+    flat : FlatTree
+        Flattened tree
+
+    X : 2d array-like
+        Array of features
+
+    rows : 1d array-like
+        Indices of samples to evaluate
+
+    Returns
+    -------
+    indicators : 2d array-like
+        Boolean array with one row per sample and one column per split, unique
+        splits on thresholds and every split on categories
+
+    split_cols : 1d array-like
+        Feature of each column of indicators
+    """
+    nodes = np.where(flat.col >= 0)[0]
+    if not nodes.size:
+        return np.zeros((len(rows), 0), dtype=bool), np.zeros(0, dtype=int)
+
+    # Gather only the split features of the samples, once per tree
+    cols   = np.unique(flat.col[nodes])
+    X_rows = X[np.ix_(rows, cols)]
+
+    # Unique splits on thresholds and every split on categories each
+    # contribute a binary indicator
+    numeric    = nodes[~flat.categorical[nodes]]
+    splits     = np.unique(np.column_stack([flat.col[numeric],
+                                            flat.threshold[numeric]]), axis=0)
+    split_cols = [splits[:, 0].astype(int)]
+    indicators = [X_rows[:, np.searchsorted(cols, split_cols[0])] <= splits[:, 1]]
+    for node in nodes[flat.categorical[nodes]]:
+        col = flat.col[node]
+        indicators.append(np.isin(X_rows[:, np.searchsorted(cols, col)],
+                                  flat.categories[node]).reshape(-1, 1))
+        split_cols.append([col])
+    return np.hstack(indicators), np.concatenate(split_cols).astype(int)
+
+
+def _split_cells(indicators, split_cols, cols):
+    """Partitions samples into cells defined by all splits of a tree on the
+    given features
+
+    Parameters
+    ----------
+    indicators : 2d array-like
+        First output of _split_indicators
+
+    split_cols : 1d array-like
+        Second output of _split_indicators
+
+    cols : 1d array-like
+        Features whose splits define the partition
+
+    Returns
+    -------
+    cells : 1d array-like
+        Cell label for each sample
+    """
+    keep = np.isin(split_cols, cols)
+    if not keep.any(): return np.zeros(indicators.shape[0], dtype=int)
+    return np.unique(np.packbits(indicators[:, keep], axis=1), axis=0,
+                     return_inverse=True)[1].ravel()
+
+
+def _grouped_permutation(rng, cells):
+    """Random permutation that only exchanges samples within the same cell
+
+    Parameters
+    ----------
+    rng : RandomState
+        Random number generator
+
+    cells : 1d array-like
+        Cell label for each sample
+
+    Returns
+    -------
+    idx : 1d array-like
+        Permuted sample positions
+    """
+    # Sorting by cell with random tie breaking shuffles positions within each
+    # cell, and both orderings have the same cell boundaries
+    by_cell      = np.argsort(cells, kind='mergesort')
+    idx          = np.empty(len(cells), dtype=int)
+    idx[by_cell] = np.lexsort((rng.rand(len(cells)), cells))
+    return idx
+
+
+def _oob_permutation_importance(tree, X, y, features, n_repeats, seed, loss,
+                                conditioning=None):
+    """Utility function for out-of-bag permutation importance of one tree
+
+    Note: Only samples whose path passes through a split on the permuted
+          feature are routed again, starting at the first such split, and all
+          other samples keep their cached terminal node
+
+    Parameters
+    ----------
+    tree : CITreeBase
+        Fitted conditional inference tree with recorded in-bag mask
+
+    X : 2d array-like
+        Array of features used to fit forest
+
+    y : 1d array-like
+        Array of labels, class indices for classification
+
+    features : 1d array-like
+        Features to permute
+
+    n_repeats : int
+        Number of permutations per feature
+
+    seed : list
+        Seed for random number generator
+
+    loss : function handle
+        Loss function taking node estimates and labels
+
+    conditioning : dict
+        Maps each feature to the features it is conditioned on. If given, a
+        feature is only permuted within cells defined by the splits of the
+        tree on its conditioning features
+
+    Returns
+    -------
+    importances : 1d array-like
+        Increase in out-of-bag loss for each feature
+    """
+    flat         = tree.flat_tree_
+    oob          = _oob_idx(tree, X.shape[0])
+    importances  = np.zeros(len(features))
+    if not oob.size: return importances
+
+    # Cache terminal nodes and samples passing through each node
+    leaves, samples = flat.visits(X, rows=oob)
+    y_oob           = y[oob]
+    base_loss       = loss(flat.value[leaves], y_oob)
+    rng             = np.random.RandomState(seed)
+
+    # Splits are evaluated once per tree and shared by all features
+    if conditioning is not None:
+        indicators, split_cols = _split_indicators(flat, X, oob)
+
+    for i, col in enumerate(features):
+
+        # First split on feature along path of each sample, nodes are stored
+        # in preorder so ancestors are visited before descendants
+        start = np.full(len(oob), -1, dtype=int)
+        for node in np.where(flat.col == col)[0]:
+            pos        = samples[node]
+            start[pos] = np.where(start[pos] == -1, node, start[pos])
+        affected = np.where(start != -1)[0]
+        if not affected.size: continue
+
+        if conditioning is None:
+            cells = np.zeros(len(oob), dtype=int)
+        else:
+            cells = _split_cells(indicators, split_cols, conditioning[col])
+
+        for _ in range(n_repeats):
+            permuted           = X[oob[_grouped_permutation(rng, cells)], col]
+            leaves_p           = leaves.copy()
+            leaves_p[affected] = flat.apply(X, rows=oob[affected],
+                                            start=start[affected],
+                                            replace=(col, permuted[affected]))
+            importances[i] += loss(flat.value[leaves_p], y_oob) - base_loss
+
+    return importances/n_repeats
+
+
+def _accumulate_prediction(predict, X, out, lock):
+    """Utility function to aggregate predictions in parallel
+
+    Parameters
+    ----------
+    predict : function handle
+        Alias to prediction method of class
+
+    X : 2d array-like
+        Array of features
+
+    out : 1d or 2d array-like
+        Array of labels
+
+    lock : threading lock
+        A lock that controls worker access to data structures for aggregating
+        predictions
+
+    Returns
+    -------
+    None
+    """
+    prediction = predict(X)
+    with lock:
+        if len(out) == 1:
+            out[0] += prediction
+        else:
+            for i in range(len(out)): out[i] += prediction[i]
+
+
+class CIForestBase(object):
+    """Base class for conditional inference forests"""
+
+    def _fit_tasks(self, X, y):
+        """Instantiates trees and defines tasks to train them"""
+        raise NotImplementedError("_fit_tasks method not callable from base class")
+
+
+    def _screen(self, X, y, tree_class):
+        """Tests every feature on all samples and restricts the features of
+        all trees to those that survive multiple testing correction
+
+        Parameters
+        ----------
+        X : 2d array-like
+            Array of features
+
+        y : 1d array-like
+            Array of labels
+
+        tree_class : class
+            Tree class whose selector computes the marginal p-values
+
+        Returns
+        -------
+        None
+        """
+        p = X.shape[1]
+        if self.screening is None:
+            self.screening_pvalues_           = None
+            self.available_features_          = np.arange(p)
+            self.params['available_features'] = None
+            return
+
+        tree = tree_class(**dict(self.params, random_state=self.random_state,
+                                 available_features=None))
+        self.screening_pvalues_           = tree.marginal_pvalues(X, y)
+        keep                              = reject_null(self.screening_pvalues_,
+                                                        alpha=self.screening_alpha,
+                                                        method=self.screening)
+        self.available_features_          = np.flatnonzero(keep)
+        self.params['available_features'] = self.available_features_
+        if self.verbose:
+            logger("tree", "Screening kept %d of %d features" % \
+                    (len(self.available_features_), p))
+
+
+    def _update_feature_importances(self, tree):
+        """Adds feature importances of fitted tree to forest feature importances
+
+        Parameters
+        ----------
+        tree : CITreeBase
+            Fitted conditional inference tree
+
+        Returns
+        -------
+        None
+        """
+        self._sum_fi += tree.feature_importances_
+        sum_fi        = np.sum(self._sum_fi)
+        if sum_fi > 0:
+            self.feature_importances_ = self._sum_fi/sum_fi
+        else:
+            self.feature_importances_ = self._sum_fi.copy()
+
+
+    def fit_iter(self, X, y):
+        """Trains forest and yields each tree as soon as it is fitted, so
+        partial forests can be checkpointed, scored or served during training.
+        While training, estimators_ holds the trees fitted so far in order of
+        completion and once all trees are fitted they are sorted by tree index
+
+        Parameters
+        ----------
+        X : 2d array-like
+            Array of features
+
+        y : 1d array-like
+            Array of labels
+
+        Returns
+        -------
+        trees : generator
+            Generator of (tree_idx, tree) tuples in order of completion
+        """
+        if self.verbose:
+            logger("tree", "Training ensemble with %d trees on %d samples" % \
+                    (self.n_estimators, X.shape[0]))
+
+        # Column-major features are shared by the bootstrap samples of all
+        # trees, so trees do not copy them again
+        X           = Dataset(X).X
+        func, tasks = self._fit_tasks(X, y)
+
+        # Train models, keeping forest consistent after each fitted tree
+        self.estimators_          = []
+        self.feature_importances_ = np.zeros(X.shape[1])
+        self._sum_fi              = np.zeros(X.shape[1])
+        fitted                    = {}
+        executor                  = get_executor(self.executor, self.n_jobs)
+        for tree_idx, tree in executor.map_unordered(func, tasks):
+            fitted[tree_idx] = tree
+            self.estimators_.append(tree)
+            self._update_feature_importances(tree)
+            yield tree_idx, tree
+
+        # Restore order of trees
+        self.estimators_ = [fitted[i] for i in sorted(fitted)]
+        if self.oob_score: self._set_oob_score(X, y)
+
+
+    def permutation_importance_oob(self, X, y, n_repeats=1, n_jobs=None,
+                                   random_state=None):
+        """Out-of-bag permutation feature importance. Each feature is permuted
+        among the out-of-bag samples of each tree and the importance is the
+        increase in out-of-bag loss (misclassification rate for
+        classification, mean squared error for regression) averaged over
+        trees. Trees that never split on a feature contribute zero
+
+        Parameters
+        ----------
+        X : 2d array-like
+            Array of features used to fit forest
+
+        y : 1d array-like
+            Array of labels used to fit forest
+
+        n_repeats : int
+            Number of permutations per feature and tree
+
+        n_jobs : int
+            Number of threads over trees and features, defaults to n_jobs of
+            forest
+
+        random_state : int
+            Sets seed for random number generator, defaults to random_state of
+            forest
+
+        Returns
+        -------
+        importances : 1d array-like
+            Permutation importance of each feature
+        """
+        return self._oob_importance(_oob_permutation_importance, X, y,
+                                    n_repeats, n_jobs, random_state)
+
+
+    def conditional_permutation_importance_oob(self, X, y, threshold=.2,
+                                               n_repeats=1, n_jobs=None,
+                                               random_state=None):
+        """Out-of-bag conditional permutation feature importance (Strobl et
+        al., 2008). Each feature is permuted only within cells of the
+        partition that every tree induces on the features correlated with it,
+        so that importance shared with correlated features is not credited to
+        the permuted feature
+
+        Parameters
+        ----------
+        X : 2d array-like
+            Array of features used to fit forest
+
+        y : 1d array-like
+            Array of labels used to fit forest
+
+        threshold : float
+            Features whose absolute Pearson correlation with a feature exceeds
+            threshold are conditioned on
+
+        n_repeats : int
+            Number of permutations per feature and tree
+
+        n_jobs : int
+            Number of threads over trees and features, defaults to n_jobs of
+            forest
+
+        random_state : int
+            Sets seed for random number generator, defaults to random_state of
+            forest
+
+        Returns
+        -------
+        importances : 1d array-like
+            Conditional permutation importance of each feature
+        """
+        if not 0 <= threshold < 1:
+            raise ValueError("threshold (%s) should be in [0, 1)" % threshold)
+
+        # Conditioning features of each feature
+        X = np.asarray(X)
+        with np.errstate(divide='ignore', invalid='ignore'):
+            R = np.fabs(np.corrcoef(X, rowvar=False))
+        R = np.nan_to_num(np.atleast_2d(R))
+        np.fill_diagonal(R, 0)
+        conditioning = dict(
+            (j, np.where(R[j] > threshold)[0]) for j in range(X.shape[1])
+            )
+
+        return self._oob_importance(_oob_permutation_importance, X, y,
+                                    n_repeats, n_jobs, random_state,
+                                    conditioning=conditioning)
+
+
+    def _oob_importance(self, func, X, y, n_repeats, n_jobs, random_state,
+                        **kwargs):
+        """Runs out-of-bag importance function in parallel over trees and
+        blocks of features
+
+        Parameters
+        ----------
+        func : function handle
+            Function computing importances for one tree
+
+        X : 2d array-like
+            Array of features used to fit forest
+
+        y : 1d array-like
+            Array of labels used to fit forest
+
+        n_repeats : int
+            Number of permutations per feature and tree
+
+        n_jobs : int
+            Number of threads
+
+        random_state : int
+            Sets seed for random number generator
+
+        Returns
+        -------
+        importances : 1d array-like
+            Importance of each feature averaged over trees
+        """
+        if not self.bootstrap:
+            raise ValueError("Out-of-bag importances require bootstrap=True")
+        if n_repeats < 1:
+            raise ValueError("n_repeats (%d) should be >= 1" % n_repeats)
+
+        X, y         = np.asarray(X), self._encode_labels(np.asarray(y))
+        n_jobs       = self.n_jobs if n_jobs is None else n_jobs
+        random_state = self.random_state if random_state is None else random_state
+        loss         = self._loss
+
+        # Split features used by each tree into blocks so that there are at
+        # least as many tasks as jobs
+        n_blocks = int(np.ceil(effective_n_jobs(n_jobs)/float(len(self.estimators_))))
+        tasks    = []
+        for tree_idx, tree in enumerate(self.estimators_):
+            used = np.unique(tree.flat_tree_.col[tree.flat_tree_.col >= 0])
+            for block_idx, block in enumerate(np.array_split(used, n_blocks)):
+                if block.size:
+                    tasks.append((tree, block,
+                                  [random_state, tree_idx, block_idx]))
+
+        results = Parallel(n_jobs=n_jobs, backend='threading')(
+            delayed(func)(tree, X, y, block, n_repeats, seed, loss, **kwargs)
+            for tree, block, seed in tasks
+            )
+
+        importances = np.zeros(X.shape[1])
+        for (_, block, _), result in zip(tasks, results):
+            importances[block] += result
+        return importances/len(self.estimators_)
+
+
+    def _oob_values(self, X):
+        """Accumulates out-of-bag node estimates over trees
+
+        Parameters
+        ----------
+        X : 2d array-like
+            Array of features
+
+        Returns
+        -------
+        values : 2d array-like
+            Array of averaged out-of-bag node estimates with shape
+            (n_samples, n_outputs), nan for samples that were never out-of-bag
+
+        valid : 1d array-like
+            Boolean array that is True for samples that were out-of-bag for at
+            least one tree
+        """
+        X        = np.asarray(X)
+        n        = X.shape[0]
+        values   = None
+        n_trees  = np.zeros(n)
+        for tree in self.estimators_:
+            oob   = _oob_idx(tree, n)
+            value = tree._predict_value(X[oob])
+            if values is None: values = np.zeros((n, value.shape[1]))
+            values[oob]  += value
+            n_trees[oob] += 1
+
+        valid = n_trees > 0
+        if not np.all(valid):
+            warnings.warn("%d samples were never out-of-bag, increase "
+                          "n_estimators for reliable out-of-bag estimates" % \
+                          np.sum(~valid))
+        values[~valid]  = np.nan
+        values[valid]  /= n_trees[valid, None]
+        return values, valid
+
+
+    def fit(self, X, y):
+        """Trains forest
+
+        Parameters
+        ----------
+        X : 2d array-like
+            Array of features
+
+        y : 1d array-like
+            Array of labels
+
+        Returns
+        -------
+        self : CIForestBase
+            Instance of CIForestBase class
+        """
+        for _ in self.fit_iter(X, y): pass
+        return self
+
+
+    def prune(self, alpha):
+        """Derives forest for a smaller alpha without refitting by pruning each
+        tree. See CITreeBase.prune for when this matches a refit
+
+        Parameters
+        ----------
+        alpha : float
+            Threshold value in (0, alpha used to fit the model]
+
+        Returns
+        -------
+        forest : CIForestBase
+            Pruned copy of forest
+        """
+        forest                       = copy.copy(self)
+        forest.estimators_           = [tree.prune(alpha) for tree in self.estimators_]
+        forest.alpha                 = float(alpha)
+        forest.params                = dict(self.params, alpha=float(alpha))
+        forest.feature_importances_  = np.zeros(len(self.feature_importances_))
+        forest._sum_fi               = np.zeros(len(self.feature_importances_))
+        for tree in forest.estimators_: forest._update_feature_importances(tree)
+        return forest
+
+
+    def _predict_value_path(self, X, alphas):
+        """Node estimates for each alpha in grid averaged over trees
+
+        Parameters
+        ----------
+        X : 2d array-like
+            Array of features
+
+        alphas : 1d array-like
+            Threshold values for probability values
+
+        Returns
+        -------
+        values : 3d array-like
+            Array of averaged node estimates with shape
+            (n_alphas, n_samples, n_outputs)
+        """
+        values = self.estimators_[0]._predict_value_path(X, alphas)
+        for tree in self.estimators_[1:]:
+            values += tree._predict_value_path(X, alphas)
+        return values/len(self.estimators_)
+
+
+    def _predict_value_depth_path(self, X, depths):
+        """Node estimates for each depth in grid averaged over trees
 
+        Parameters
+        ----------
+        X : 2d array-like
+            Array of features
 
-def _accumulate_prediction(predict, X, out, lock):
-    """Utility function to aggregate predictions in parallel
+        depths : 1d array-like
+            Depths at which to truncate trees
 
-    Parameters
-    ----------
-    predict : function handle
-        Alias to prediction method of class
+        Returns
+        -------
+        values : 3d array-like
+            Array of averaged node estimates with shape
+            (n_depths, n_samples, n_outputs)
+        """
+        values = self.estimators_[0]._predict_value_depth_path(X, depths)
+        for tree in self.estimators_[1:]:
+            values += tree._predict_value_depth_path(X, depths)
+        return values/len(self.estimators_)
 
-    X : 2d array-like
-        Array of features
 
-    out : 1d or 2d array-like
-        Array of labels
+    def _staged_value(self, X, max_depth=None):
+        """Node estimates averaged over the first 1, 2, ..., n_estimators trees
+        using cumulative sums
 
-    lock : threading lock
-        A lock that controls worker access to data structures for aggregating
-        predictions
+        Parameters
+        ----------
+        X : 2d array-like
+            Array of features
 
-    Returns
-    -------
-    None
-    """
-    prediction = predict(X)
-    with lock:
-        if len(out) == 1:
-            out[0] += prediction
-        else:
-            for i in range(len(out)): out[i] += prediction[i]
+        max_depth : int
+            If given, trees are truncated at this depth
+
+        Returns
+        -------
+        values : generator
+            Generator of 2d arrays with shape (n_samples, n_outputs)
+        """
+        X      = np.asarray(X)
+        values = None
+        for i, tree in enumerate(self.estimators_):
+            value = tree._predict_value(X, max_depth=max_depth)
+            if values is None:
+                values = value.copy()
+            else:
+                values += value
+            yield values/(i+1)
 
 
-class CIForestClassifier(BaseEstimator, ClassifierMixin):
+class CIForestClassifier(CIForestBase, BaseEstimator, ClassifierMixin):
     """Conditional forest classifier
 
     Parameters
@@ -1438,27 +3807,99 @@ class CIForestClassifier(BaseEstimator, ClassifierMixin):
 
     random_state : int
         Sets seed for random number generator
+
+    executor : None, BaseExecutor or concurrent.futures.Executor
+        Executor used to train trees. If None, trees are trained with joblib
+        using n_jobs. See executors.py for joblib, concurrent.futures and
+        socket based executors
+
+    oob_score : bool
+        Whether to estimate generalization score with out-of-bag samples during
+        fit. Requires bootstrap=True
+
+    max_test_samples : int
+        Maximum number of samples used by the permutation tests of a node. If a
+        node has more samples, the feature is selected on a random subsample
+        of this size while the split is still found on all samples. None uses
+        all samples
+
+    prescreen : bool
+        Whether to compute the raw association statistic of every candidate
+        feature before permutation testing and test features in descending
+        order of it. With early_stopping, the strongest feature is then usually
+        selected after a single permutation test
+
+    racing : bool
+        Whether to race candidate features. Permutations are run in rounds of
+        doubling size with the same permuted labels for every feature, and
+        features whose p-value confidence interval lies above that of the
+        current leader are dropped, so the remaining permutations are only
+        spent on contenders. Not available with the hybrid selector
+
+    categorical_features : list
+        Integer indices or boolean mask of integer coded categorical features.
+        For classification they are tested with a chi-square test of their
+        contingency table with the labels, asymptotic when every expected
+        count is at least 5 and by permutation otherwise. For regression they
+        are tested by permutation of the multiple correlation of the label
+        with the categories. Splits order categories by the node estimate of
+        each category and send a prefix of them to the left child
+
+    n_fourier : int
+        Number of random Fourier features of each feature used by the hsic
+        selector
+
+    screening : str
+        Multiple testing correction of the screening stage, None to skip it.
+        Before trees are grown, every feature is tested once on all samples
+        with permutations shared by all features, and trees only select among
+        the features that survive 'bh' (Benjamini-Hochberg) or 'bonferroni'
+        correction at screening_alpha
+
+    screening_alpha : float
+        False discovery rate for 'bh' or family-wise error rate for
+        'bonferroni' screening
     """
     def __init__(self, min_samples_split=2, alpha=.05, selector='mc', max_depth=-1,
                  n_estimators=100, max_feats='sqrt', n_permutations=100,
                  early_stopping=True, muting=True, verbose=0, bootstrap=True,
-                 bayes=True, class_weight='balanced', n_jobs=-1, random_state=None):
+                 bayes=True, class_weight='balanced', n_jobs=-1, random_state=None,
+                 executor=None, oob_score=False, max_test_samples=None,
+                 prescreen=False, racing=False, categorical_features=None,
+                 n_fourier=20, screening=None, screening_alpha=.05):
 
         # Error checking
         if alpha <= 0 or alpha > 1:
             raise ValueError("Alpha (%.2f) should be in (0, 1]" % alpha)
-        if selector not in ['mc', 'mi', 'hybrid']:
+        if selector not in ['mc', 'mi', 'kruskal', 'hsic', 'linear', 'hybrid']:
             raise ValueError("%s not a valid selector, valid selectors are " \
-                             "mc, mi, and hybrid")
+                             "mc, mi, kruskal, hsic, linear, and hybrid")
+        if n_fourier < 1:
+            raise ValueError("n_fourier (%s) should be >= 1" % str(n_fourier))
         if n_permutations < 0:
             raise ValueError("n_permutations (%s) should be > 0" % \
                              str(n_permutations))
         if not isinstance(max_feats, int) and max_feats not in ['sqrt', 'log', 'all', -1]:
             raise ValueError("%s not a valid argument for max_feats" % \
                              str(max_feats))
+        if max_test_samples is not None and max_test_samples < 1:
+            raise ValueError("max_test_samples (%s) should be >= 1" % \
+                             str(max_test_samples))
         if n_estimators < 0:
             raise ValueError("n_estimators (%s) must be > 0" % \
                              str(n_estimators))
+        if oob_score and not bootstrap:
+            raise ValueError("Out-of-bag score requires bootstrap=True")
+        if racing and selector in ['hybrid', 'linear']:
+            raise ValueError("racing is not available with the %s selector" % \
+                             selector)
+        if screening not in [None, 'bh', 'bonferroni']:
+            raise ValueError("%s not a valid argument for screening, valid " \
+                             "arguments are None, bh, and bonferroni" % \
+                             str(screening))
+        if screening_alpha <= 0 or screening_alpha > 1:
+            raise ValueError("screening_alpha (%.2f) should be in (0, 1]" % \
+                             screening_alpha)
 
         # Only for classifier model
         if class_weight not in [None, 'balanced', 'stratify']:
@@ -1473,6 +3914,12 @@ class CIForestClassifier(BaseEstimator, ClassifierMixin):
         self.selector          = selector
         self.min_samples_split = max(1, min_samples_split)
         self.n_permutations    = int(n_permutations)
+        self.max_test_samples  = max_test_samples
+        self.prescreen         = prescreen
+        self.racing            = racing
+        self.n_fourier         = int(n_fourier)
+        self.screening         = screening
+        self.screening_alpha   = float(screening_alpha)
         if max_depth == -1:
             self.max_depth = max_depth
         else:
@@ -1487,6 +3934,10 @@ class CIForestClassifier(BaseEstimator, ClassifierMixin):
         self.verbose        = verbose
         self.class_weight   = class_weight
         self.bayes          = bayes
+        self.executor       = executor
+        self.oob_score      = oob_score
+
+        self.categorical_features = categorical_features
 
         if random_state is None:
             self.random_state = np.random.randint(1, 9999)
@@ -1506,11 +3957,17 @@ class CIForestClassifier(BaseEstimator, ClassifierMixin):
             'verbose'           : 0,
             'n_jobs'            : 1,
             'random_state'      : None,
+            'max_test_samples'  : self.max_test_samples,
+            'prescreen'         : self.prescreen,
+            'racing'            : self.racing,
+            'n_fourier'         : self.n_fourier,
+            'categorical_features' : self.categorical_features,
+            'available_features'   : None,
             }
 
 
-    def fit(self, X, y):
-        """Fit conditional forest classifier
+    def _fit_tasks(self, X, y):
+        """Instantiates trees and defines tasks to train them
 
         Parameters
         ----------
@@ -1522,51 +3979,92 @@ class CIForestClassifier(BaseEstimator, ClassifierMixin):
 
         Returns
         -------
-        self : CIForestClassifier
-            Instance of CIForestClassifier
+        func : function handle
+            Function that trains one tree
+
+        tasks : list
+            Arguments to func for each tree
         """
         self.labels_    = np.unique(y)
         self.n_classes_ = len(self.labels_)
-
-        if self.verbose:
-            logger("tree", "Training ensemble with %d trees on %d samples" % \
-                    (self.n_estimators, X.shape[0]))
+        self._screen(X, y, CITreeClassifier)
 
         # Instantiate base tree models
-        self.estimators_ = []
+        trees = []
         for i in range(self.n_estimators):
             self.params['random_state'] = self.random_state*(i+1)
-            self.estimators_.append(CITreeClassifier(**self.params))
+            trees.append(CITreeClassifier(**self.params))
 
         # Define class distribution
         self.class_dist_p = np.array([
                 np.mean(y==label) for label in np.unique(y)
             ])
 
-        # Train models
-        n = X.shape[0]
-        self.estimators_ = \
-            Parallel(n_jobs=self.n_jobs, backend='loky')(
-            delayed(_parallel_fit_classifier)(
-                self.estimators_[i], X, y, n, i, self.n_estimators,
-                self.bootstrap, self.bayes, self.verbose, self.random_state,
-                self.class_weight, np.min(self.class_dist_p)
-                )
+        n     = X.shape[0]
+        tasks = [
+            (trees[i], X, y, n, i, self.n_estimators, self.bootstrap, self.bayes,
+             self.verbose, self.random_state, self.class_weight,
+             np.min(self.class_dist_p))
             for i in range(self.n_estimators)
-            )
+            ]
+        return _parallel_fit_classifier, tasks
 
-        # Accumulate feature importances (mean decrease impurity)
-        self.feature_importances_ = np.sum([
-                tree.feature_importances_ for tree in self.estimators_],
-                axis=0
-            )
-        sum_fi = np.sum(self.feature_importances_)
-        if sum_fi > 0: self.feature_importances_ /= sum_fi
 
+    def _loss(self, values, y):
+        """Misclassification rate used for out-of-bag importances"""
+        return _classification_loss(values, y)
+
+
+    def _encode_labels(self, y):
+        """Maps labels to class indices"""
+        return np.searchsorted(self.labels_, y)
+
+
+    def _set_oob_score(self, X, y):
+        """Computes out-of-bag class probabilities, accuracy and margins
+
+        Parameters
+        ----------
+        X : 2d array-like
+            Array of features
+
+        y : 1d array-like
+            Array of labels
+
+        Returns
+        -------
+        None
+        """
+        proba, valid  = self._oob_values(X)
+        y_idx         = self._encode_labels(y)
+        y_hat         = np.argmax(proba[valid], axis=1)
+        self.oob_decision_function_ = proba
+        self.oob_score_             = np.mean(y_hat == y_idx[valid])
+        self.oob_margin_            = np.full(len(y), np.nan)
+        self.oob_margin_[valid]     = estimate_margin(proba[valid], y_idx[valid])
+
+
+    def fit(self, X, y):
+        """Fit conditional forest classifier
+
+        Parameters
+        ----------
+        X : 2d array-like
+            Array of features
+
+        y : 1d array-like
+            Array of labels
+
+        Returns
+        -------
+        self : CIForestClassifier
+            Instance of CIForestClassifier
+        """
+        super(CIForestClassifier, self).fit(X, y)
         return self
 
 
-    def predict_proba(self, X):
+    def predict_proba(self, X, max_depth=None):
         """Predicts class probabilities for feature vectors X
 
         Parameters
@@ -1574,6 +4072,9 @@ class CIForestClassifier(BaseEstimator, ClassifierMixin):
         X : 2d array-like
             Array of features
 
+        max_depth : int
+            If given, trees are truncated at this depth
+
         Returns
         -------
         class_probs : 2d array-like
@@ -1586,7 +4087,9 @@ class CIForestClassifier(BaseEstimator, ClassifierMixin):
         all_proba = np.zeros((X.shape[0], self.n_classes_), dtype=np.float64)
         lock      = threading.Lock()
         Parallel(n_jobs=self.n_jobs, backend="threading")(
-            delayed(_accumulate_prediction)(e.predict_proba, X, all_proba, lock)
+            delayed(_accumulate_prediction)(
+                partial(e.predict_proba, max_depth=max_depth), X, all_proba, lock
+                )
             for e in self.estimators_)
 
         # Normalize probabilities
@@ -1597,7 +4100,7 @@ class CIForestClassifier(BaseEstimator, ClassifierMixin):
             return all_proba
 
 
-    def predict(self, X):
+    def predict(self, X, max_depth=None):
         """Predicts class labels for feature vectors X
 
         Parameters
@@ -1605,16 +4108,144 @@ class CIForestClassifier(BaseEstimator, ClassifierMixin):
         X : 2d array-like
             Array of features
 
+        max_depth : int
+            If given, trees are truncated at this depth
+
         Returns
         -------
         y : 1d array-like
             Array of predicted classes
         """
-        y_proba = self.predict_proba(X)
+        y_proba = self.predict_proba(X, max_depth=max_depth)
         return np.argmax(y_proba, axis=1)
 
 
-class CIForestRegressor(BaseEstimator, RegressorMixin):
+    def staged_predict_proba(self, X, max_depth=None):
+        """Predicts class probabilities after each of the first 1, 2, ...,
+        n_estimators trees in one pass over the trees
+
+        Parameters
+        ----------
+        X : 2d array-like
+            Array of features
+
+        max_depth : int
+            If given, trees are truncated at this depth
+
+        Returns
+        -------
+        class_probs : generator
+            Generator of 2d arrays of predicted class probabilities
+        """
+        for values in self._staged_value(X, max_depth=max_depth):
+            yield values
+
+
+    def staged_predict(self, X, max_depth=None):
+        """Predicts class labels after each of the first 1, 2, ...,
+        n_estimators trees in one pass over the trees
+
+        Parameters
+        ----------
+        X : 2d array-like
+            Array of features
+
+        max_depth : int
+            If given, trees are truncated at this depth
+
+        Returns
+        -------
+        y : generator
+            Generator of 1d arrays of predicted classes
+        """
+        for values in self._staged_value(X, max_depth=max_depth):
+            yield np.argmax(values, axis=1)
+
+
+    def predict_proba_depth_path(self, X, depths):
+        """Predicts class probabilities with trees truncated at each depth in
+        grid using one traversal per tree
+
+        Parameters
+        ----------
+        X : 2d array-like
+            Array of features
+
+        depths : 1d array-like
+            Depths at which to truncate trees
+
+        Returns
+        -------
+        class_probs : 3d array-like
+            Array of predicted class probabilities with shape
+            (n_depths, n_samples, n_classes)
+        """
+        return self._predict_value_depth_path(X, depths)
+
+
+    def predict_depth_path(self, X, depths):
+        """Predicts class labels with trees truncated at each depth in grid
+        using one traversal per tree
+
+        Parameters
+        ----------
+        X : 2d array-like
+            Array of features
+
+        depths : 1d array-like
+            Depths at which to truncate trees
+
+        Returns
+        -------
+        y : 2d array-like
+            Array of predicted classes with shape (n_depths, n_samples)
+        """
+        return np.argmax(self.predict_proba_depth_path(X, depths), axis=2)
+
+
+    def predict_proba_path(self, X, alphas):
+        """Predicts class probabilities for each alpha in grid using the forest
+        fit at the loosest alpha. See CITreeBase.prune for when this matches a
+        refit
+
+        Parameters
+        ----------
+        X : 2d array-like
+            Array of features
+
+        alphas : 1d array-like
+            Threshold values in (0, alpha used to fit the model]
+
+        Returns
+        -------
+        class_probs : 3d array-like
+            Array of predicted class probabilities with shape
+            (n_alphas, n_samples, n_classes)
+        """
+        return self._predict_value_path(X, alphas)
+
+
+    def predict_path(self, X, alphas):
+        """Predicts class labels for each alpha in grid using the forest fit at
+        the loosest alpha. See CITreeBase.prune for when this matches a refit
+
+        Parameters
+        ----------
+        X : 2d array-like
+            Array of features
+
+        alphas : 1d array-like
+            Threshold values in (0, alpha used to fit the model]
+
+        Returns
+        -------
+        y : 2d array-like
+            Array of predicted classes with shape (n_alphas, n_samples)
+        """
+        return np.argmax(self.predict_proba_path(X, alphas), axis=2)
+
+
+class CIForestRegressor(CIForestBase, BaseEstimator, RegressorMixin):
     """Conditional forest regressor
 
     Parameters
@@ -1662,19 +4293,95 @@ class CIForestRegressor(BaseEstimator, RegressorMixin):
 
     random_state : int
         Sets seed for random number generator
+
+    executor : None, BaseExecutor or concurrent.futures.Executor
+        Executor used to train trees. If None, trees are trained with joblib
+        using n_jobs. See executors.py for joblib, concurrent.futures and
+        socket based executors
+
+    oob_score : bool
+        Whether to estimate generalization score with out-of-bag samples during
+        fit. Requires bootstrap=True
+
+    max_test_samples : int
+        Maximum number of samples used by the permutation tests of a node. If a
+        node has more samples, the feature is selected on a random subsample
+        of this size while the split is still found on all samples. None uses
+        all samples
+
+    prescreen : bool
+        Whether to compute the raw association statistic of every candidate
+        feature before permutation testing and test features in descending
+        order of it. With early_stopping, the strongest feature is then usually
+        selected after a single permutation test
+
+    racing : bool
+        Whether to race candidate features. Permutations are run in rounds of
+        doubling size with the same permuted labels for every feature, and
+        features whose p-value confidence interval lies above that of the
+        current leader are dropped, so the remaining permutations are only
+        spent on contenders. Not available with the hybrid selector
+
+    categorical_features : list
+        Integer indices or boolean mask of integer coded categorical features.
+        For classification they are tested with a chi-square test of their
+        contingency table with the labels, asymptotic when every expected
+        count is at least 5 and by permutation otherwise. For regression they
+        are tested by permutation of the multiple correlation of the label
+        with the categories. Splits order categories by the node estimate of
+        each category and send a prefix of them to the left child
+
+    n_bins : int
+        Number of equal width intervals each array is cut into by the
+        approx_distance selector
+
+    n_fourier : int
+        Number of random Fourier features of each array used by the hsic
+        selector
+
+    screening : str
+        Multiple testing correction of the screening stage, None to skip it.
+        Before trees are grown, every feature is tested once on all samples
+        with permutations shared by all features, and trees only select among
+        the features that survive 'bh' (Benjamini-Hochberg) or 'bonferroni'
+        correction at screening_alpha
+
+    screening_alpha : float
+        False discovery rate for 'bh' or family-wise error rate for
+        'bonferroni' screening
+
+    engine : str
+        Implementation of distance correlation used by the distance and hybrid
+        selectors when a feature does not compress, 'numba' or 'c' for the C
+        library that streams over pairs in O(n) memory
     """
     def __init__(self, min_samples_split=2, alpha=.01, selector='pearson', max_depth=-1,
                  n_estimators=100, max_feats='sqrt', n_permutations=100,
                  early_stopping=True, muting=True, verbose=0, bootstrap=True,
-                 bayes=True, n_jobs=-1, random_state=None):
+                 bayes=True, n_jobs=-1, random_state=None, executor=None,
+                 oob_score=False, max_test_samples=None, prescreen=False,
+                 racing=False, categorical_features=None, n_bins=32,
+                 n_fourier=20, screening=None, screening_alpha=.05,
+                 engine='numba'):
 
         # Error checking
         if alpha <= 0 or alpha > 1:
             raise ValueError("Alpha (%.2f) should be in (0, 1]" % alpha)
 
-        if selector not in ['pearson', 'distance', 'rdc', 'hybrid']:
+        if selector not in ['pearson', 'spearman', 'kendall', 'distance',
+                            'approx_distance', 'rdc', 'xi', 'hsic', 'linear',
+                            'hybrid']:
             raise ValueError("%s not a valid selector, valid selectors are " \
-                             "pearson, distance, rdc, hybrid")
+                             "pearson, spearman, kendall, distance, " \
+                             "approx_distance, rdc, xi, hsic, linear, hybrid")
+
+        if n_bins < 2:
+            raise ValueError("n_bins (%s) should be >= 2" % str(n_bins))
+        if n_fourier < 1:
+            raise ValueError("n_fourier (%s) should be >= 1" % str(n_fourier))
+        if engine not in ['numba', 'c']:
+            raise ValueError("%s not a valid engine, valid engines are numba "
+                             "and c" % str(engine))
 
         if n_permutations < 0:
             raise ValueError("n_permutations (%s) should be > 0" % \
@@ -1682,15 +4389,38 @@ class CIForestRegressor(BaseEstimator, RegressorMixin):
         if not isinstance(max_feats, int) and max_feats not in ['sqrt', 'log', 'all', -1]:
             raise ValueError("%s not a valid argument for max_feats" % \
                              str(max_feats))
+        if max_test_samples is not None and max_test_samples < 1:
+            raise ValueError("max_test_samples (%s) should be >= 1" % \
+                             str(max_test_samples))
         if n_estimators < 0:
             raise ValueError("n_estimators (%s) must be > 0" % \
                              str(n_estimators))
+        if oob_score and not bootstrap:
+            raise ValueError("Out-of-bag score requires bootstrap=True")
+        if racing and selector in ['hybrid', 'linear']:
+            raise ValueError("racing is not available with the %s selector" % \
+                             selector)
+        if screening not in [None, 'bh', 'bonferroni']:
+            raise ValueError("%s not a valid argument for screening, valid " \
+                             "arguments are None, bh, and bonferroni" % \
+                             str(screening))
+        if screening_alpha <= 0 or screening_alpha > 1:
+            raise ValueError("screening_alpha (%.2f) should be in (0, 1]" % \
+                             screening_alpha)
 
         # Define attributes
         self.alpha             = float(alpha)
         self.selector          = selector
         self.min_samples_split = max(1, min_samples_split)
         self.n_permutations    = int(n_permutations)
+        self.max_test_samples  = max_test_samples
+        self.prescreen         = prescreen
+        self.racing            = racing
+        self.n_bins            = int(n_bins)
+        self.n_fourier         = int(n_fourier)
+        self.screening         = screening
+        self.screening_alpha   = float(screening_alpha)
+        self.engine            = engine
         if max_depth == -1:
             self.max_depth = max_depth
         else:
@@ -1703,6 +4433,10 @@ class CIForestRegressor(BaseEstimator, RegressorMixin):
         self.n_jobs         = n_jobs
         self.verbose        = verbose
         self.bayes          = bayes
+        self.executor       = executor
+        self.oob_score      = oob_score
+
+        self.categorical_features = categorical_features
 
         if random_state is None:
             self.random_state = np.random.randint(1, 9999)
@@ -1722,11 +4456,19 @@ class CIForestRegressor(BaseEstimator, RegressorMixin):
             'verbose'           : 0,
             'n_jobs'            : 1,
             'random_state'      : None,
+            'max_test_samples'  : self.max_test_samples,
+            'prescreen'         : self.prescreen,
+            'racing'            : self.racing,
+            'n_bins'            : self.n_bins,
+            'n_fourier'         : self.n_fourier,
+            'engine'            : self.engine,
+            'categorical_features' : self.categorical_features,
+            'available_features'   : None,
             }
 
 
-    def fit(self, X, y):
-        """Fit conditional forest regressor
+    def _fit_tasks(self, X, y):
+        """Instantiates trees and defines tasks to train them
 
         Parameters
         ----------
@@ -1738,42 +4480,80 @@ class CIForestRegressor(BaseEstimator, RegressorMixin):
 
         Returns
         -------
-        self : CIForestRegressor
-            Instance of CIForestRegressor
+        func : function handle
+            Function that trains one tree
+
+        tasks : list
+            Arguments to func for each tree
         """
-        if self.verbose:
-            logger("tree", "Training ensemble with %d trees on %d samples" % \
-                    (self.n_estimators, X.shape[0]))
+        self._screen(X, y, CITreeRegressor)
 
         # Instantiate base tree models
-        self.estimators_ = []
+        trees = []
         for i in range(self.n_estimators):
             self.params['random_state'] = self.random_state*(i+1)
-            self.estimators_.append(CITreeRegressor(**self.params))
-
-        # Train models
-        n = X.shape[0]
-        self.estimators_ = \
-            Parallel(n_jobs=self.n_jobs, backend='loky')(
-            delayed(_parallel_fit_regressor)(
-                self.estimators_[i], X, y, n, i, self.n_estimators,
-                self.bootstrap, self.bayes, self.verbose, self.random_state
-                )
+            trees.append(CITreeRegressor(**self.params))
+
+        n     = X.shape[0]
+        tasks = [
+            (trees[i], X, y, n, i, self.n_estimators, self.bootstrap, self.bayes,
+             self.verbose, self.random_state)
             for i in range(self.n_estimators)
-            )
+            ]
+        return _parallel_fit_regressor, tasks
 
-        # Accumulate feature importances (mean decrease impurity)
-        self.feature_importances_ = np.sum([
-                tree.feature_importances_ for tree in self.estimators_],
-                axis=0
-            )
-        sum_fi = np.sum(self.feature_importances_)
-        if sum_fi > 0: self.feature_importances_ /= sum_fi
 
+    def _loss(self, values, y):
+        """Mean squared error used for out-of-bag importances"""
+        return _regression_loss(values, y)
+
+
+    def _encode_labels(self, y):
+        """Returns labels unchanged"""
+        return y
+
+
+    def _set_oob_score(self, X, y):
+        """Computes out-of-bag predictions and coefficient of determination
+
+        Parameters
+        ----------
+        X : 2d array-like
+            Array of features
+
+        y : 1d array-like
+            Array of labels
+
+        Returns
+        -------
+        None
+        """
+        values, valid        = self._oob_values(X)
+        self.oob_prediction_ = values[:, 0]
+        self.oob_score_      = r2_score(y[valid], self.oob_prediction_[valid])
+
+
+    def fit(self, X, y):
+        """Fit conditional forest regressor
+
+        Parameters
+        ----------
+        X : 2d array-like
+            Array of features
+
+        y : 1d array-like
+            Array of labels
+
+        Returns
+        -------
+        self : CIForestRegressor
+            Instance of CIForestRegressor
+        """
+        super(CIForestRegressor, self).fit(X, y)
         return self
 
 
-    def predict(self, X):
+    def predict(self, X, max_depth=None):
         """Predicts labels for feature vectors X
 
         Parameters
@@ -1781,6 +4561,9 @@ class CIForestRegressor(BaseEstimator, RegressorMixin):
         X : 2d array-like
             Array of features
 
+        max_depth : int
+            If given, trees are truncated at this depth
+
         Returns
         -------
         labels : 1d array-like
@@ -1793,7 +4576,9 @@ class CIForestRegressor(BaseEstimator, RegressorMixin):
         results = np.zeros(X.shape[0], dtype=np.float64)
         lock    = threading.Lock()
         Parallel(n_jobs=self.n_jobs, backend="threading")(
-            delayed(_accumulate_prediction)(e.predict, X, results, lock)
+            delayed(_accumulate_prediction)(
+                partial(e.predict, max_depth=max_depth), X, results, lock
+                )
             for e in self.estimators_)
 
         # Normalize predictions
@@ -1801,4 +4586,65 @@ class CIForestRegressor(BaseEstimator, RegressorMixin):
         if len(results) == 1:
             return results[0]
         else:
-            return results
\ No newline at end of file
+            return results
+
+
+    def predict_path(self, X, alphas):
+        """Predicts labels for each alpha in grid using the forest fit at the
+        loosest alpha. See CITreeBase.prune for when this matches a refit
+
+        Parameters
+        ----------
+        X : 2d array-like
+            Array of features
+
+        alphas : 1d array-like
+            Threshold values in (0, alpha used to fit the model]
+
+        Returns
+        -------
+        y_hat : 2d array-like
+            Array of predicted labels with shape (n_alphas, n_samples)
+        """
+        return self._predict_value_path(X, alphas)[:, :, 0]
+
+
+    def staged_predict(self, X, max_depth=None):
+        """Predicts labels after each of the first 1, 2, ..., n_estimators
+        trees in one pass over the trees
+
+        Parameters
+        ----------
+        X : 2d array-like
+            Array of features
+
+        max_depth : int
+            If given, trees are truncated at this depth
+
+        Returns
+        -------
+        labels : generator
+            Generator of 1d arrays of predicted labels
+        """
+        for values in self._staged_value(X, max_depth=max_depth):
+            yield values[:, 0]
+
+
+    def predict_depth_path(self, X, depths):
+        """Predicts labels with trees truncated at each depth in grid using one
+        traversal per tree
+
+        Parameters
+        ----------
+        X : 2d array-like
+            Array of features
+
+        depths : 1d array-like
+            Depths at which to truncate trees
+
+        Returns
+        -------
+        labels : 2d array-like
+            Array of predicted labels with shape (n_depths, n_samples)
+        """
+        return self._predict_value_depth_path(X, depths)[:, :, 0]
@@ -0,0 +1,475 @@
+from __future__ import absolute_import, division, print_function
+
+from concurrent.futures import as_completed, Executor
+from joblib import delayed, Parallel
+import multiprocessing
+import pickle
+import queue
+import socket
+import struct
+import threading
+import traceback
+
+# Header used to prefix every message sent over a socket with its length
+HEADER = struct.Struct('!Q')
+
+
+##########################
+"""TASK EXECUTION UTILS"""
+##########################
+
+def _indexed_call(func, idx, args):
+    """Calls function and tags result with index of task
+
+    Note: This function can't go locally in a class, because joblib complains
+          that it cannot pickle it when placed there
+
+    Parameters
+    ----------
+    func : function handle
+        Function to call
+
+    idx : int
+        Index of task
+
+    args : tuple
+        Positional arguments for function
+
+    Returns
+    -------
+    result : tuple
+        Two element tuple with index of task and return value of function
+    """
+    return idx, func(*args)
+
+
+def _send_message(sock, obj):
+    """Pickles object and sends it over socket with length header
+
+    Parameters
+    ----------
+    sock : socket
+        Connected socket
+
+    obj : object
+        Picklable object
+
+    Returns
+    -------
+    None
+    """
+    data = pickle.dumps(obj, protocol=pickle.HIGHEST_PROTOCOL)
+    sock.sendall(HEADER.pack(len(data)) + data)
+
+
+def _recv_exactly(sock, size):
+    """Receives exactly size bytes from socket
+
+    Parameters
+    ----------
+    sock : socket
+        Connected socket
+
+    size : int
+        Number of bytes to receive
+
+    Returns
+    -------
+    data : bytes
+        Received bytes, None if connection closed before any data arrived
+    """
+    chunks, remaining = [], size
+    while remaining > 0:
+        chunk = sock.recv(min(remaining, 1 << 20))
+        if not chunk:
+            if remaining == size: return None
+            raise IOError("Connection closed in the middle of a message")
+        chunks.append(chunk)
+        remaining -= len(chunk)
+    return b''.join(chunks)
+
+
+def _recv_message(sock):
+    """Receives and unpickles one message from socket
+
+    Parameters
+    ----------
+    sock : socket
+        Connected socket
+
+    Returns
+    -------
+    obj : object
+        Unpickled object, None if connection was closed
+    """
+    header = _recv_exactly(sock, HEADER.size)
+    if header is None: return None
+    data = _recv_exactly(sock, HEADER.unpack(header)[0])
+    return pickle.loads(data)
+
+
+###############
+"""EXECUTORS"""
+###############
+
+class BaseExecutor(object):
+    """Base class for executors that run tasks and stream back results in
+    the order they finish"""
+
+    def map_unordered(self, func, tasks):
+        """Runs func on each task and yields results as they complete
+
+        Parameters
+        ----------
+        func : function handle
+            Function to call on each task
+
+        tasks : list
+            List of tuples with positional arguments for func
+
+        Returns
+        -------
+        results : generator
+            Generator of (index, result) tuples where index is the position
+            of the task in tasks
+        """
+        raise NotImplementedError("map_unordered method not callable from "
+                                  "base class")
+
+
+class JoblibExecutor(BaseExecutor):
+    """Executor backed by joblib
+
+    Parameters
+    ----------
+    n_jobs : int
+        Number of jobs
+
+    backend : str
+        Joblib backend, for example 'loky', 'threading' or 'multiprocessing'
+    """
+    def __init__(self, n_jobs=-1, backend='loky'):
+        self.n_jobs  = n_jobs
+        self.backend = backend
+
+
+    def map_unordered(self, func, tasks):
+        """Runs func on each task and yields results as they complete
+
+        Parameters
+        ----------
+        func : function handle
+            Function to call on each task
+
+        tasks : list
+            List of tuples with positional arguments for func
+
+        Returns
+        -------
+        results : generator
+            Generator of (index, result) tuples
+        """
+        calls = (delayed(_indexed_call)(func, i, args)
+                 for i, args in enumerate(tasks))
+        try:
+            results = Parallel(n_jobs=self.n_jobs, backend=self.backend,
+                               return_as='generator_unordered')(calls)
+        except TypeError:
+            # Older versions of joblib only return results once all tasks finish
+            results = Parallel(n_jobs=self.n_jobs, backend=self.backend)(calls)
+
+        for idx, result in results:
+            yield idx, result
+
+
+class FuturesExecutor(BaseExecutor):
+    """Executor backed by a concurrent.futures executor
+
+    Parameters
+    ----------
+    executor : concurrent.futures.Executor
+        Instantiated executor, for example ThreadPoolExecutor or
+        ProcessPoolExecutor. The caller is responsible for shutting it down
+    """
+    def __init__(self, executor):
+        if not isinstance(executor, Executor):
+            raise ValueError("%s is not a concurrent.futures.Executor" % \
+                             str(executor))
+        self.executor = executor
+
+
+    def map_unordered(self, func, tasks):
+        """Runs func on each task and yields results as they complete
+
+        Parameters
+        ----------
+        func : function handle
+            Function to call on each task
+
+        tasks : list
+            List of tuples with positional arguments for func
+
+        Returns
+        -------
+        results : generator
+            Generator of (index, result) tuples
+        """
+        futures = dict(
+            (self.executor.submit(func, *args), i) for i, args in enumerate(tasks)
+            )
+        try:
+            for future in as_completed(futures):
+                yield futures[future], future.result()
+        finally:
+            for future in futures: future.cancel()
+
+
+class SocketExecutor(BaseExecutor):
+    """Executor that sends tasks to worker processes over TCP sockets. Workers
+    can live on other hosts and are started with serve_worker
+
+    Note: Tasks and results are pickled, so only connect to workers on a
+          trusted network
+
+    Parameters
+    ----------
+    addresses : list
+        List of (host, port) tuples for each worker. The same address can be
+        repeated to open several connections to one worker
+
+    timeout : float
+        Timeout in seconds for connecting to workers
+    """
+    def __init__(self, addresses, timeout=30.0):
+        if not len(addresses):
+            raise ValueError("At least one worker address is required")
+        self.addresses = [(str(host), int(port)) for host, port in addresses]
+        self.timeout   = timeout
+
+
+    def _worker_loop(self, address, func, tasks, results):
+        """Sends tasks from queue to one worker until queue is empty
+
+        Parameters
+        ----------
+        address : tuple
+            (host, port) of worker
+
+        func : function handle
+            Function to call on each task
+
+        tasks : Queue
+            Queue of (index, args) tuples
+
+        results : Queue
+            Queue receiving (index, status, result) tuples
+
+        Returns
+        -------
+        None
+        """
+        idx = None
+        try:
+            sock = socket.create_connection(address, timeout=self.timeout)
+            sock.settimeout(None)
+            try:
+                while True:
+                    try:
+                        idx, args = tasks.get_nowait()
+                    except queue.Empty:
+                        break
+                    _send_message(sock, (func, args))
+                    reply = _recv_message(sock)
+                    if reply is None:
+                        raise IOError("Worker %s:%d closed connection" % address)
+                    results.put((idx, reply[0], reply[1]))
+                    idx = None
+                _send_message(sock, None)
+            finally:
+                sock.close()
+        except Exception:
+            results.put((idx, 'error', traceback.format_exc()))
+
+
+    def map_unordered(self, func, tasks):
+        """Runs func on each task and yields results as they complete
+
+        Parameters
+        ----------
+        func : function handle
+            Function to call on each task
+
+        tasks : list
+            List of tuples with positional arguments for func
+
+        Returns
+        -------
+        results : generator
+            Generator of (index, result) tuples
+        """
+        pending, results = queue.Queue(), queue.Queue()
+        for i, args in enumerate(tasks): pending.put((i, args))
+
+        # One thread per connection, each pulling tasks until none are left
+        threads = [
+            threading.Thread(target=self._worker_loop,
+                             args=(address, func, pending, results))
+            for address in self.addresses
+            ]
+        for thread in threads:
+            thread.daemon = True
+            thread.start()
+
+        for _ in range(len(tasks)):
+            idx, status, result = results.get()
+            if status == 'error':
+                # Drain remaining tasks so other connections finish quickly
+                while True:
+                    try:
+                        pending.get_nowait()
+                    except queue.Empty:
+                        break
+                raise RuntimeError("Task %s failed on socket worker:\n%s" % \
+                                   (idx, result))
+            yield idx, result
+
+
+def serve_worker(host='127.0.0.1', port=0, ready=None):
+    """Runs a socket worker that executes tasks sent by SocketExecutor
+
+    Note: Tasks are unpickled and executed, so only expose workers on a
+          trusted network
+
+    Parameters
+    ----------
+    host : str
+        Host to bind
+
+    port : int
+        Port to bind, 0 picks a free port
+
+    ready : multiprocessing Connection
+        If given, the bound port is sent through it once the worker listens
+
+    Returns
+    -------
+    None
+    """
+    server = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+    server.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+    server.bind((host, port))
+    server.listen(16)
+    if ready is not None: ready.send(server.getsockname()[1])
+
+    def handle(conn):
+        try:
+            while True:
+                message = _recv_message(conn)
+                if message is None: break
+                func, args = message
+                try:
+                    reply = ('ok', func(*args))
+                except Exception:
+                    reply = ('error', traceback.format_exc())
+                _send_message(conn, reply)
+        finally:
+            conn.close()
+
+    try:
+        while True:
+            conn, _ = server.accept()
+            thread  = threading.Thread(target=handle, args=(conn,))
+            thread.daemon = True
+            thread.start()
+    finally:
+        server.close()
+
+
+class LocalSocketCluster(object):
+    """Local stand-in for a multi-host cluster that starts socket workers as
+    processes on localhost
+
+    Parameters
+    ----------
+    n_workers : int
+        Number of worker processes, -1 uses all cpus
+    """
+    def __init__(self, n_workers=-1):
+        if n_workers == -1: n_workers = multiprocessing.cpu_count()
+        self.n_workers  = max(1, int(n_workers))
+        self.processes_ = []
+        self.addresses  = []
+
+
+    def start(self):
+        """Starts worker processes
+
+        Returns
+        -------
+        self : LocalSocketCluster
+            Instance of LocalSocketCluster class
+        """
+        for _ in range(self.n_workers):
+            parent, child = multiprocessing.Pipe()
+            process = multiprocessing.Process(target=serve_worker,
+                                              args=('127.0.0.1', 0, child))
+            process.daemon = True
+            process.start()
+            self.processes_.append(process)
+            self.addresses.append(('127.0.0.1', parent.recv()))
+        return self
+
+
+    def executor(self):
+        """Creates executor connected to workers
+
+        Returns
+        -------
+        executor : SocketExecutor
+            Executor sending tasks to local workers
+        """
+        if not self.addresses: self.start()
+        return SocketExecutor(self.addresses)
+
+
+    def close(self):
+        """Terminates worker processes"""
+        for process in self.processes_:
+            process.terminate()
+            process.join()
+        self.processes_, self.addresses = [], []
+
+
+    def __enter__(self):
+        return self.start()
+
+
+    def __exit__(self, *args):
+        self.close()
+
+
+def get_executor(executor=None, n_jobs=-1):
+    """Resolves executor argument of forest models
+
+    Parameters
+    ----------
+    executor : None, BaseExecutor or concurrent.futures.Executor
+        If None, uses joblib with the loky backend
+
+    n_jobs : int
+        Number of jobs when executor is None
+
+    Returns
+    -------
+    executor : BaseExecutor
+        Executor with map_unordered method
+    """
+    if executor is None:
+        return JoblibExecutor(n_jobs=n_jobs, backend='loky')
+    elif isinstance(executor, BaseExecutor):
+        return executor
+    elif isinstance(executor, Executor):
+        return FuturesExecutor(executor)
+    else:
+        raise ValueError("%s not a valid executor, use None, a BaseExecutor "
+                         "or a concurrent.futures.Executor" % str(executor))
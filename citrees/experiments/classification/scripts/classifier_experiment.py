@@ -18,7 +18,7 @@ if PATH not in sys.path: sys.path.append(PATH)
 
 from citrees import CITreeClassifier, CIForestClassifier
 from externals.six.moves import range
-from scorers import mc_fast, mi
+from scorers import mc_matrix, mi_matrix
 
 # Constants
 DATA_DIR     = abspath(__file__).split('scripts')[0]
@@ -105,7 +105,7 @@ def calculate_fi(X, y, name, collection=None):
     print("[FI] Multiple correlation")
     try:
         n_classes = len(set(y))
-        fi        = [mc_fast(X[:, j], y, n_classes) for j in range(X.shape[1])]
+        fi        = mc_matrix(X, y, n_classes)
         ranks     = np.argsort(np.nan_to_num(fi))[::-1]
         collection.insert_one({
             "data"    : name,
@@ -122,7 +122,7 @@ def calculate_fi(X, y, name, collection=None):
     # 2. Mutual information
     print("[FI] Mutual information")
     try:
-        fi    = [mi(X[:, j], y) for j in range(X.shape[1])]
+        fi    = mi_matrix(X, y)
         ranks = np.argsort(np.nan_to_num(fi))[::-1]
         collection.insert_one({
             "data"    : name,
@@ -139,15 +139,9 @@ def calculate_fi(X, y, name, collection=None):
     # 3. Hybrid correlation
     print("[FI] Hybrid correlation")
     try:
-        fi, n_classes = [], len(set(y))
-        for j in range(X.shape[1]):
-            multiple = mc_fast(X[:, j], y, n_classes)
-            mutual   = mi(X[:, j], y)
-            if multiple > mutual:
-                fi.append(multiple)
-            else:
-                fi.append(mutual)
-        ranks = np.argsort(np.nan_to_num(fi))[::-1]
+        n_classes = len(set(y))
+        fi        = np.maximum(mc_matrix(X, y, n_classes), mi_matrix(X, y))
+        ranks     = np.argsort(np.nan_to_num(fi))[::-1]
         collection.insert_one({
             "data"    : name,
             "results" : {
@@ -17,7 +17,7 @@ if PATH not in sys.path: sys.path.append(PATH)
 
 from citrees import CIForestRegressor, CITreeRegressor
 from externals.six.moves import range
-from scorers import pcor, py_dcor
+from scorers import dcor_matrix, pcor_matrix
 
 # Constants
 DATA_DIR     = abspath(__file__).split('scripts')[0]
@@ -86,7 +86,7 @@ def calculate_fi(X, y, name, collection=None):
     # 1. Pearson correlation
     print("[FI] Pearson correlation")
     try:
-        fi    = np.fabs([pcor(X[:, j], y) for j in range(X.shape[1])])
+        fi    = np.fabs(pcor_matrix(X, y))
         ranks = np.argsort(np.nan_to_num(fi))[::-1]
         collection.insert_one({
             "data"    : name,
@@ -103,7 +103,7 @@ def calculate_fi(X, y, name, collection=None):
     # 2. Distance correlation
     print("[FI] Distance correlation")
     try:
-        fi    = [py_dcor(X[:, j], y) for j in range(X.shape[1])]
+        fi    = dcor_matrix(X, y)
         ranks = np.argsort(np.nan_to_num(fi))[::-1]
         collection.insert_one({
             "data"    : name,
@@ -120,14 +120,7 @@ def calculate_fi(X, y, name, collection=None):
     # 3. Hybrid correlation
     print("[FI] Hybrid correlation")
     try:
-        fi = []
-        for j in range(X.shape[1]):
-            pearson  = np.fabs(pcor(X[:, j], y))
-            distance = py_dcor(X[:, j], y)
-            if pearson > distance:
-                fi.append(pearson)
-            else:
-                fi.append(distance)
+        fi    = np.maximum(np.fabs(pcor_matrix(X, y)), dcor_matrix(X, y))
         ranks = np.argsort(np.nan_to_num(fi))[::-1]
         collection.insert_one({
             "data"    : name,
@@ -3,8 +3,16 @@ from __future__ import absolute_import, division, print_function
 from joblib import delayed, Parallel
 from numba import njit
 import numpy as np
+from scipy.stats import chi2, norm, pearson3, rankdata as rank
+import zlib
 
-from scorers import mc_fast, mi, pcor, py_dcor, rdc, rdc_fast
+from scorers import (_grouped_dcor, bin_codes, binned_dcor, c_dcor,
+                     category_codes, chi2_stat, contingency_table,
+                     grouped_dcor_terms, kendall_tau, kruskal_stat,
+                     label_features, linear_statistic, mc_fast, mi, pcor,
+                     py_dcor, rdc, rdc_fast, rff_features, xi_from_ranks,
+                     xi_order, xi_ranks)
+from utils import NULL_CACHE
 
 
 ##########################
@@ -12,7 +20,41 @@ from scorers import mc_fast, mi, pcor, py_dcor, rdc, rdc_fast
 ##########################
 
 @njit(cache=True, nogil=True)
-def permutation_test_pcor(x, y, B=100, random_state=None):
+def _permutation_buffers(y, B, work=None):
+    """Float copy of labels to shuffle and array for statistics of
+    permutations, as views into the buffers of a Workspace when given and
+    large enough, otherwise newly allocated
+
+    Parameters
+    ----------
+    y : 1d array-like
+        Array of n labels
+
+    B : int
+        Number of permutations
+
+    work : tuple
+        Buffers of a Workspace, None to allocate
+
+    Returns
+    -------
+    y_ : 1d array-like
+        Copy of y
+
+    theta_p : 1d array-like
+        Array of B elements for statistics of permutations
+    """
+    n = y.shape[0]
+    if work is None or work[0].shape[1] < n or work[1].shape[0] < B:
+        return y.astype(np.float64), np.zeros(B)
+    y_    = work[0][0, :n]
+    y_[:] = y
+    return y_, work[1][:B]
+
+
+@njit(cache=True, nogil=True)
+def permutation_test_pcor(x, y, B=100, random_state=None, theta=None,
+                          work=None):
     """Permutation test for Pearson correlation
 
     Parameters
@@ -29,6 +71,13 @@ def permutation_test_pcor(x, y, B=100, random_state=None):
     random_state : int
         Sets seed for random number generator
 
+    theta : float
+        Observed statistic if already computed, otherwise it is computed from
+        x and y
+
+    work : tuple
+        Buffers of a Workspace reused for the permutations, None to allocate
+
     Returns
     -------
     p : float
@@ -36,12 +85,11 @@ def permutation_test_pcor(x, y, B=100, random_state=None):
     """
     np.random.seed(random_state)
 
-    # Estimate correlation from original data
-    theta = np.fabs(pcor(x, y))
+    # Estimate correlation from original data unless already computed
+    if theta is None: theta = np.fabs(pcor(x, y))
 
     # Permutations
-    y_      = y.copy()
-    theta_p = np.zeros(B)
+    y_, theta_p = _permutation_buffers(y, B, work)
     for i in range(B):
         np.random.shuffle(y_)
         theta_p[i] = pcor(x, y_) # Call jitted function directly
@@ -50,9 +98,39 @@ def permutation_test_pcor(x, y, B=100, random_state=None):
     return np.mean(np.fabs(theta_p) >= theta)
 
 
+def _approximate_pvalue(theta, theta_p):
+    """Tail probability of statistic under Pearson type III distribution
+    matched on mean, variance and skewness of permuted statistics
+
+    Parameters
+    ----------
+    theta : float
+        Observed statistic
+
+    theta_p : 1d array-like
+        Statistics of permutations
+
+    Returns
+    -------
+    p : float
+        Approximate achieved significance level
+    """
+    mu, sd = theta_p.mean(), theta_p.std()
+    if sd == 0: return float(np.mean(theta_p >= theta))
+    skew = np.mean(((theta_p - mu)/sd)**3)
+    return float(pearson3.sf(theta, skew, loc=mu, scale=sd))
+
+
+def _check_method(method):
+    """Raises error for invalid method of permutation tests"""
+    if method not in ['permutation', 'approximate']:
+        raise ValueError("%s not a valid method, valid methods are " \
+                         "permutation and approximate" % str(method))
+
+
 @njit(cache=True, nogil=True)
-def permutation_test_dcor(x, y, B=100, random_state=None):
-    """Permutation test for distance correlation
+def _dcor_null(x, y, B=100, random_state=None, theta=None, work=None):
+    """Distance correlations of permutations compiled with Numba
 
     Parameters
     ----------
@@ -68,30 +146,45 @@ def permutation_test_dcor(x, y, B=100, random_state=None):
     random_state : int
         Sets seed for random number generator
 
+    theta : float
+        Observed statistic if already computed, otherwise it is computed from
+        x and y
+
+    work : tuple
+        Buffers of a Workspace reused for the permutations, None to allocate
+
     Returns
     -------
-    p : float
-        Achieved significance level
+    theta : float
+        Observed statistic
+
+    theta_p : 1d array-like
+        Statistics of permutations, a view into work if given
     """
     np.random.seed(random_state)
 
-    # Estimate correlation from original data
-    theta = np.fabs(py_dcor(x, y))
+    # Row sums of distance matrices are reused by every permutation
+    n = x.shape[0]
+    if work is None or work[0].shape[1] < n:
+        Ed = np.zeros((2, n))
+    else:
+        Ed = work[0][1:]
+
+    # Estimate correlation from original data unless already computed
+    if theta is None: theta = np.fabs(py_dcor(x, y, Ed[0], Ed[1]))
 
     # Permutations
-    y_      = y.copy()
-    theta_p = np.zeros(B)
+    y_, theta_p = _permutation_buffers(y, B, work)
     for i in range(B):
         np.random.shuffle(y_)
-        theta_p[i] = py_dcor(x, y_) # Call jitted function directly
+        theta_p[i] = np.fabs(py_dcor(x, y_, Ed[0], Ed[1]))
 
-    # Achieved significance level
-    return np.mean(np.fabs(theta_p) >= theta)
+    return theta, theta_p
 
 
-@njit(cache=True, nogil=True)
-def permutation_test_rdc(x, y, B=100, random_state=None):
-    """Permutation test for randomized dependence coefficient
+def permutation_test_dcor(x, y, B=100, random_state=None, theta=None,
+                          engine='numba', method='permutation', work=None):
+    """Permutation test for distance correlation
 
     Parameters
     ----------
@@ -107,6 +200,75 @@ def permutation_test_rdc(x, y, B=100, random_state=None):
     random_state : int
         Sets seed for random number generator
 
+    theta : float
+        Observed statistic if already computed, otherwise it is computed from
+        x and y
+
+    engine : str
+        Implementation of distance correlation, 'numba' for py_dcor or 'c' for
+        c_dcor. The C library streams over pairs in O(n) memory and uses
+        OpenMP threads when compiled with it
+
+    method : str
+        'permutation' for the fraction of permutations at least as large as
+        the observed statistic, 'approximate' for the tail of a Pearson type
+        III distribution fit to their moments, which resolves small p-values
+        from tens of permutations
+
+    work : tuple
+        Buffers of a Workspace reused by the numba engine, None to allocate
+
+    Returns
+    -------
+    p : float
+        Achieved significance level
+    """
+    _check_method(method)
+    if engine == 'numba':
+        theta, theta_p = _dcor_null(x, y, B, random_state, theta, work)
+    elif engine == 'c':
+        np.random.seed(random_state)
+        x = np.ascontiguousarray(x, dtype=np.float64)
+
+        # Estimate correlation from original data unless already computed
+        if theta is None: theta = np.fabs(c_dcor(x, y))
+
+        # Permutations
+        y_      = np.array(y, dtype=np.float64)
+        theta_p = np.zeros(B)
+        for i in range(B):
+            np.random.shuffle(y_)
+            theta_p[i] = np.fabs(c_dcor(x, y_))
+    else:
+        raise ValueError("%s not a valid engine, valid engines are numba and "
+                         "c" % str(engine))
+
+    # Achieved significance level
+    if method == 'approximate': return _approximate_pvalue(theta, theta_p)
+    return np.mean(theta_p >= theta)
+
+
+@njit(cache=True, nogil=True)
+def _permutation_test_grouped_dcor(codes, D, A, ys, by, consts, B=100,
+                                   random_state=None, theta=None):
+    """Permutation test for distance correlation between grouped and
+    continuous arrays
+
+    Parameters
+    ----------
+    codes, D, A, ys, by, consts : array-like
+        Terms precomputed by grouped_dcor_terms
+
+    B : int
+        Number of permutations
+
+    random_state : int
+        Sets seed for random number generator
+
+    theta : float
+        Observed statistic if already computed, otherwise it is computed from
+        the terms
+
     Returns
     -------
     p : float
@@ -114,22 +276,27 @@ def permutation_test_rdc(x, y, B=100, random_state=None):
     """
     np.random.seed(random_state)
 
-    # Estimate correlation from original data
-    theta = np.fabs(rdc_fast(x, y))
+    # Estimate correlation from original data unless already computed
+    if theta is None: theta = _grouped_dcor(codes, D, A, ys, by, consts)
 
-    # Permutations
-    y_      = y.copy()
+    # Permutations, only the groups are shuffled against the sorted array so
+    # every other term stays fixed
+    codes_  = codes.copy()
     theta_p = np.zeros(B)
     for i in range(B):
-        np.random.shuffle(y_)
-        theta_p[i] = rdc_fast(x, y_) # Call jitted function directly
+        np.random.shuffle(codes_)
+        theta_p[i] = _grouped_dcor(codes_, D, A, ys, by, consts)
 
     # Achieved significance level
     return np.mean(np.fabs(theta_p) >= theta)
 
 
-def _permutation(x, y, func=None, **kwargs):
-    """Helper function to perform arbitrary permutation test
+def permutation_test_compressed_dcor(x, y, B=100, random_state=None,
+                                     theta=None, max_ratio=.25, work=None,
+                                     engine='numba'):
+    """Permutation test for distance correlation that compresses ties. If x
+    or y has at most max_ratio*n distinct values, each permutation costs
+    O(n*k) time for k distinct values, otherwise permutation_test_dcor is used
 
     Parameters
     ----------
@@ -139,24 +306,45 @@ def _permutation(x, y, func=None, **kwargs):
     y : 1d array-like
         Array of n elements
 
-    func : function handle
-        Function to perform on permuted data
+    B : int
+        Number of permutations
+
+    random_state : int
+        Sets seed for random number generator
+
+    theta : float
+        Observed statistic if already computed with compressed_dcor, otherwise
+        it is computed from x and y
+
+    max_ratio : float
+        Largest ratio of distinct values to n for which an array is compressed
+
+    work : tuple
+        Buffers of a Workspace reused when the arrays are not compressed, None
+        to allocate
+
+    engine : str
+        Implementation of distance correlation when the arrays are not
+        compressed, see permutation_test_dcor
 
     Returns
     -------
-    value : float
-        Return value of function handle
+    p : float
+        Achieved significance level
     """
-    np.random.shuffle(y)
-    try:
-        return func(x, y, **kwargs)
-    except:
-        return 0.0
+    terms = grouped_dcor_terms(x, y, max_ratio)
+    if terms is None:
+        return permutation_test_dcor(x, y, B=B, random_state=random_state,
+                                     theta=theta, engine=engine, work=work)
+    return _permutation_test_grouped_dcor(*terms, B=B,
+                                          random_state=random_state,
+                                          theta=theta)
 
 
-def permutation_test_dcor_parallel(x, y, B=100, n_jobs=-1,
-                                   random_state=None):
-    """Parallel implementation of permutation test for distance correlation
+@njit(cache=True, nogil=True)
+def permutation_test_approx_wdcor(x, y, B=100, n_bins=32, random_state=None,
+                                  theta=None):
+    """Permutation test for approximate distance correlation of binned arrays
 
     Parameters
     ----------
@@ -169,42 +357,46 @@ def permutation_test_dcor_parallel(x, y, B=100, n_jobs=-1,
     B : int
         Number of permutations
 
-    n_jobs : int
-        Number of cpus to use for processing
+    n_bins : int
+        Number of intervals for each array
 
     random_state : int
         Sets seed for random number generator
 
+    theta : float
+        Observed statistic if already computed, otherwise it is computed from
+        x and y
+
     Returns
     -------
     p : float
         Achieved significance level
     """
-    n = x.shape[0]
     np.random.seed(random_state)
 
-    # Define function handle
-    # func = py_dcor if n < 500 else c_dcor
-    func = py_dcor
+    # Bin once, permutations only shuffle the interval of each element of y
+    cx, vx = bin_codes(x, n_bins)
+    cy, vy = bin_codes(y, n_bins)
+    kx, ky = len(vx), len(vy)
 
-    # Estimate correlation from original data
-    theta = np.fabs(func(x, y))
+    # Estimate correlation from original data unless already computed
+    if theta is None:
+        theta = binned_dcor(contingency_table(cx, cy, kx, ky), vx, vy)
 
     # Permutations
-    y_ = y.copy()
-    theta_p = [
-        Parallel(n_jobs=n_jobs, backend='threading')(
-                delayed(_permutation)(x, y_, func) for i in range(B)
-            )
-        ]
+    cy_     = cy.copy()
+    theta_p = np.zeros(B)
+    for i in range(B):
+        np.random.shuffle(cy_)
+        theta_p[i] = binned_dcor(contingency_table(cx, cy_, kx, ky), vx, vy)
 
     # Achieved significance level
-    return np.mean(np.fabs(theta_p) >= theta)
+    return np.mean(theta_p >= theta)
 
 
-def permutation_test_rdc_parallel(x, y, B=100, n_jobs=-1, k=10, random_state=None):
-    """Parallel implementation of permutation test for randomized dependence
-    coefficient
+@njit(cache=True, nogil=True)
+def _rdc_null(x, y, B=100, random_state=None, theta=None):
+    """Randomized dependence coefficients of permutations compiled with Numba
 
     Parameters
     ----------
@@ -217,52 +409,39 @@ def permutation_test_rdc_parallel(x, y, B=100, n_jobs=-1, k=10, random_state=Non
     B : int
         Number of permutations
 
-    n_jobs : int
-        Number of cpus to use for processing
-
-    k : int
-        Number of random projections for cca
-
     random_state : int
         Sets seed for random number generator
 
+    theta : float
+        Observed statistic if already computed, otherwise it is computed from
+        x and y
+
     Returns
     -------
-    p : float
-        Achieved significance level
+    theta : float
+        Observed statistic
+
+    theta_p : 1d array-like
+        Statistics of permutations
     """
     np.random.seed(random_state)
-    func   = rdc
-    kwargs = {'k': k}
 
-    # Estimate correlation from original data
-    theta = np.fabs(rdc(x, y, **kwargs))
+    # Estimate correlation from original data unless already computed
+    if theta is None: theta = np.fabs(rdc_fast(x, y))
 
     # Permutations
-    y_ = y.copy()
-    if n_jobs == 1:
-        theta_p = np.zeros(B)
-        for i in range(B):
-            theta_p[i] = _permutation(x, y_, func, **kwargs)
-    else:
-        theta_p = [
-            Parallel(n_jobs=n_jobs, backend='threading')(
-                    delayed(_permutation)(x, y_, func, **kwargs)
-                    for i in range(B)
-                )
-            ]
-
-    # Achieved significance level
-    return np.mean(np.fabs(theta_p) >= theta)
+    y_      = y.copy()
+    theta_p = np.zeros(B)
+    for i in range(B):
+        np.random.shuffle(y_)
+        theta_p[i] = rdc_fast(x, y_) # Call jitted function directly
 
+    return theta, np.fabs(theta_p)
 
-########################
-"""DISCRETE SELECTORS"""
-########################
 
-@njit(cache=True, nogil=True, fastmath=True)
-def permutation_test_mc(x, y, B=100, n_classes=None, random_state=None):
-    """Permutation test for multiple correlation
+def permutation_test_rdc(x, y, B=100, random_state=None, theta=None,
+                         method='permutation'):
+    """Permutation test for randomized dependence coefficient
 
     Parameters
     ----------
@@ -272,8 +451,49 @@ def permutation_test_mc(x, y, B=100, n_classes=None, random_state=None):
     y : 1d array-like
         Array of n elements
 
-    n_classes : int
-        Number of classes
+    B : int
+        Number of permutations
+
+    random_state : int
+        Sets seed for random number generator
+
+    theta : float
+        Observed statistic if already computed, otherwise it is computed from
+        x and y
+
+    method : str
+        'permutation' for the fraction of permutations at least as large as
+        the observed statistic, 'approximate' for the tail of a Pearson type
+        III distribution fit to their moments
+
+    Returns
+    -------
+    p : float
+        Achieved significance level
+    """
+    _check_method(method)
+    theta, theta_p = _rdc_null(x, y, B, random_state, theta)
+
+    # Achieved significance level
+    if method == 'approximate': return _approximate_pvalue(theta, theta_p)
+    return np.mean(theta_p >= theta)
+
+
+@njit(cache=True, nogil=True)
+def permutation_test_xi(order, r, l, B=100, random_state=None, theta=None):
+    """Permutation test for Chatterjee's xi correlation. Permuting y permutes
+    its ranks, so each permutation costs O(n) after one sort
+
+    Parameters
+    ----------
+    order : 1d array-like
+        Indices that sort x, ties broken at random
+
+    r : 1d array-like
+        First output of xi_ranks of y
+
+    l : 1d array-like
+        Second output of xi_ranks of y
 
     B : int
         Number of permutations
@@ -281,6 +501,10 @@ def permutation_test_mc(x, y, B=100, n_classes=None, random_state=None):
     random_state : int
         Sets seed for random number generator
 
+    theta : float
+        Observed statistic if already computed, otherwise it is computed from
+        order and ranks
+
     Returns
     -------
     p : float
@@ -288,22 +512,27 @@ def permutation_test_mc(x, y, B=100, n_classes=None, random_state=None):
     """
     np.random.seed(random_state)
 
-    # Estimate correlation from original data
-    theta = mc_fast(x, y, n_classes)
+    # Estimate correlation from original data unless already computed
+    if theta is None: theta = xi_from_ranks(order, r, l)
 
     # Permutations
-    y_      = y.copy()
+    perm    = np.arange(r.shape[0])
     theta_p = np.zeros(B)
     for i in range(B):
-        np.random.shuffle(y_)
-        theta_p[i] = mc_fast(x, y_, n_classes) # Call jitted function directly
+        np.random.shuffle(perm)
+        theta_p[i] = xi_from_ranks(order, r[perm], l[perm])
 
     # Achieved significance level
     return np.mean(theta_p >= theta)
 
 
-def permutation_test_mi(x, y, B=100, random_state=None, **kwargs):
-    """Permutation test for mutual information
+def xi_test(x, y, B=100, random_state=None, min_asymptotic=50):
+    """Test for Chatterjee's xi correlation. Uses the asymptotic normal null
+    distribution, with the variance corrected for ties in y, when there are
+    at least min_asymptotic elements and a permutation test otherwise
+
+    NOTE: Variance ported from R function xicor at:
+        https://github.com/cran/XICOR/blob/master/R/calculateXI.R
 
     Parameters
     ----------
@@ -313,8 +542,55 @@ def permutation_test_mi(x, y, B=100, random_state=None, **kwargs):
     y : 1d array-like
         Array of n elements
 
-    n_classes : int
-        Number of classes
+    B : int
+        Number of permutations for small samples
+
+    random_state : int
+        Sets seed for random number generator
+
+    min_asymptotic : int
+        Smallest sample size for which the asymptotic test is used
+
+    Returns
+    -------
+    p : float
+        Achieved significance level
+    """
+    n     = x.shape[0]
+    r, l  = xi_ranks(y)
+    order = xi_order(x, random_state)
+    theta = xi_from_ranks(order, r, l)
+    if np.all(r == n): return 1.0
+
+    if n < min_asymptotic:
+        return permutation_test_xi(order, r, l, B=B, random_state=random_state,
+                                   theta=theta)
+
+    # Variance of sqrt(n)*xi under independence
+    qfr  = np.sort(r/n)
+    gr   = l/n
+    ind  = np.arange(1, n+1)
+    ind2 = 2*n - 2*ind + 1
+    ai   = np.mean(ind2*qfr*qfr)/n
+    ci   = np.mean(ind2*qfr)/n
+    m    = (np.cumsum(qfr) + (n - ind)*qfr)/n
+    b    = np.mean(m*m)
+    cu   = np.mean(gr*(1 - gr))
+    v    = (ai - 2*b + ci*ci)/(cu*cu)
+    return norm.sf(np.sqrt(n)*theta/np.sqrt(v))
+
+
+@njit(cache=True, nogil=True)
+def permutation_test_kendall(x, y, B=100, random_state=None, theta=None):
+    """Permutation test for Kendall tau-b
+
+    Parameters
+    ----------
+    x : 1d array-like
+        Array of n elements
+
+    y : 1d array-like
+        Array of n elements
 
     B : int
         Number of permutations
@@ -322,6 +598,10 @@ def permutation_test_mi(x, y, B=100, random_state=None, **kwargs):
     random_state : int
         Sets seed for random number generator
 
+    theta : float
+        Observed statistic if already computed, otherwise it is computed from
+        x and y
+
     Returns
     -------
     p : float
@@ -329,15 +609,744 @@ def permutation_test_mi(x, y, B=100, random_state=None, **kwargs):
     """
     np.random.seed(random_state)
 
-    # Estimate correlation from original data
-    theta = mi(x, y)
+    # Estimate correlation from original data unless already computed
+    if theta is None: theta = np.fabs(kendall_tau(x, y))
 
     # Permutations
     y_      = y.copy()
     theta_p = np.zeros(B)
     for i in range(B):
         np.random.shuffle(y_)
-        theta_p[i] = mi(x, y_)
+        theta_p[i] = kendall_tau(x, y_) # Call jitted function directly
 
     # Achieved significance level
-    return np.mean(theta_p >= theta)
+    return np.mean(np.fabs(theta_p) >= theta)
+
+
+def _tie_sums(a):
+    """Sums over tie groups of array used by variance of Kendall tau"""
+    t = np.unique(a, return_counts=True)[1].astype(float)
+    t = t[t > 1]
+    return np.sum(t*(t-1)/2), np.sum(t*(t-1)*(t-2)), np.sum(t*(t-1)*(2*t+5))
+
+
+def kendall_test(x, y, B=100, random_state=None, min_asymptotic=50):
+    """Test for Kendall tau-b. Uses the normal approximation of the null
+    distribution, with the variance corrected for ties, when there are at
+    least min_asymptotic elements and a permutation test otherwise
+
+    Parameters
+    ----------
+    x : 1d array-like
+        Array of n elements
+
+    y : 1d array-like
+        Array of n elements
+
+    B : int
+        Number of permutations for small samples
+
+    random_state : int
+        Sets seed for random number generator
+
+    min_asymptotic : int
+        Smallest sample size for which the asymptotic test is used
+
+    Returns
+    -------
+    p : float
+        Achieved significance level
+    """
+    n   = x.shape[0]
+    tau = kendall_tau(x, y)
+    if tau == 0: return 1.0
+
+    if n < min_asymptotic:
+        return permutation_test_kendall(x, y, B=B, random_state=random_state,
+                                        theta=np.fabs(tau))
+
+    # Number of concordant minus discordant pairs and its null variance
+    n0         = n*(n-1)/2.
+    xt, x0, x1 = _tie_sums(x)
+    yt, y0, y1 = _tie_sums(y)
+    s          = tau*np.sqrt((n0 - xt)*(n0 - yt))
+    var        = (n*(n-1)*(2*n+5) - x1 - y1)/18. + \
+                 2*xt*yt/(n*(n-1)) + x0*y0/(9.*n*(n-1)*(n-2))
+    return 2*norm.sf(np.fabs(s)/np.sqrt(var))
+
+
+def _permutation(x, y, func=None, **kwargs):
+    """Helper function to perform arbitrary permutation test
+
+    Parameters
+    ----------
+    x : 1d array-like
+        Array of n elements
+
+    y : 1d array-like
+        Array of n elements
+
+    func : function handle
+        Function to perform on permuted data
+
+    Returns
+    -------
+    value : float
+        Return value of function handle
+    """
+    np.random.shuffle(y)
+    try:
+        return func(x, y, **kwargs)
+    except:
+        return 0.0
+
+
+def permutation_test_dcor_parallel(x, y, B=100, n_jobs=-1,
+                                   random_state=None):
+    """Parallel implementation of permutation test for distance correlation
+
+    Parameters
+    ----------
+    x : 1d array-like
+        Array of n elements
+
+    y : 1d array-like
+        Array of n elements
+
+    B : int
+        Number of permutations
+
+    n_jobs : int
+        Number of cpus to use for processing
+
+    random_state : int
+        Sets seed for random number generator
+
+    Returns
+    -------
+    p : float
+        Achieved significance level
+    """
+    n = x.shape[0]
+    np.random.seed(random_state)
+
+    # Define function handle
+    # func = py_dcor if n < 500 else c_dcor
+    func = py_dcor
+
+    # Estimate correlation from original data
+    theta = np.fabs(func(x, y))
+
+    # Permutations
+    y_ = y.copy()
+    theta_p = [
+        Parallel(n_jobs=n_jobs, backend='threading')(
+                delayed(_permutation)(x, y_, func) for i in range(B)
+            )
+        ]
+
+    # Achieved significance level
+    return np.mean(np.fabs(theta_p) >= theta)
+
+
+def permutation_test_rdc_parallel(x, y, B=100, n_jobs=-1, k=10, random_state=None):
+    """Parallel implementation of permutation test for randomized dependence
+    coefficient
+
+    Parameters
+    ----------
+    x : 1d array-like
+        Array of n elements
+
+    y : 1d array-like
+        Array of n elements
+
+    B : int
+        Number of permutations
+
+    n_jobs : int
+        Number of cpus to use for processing
+
+    k : int
+        Number of random projections for cca
+
+    random_state : int
+        Sets seed for random number generator
+
+    Returns
+    -------
+    p : float
+        Achieved significance level
+    """
+    np.random.seed(random_state)
+    func   = rdc
+    kwargs = {'k': k}
+
+    # Estimate correlation from original data
+    theta = np.fabs(rdc(x, y, **kwargs))
+
+    # Permutations
+    y_ = y.copy()
+    if n_jobs == 1:
+        theta_p = np.zeros(B)
+        for i in range(B):
+            theta_p[i] = _permutation(x, y_, func, **kwargs)
+    else:
+        theta_p = [
+            Parallel(n_jobs=n_jobs, backend='threading')(
+                    delayed(_permutation)(x, y_, func, **kwargs)
+                    for i in range(B)
+                )
+            ]
+
+    # Achieved significance level
+    return np.mean(np.fabs(theta_p) >= theta)
+
+
+########################
+"""DISCRETE SELECTORS"""
+########################
+
+@njit(cache=True, nogil=True, fastmath=True)
+def permutation_test_mc(x, y, B=100, n_classes=None, random_state=None, theta=None,
+                        work=None):
+    """Permutation test for multiple correlation
+
+    Parameters
+    ----------
+    x : 1d array-like
+        Array of n elements
+
+    y : 1d array-like
+        Array of n elements
+
+    n_classes : int
+        Number of classes
+
+    B : int
+        Number of permutations
+
+    random_state : int
+        Sets seed for random number generator
+
+    theta : float
+        Observed statistic if already computed, otherwise it is computed from
+        x and y
+
+    work : tuple
+        Buffers of a Workspace reused for the permutations, None to allocate
+
+    Returns
+    -------
+    p : float
+        Achieved significance level
+    """
+    np.random.seed(random_state)
+
+    # Estimate correlation from original data unless already computed
+    if theta is None: theta = mc_fast(x, y, n_classes)
+
+    # Permutations
+    y_, theta_p = _permutation_buffers(y, B, work)
+    for i in range(B):
+        np.random.shuffle(y_)
+        theta_p[i] = mc_fast(x, y_, n_classes) # Call jitted function directly
+
+    # Achieved significance level
+    return np.mean(theta_p >= theta)
+
+
+def permutation_test_mi(x, y, B=100, random_state=None, theta=None, **kwargs):
+    """Permutation test for mutual information
+
+    Parameters
+    ----------
+    x : 1d array-like
+        Array of n elements
+
+    y : 1d array-like
+        Array of n elements
+
+    n_classes : int
+        Number of classes
+
+    B : int
+        Number of permutations
+
+    random_state : int
+        Sets seed for random number generator
+
+    theta : float
+        Observed statistic if already computed, otherwise it is computed from
+        x and y
+
+    Returns
+    -------
+    p : float
+        Achieved significance level
+    """
+    np.random.seed(random_state)
+
+    # Estimate correlation from original data unless already computed
+    if theta is None: theta = mi(x, y, random_state)
+
+    # Permutations
+    y_      = y.copy()
+    theta_p = np.zeros(B)
+    for i in range(B):
+        np.random.shuffle(y_)
+        theta_p[i] = mi(x, y_, random_state)
+
+    # Achieved significance level
+    return np.mean(theta_p >= theta)
+
+
+###########################
+"""CATEGORICAL SELECTORS"""
+###########################
+
+@njit(cache=True, nogil=True)
+def permutation_test_chi2(x, y, B=100, n_levels=None, n_classes=None,
+                          random_state=None, theta=None):
+    """Permutation test for chi-square statistic of contingency table
+
+    Parameters
+    ----------
+    x : 1d array-like
+        Array of n integers in [0, n_levels)
+
+    y : 1d array-like
+        Array of n integers in [0, n_classes)
+
+    B : int
+        Number of permutations
+
+    n_levels : int
+        Number of categories of x
+
+    n_classes : int
+        Number of classes
+
+    random_state : int
+        Sets seed for random number generator
+
+    theta : float
+        Observed statistic if already computed, otherwise it is computed from
+        x and y
+
+    Returns
+    -------
+    p : float
+        Achieved significance level
+    """
+    np.random.seed(random_state)
+
+    # Estimate statistic from original data unless already computed
+    if theta is None: theta = chi2_stat(x, y, n_levels, n_classes)
+
+    # Permutations, margins of the table are fixed so each one only rebuilds
+    # the counts
+    y_      = y.copy()
+    theta_p = np.zeros(B)
+    for i in range(B):
+        np.random.shuffle(y_)
+        theta_p[i] = chi2_stat(x, y_, n_levels, n_classes)
+
+    # Achieved significance level
+    return np.mean(theta_p >= theta)
+
+
+def chi2_test(x, y, B=100, n_classes=None, random_state=None,
+              min_expected=5.0):
+    """Chi-square test of independence between categorical feature and class
+    labels. Uses the asymptotic chi-square distribution when every expected
+    count of the contingency table is at least min_expected, otherwise a
+    permutation test
+
+    Parameters
+    ----------
+    x : 1d array-like
+        Array of n category codes
+
+    y : 1d array-like
+        Array of n class indices
+
+    B : int
+        Number of permutations
+
+    n_classes : int
+        Number of classes
+
+    random_state : int
+        Sets seed for random number generator
+
+    min_expected : float
+        Smallest expected count for which the asymptotic test is used
+
+    Returns
+    -------
+    p : float
+        Achieved significance level
+    """
+    codes, n_levels = category_codes(x)
+    y               = y.astype(np.int64)
+    if n_classes is None: n_classes = int(y.max()) + 1
+
+    # Expected counts of nonempty rows and columns
+    table      = contingency_table(codes, y, n_levels, n_classes)
+    rows, cols = table.sum(axis=1), table.sum(axis=0)
+    rows, cols = rows[rows > 0], cols[cols > 0]
+    dof        = (len(rows)-1)*(len(cols)-1)
+    if dof == 0: return 1.0
+
+    theta = chi2_stat(codes, y, n_levels, n_classes)
+    if rows.min()*cols.min()/float(len(y)) >= min_expected:
+        return chi2.sf(theta, dof)
+    else:
+        return permutation_test_chi2(codes, y, B=B, n_levels=n_levels,
+                                     n_classes=n_classes,
+                                     random_state=random_state, theta=theta)
+
+
+def permutation_test_anova(x, y, B=100, random_state=None):
+    """Permutation test for association between categorical feature and
+    continuous label using the multiple correlation of the label with the
+    categories
+
+    Parameters
+    ----------
+    x : 1d array-like
+        Array of n category codes
+
+    y : 1d array-like
+        Array of n elements
+
+    B : int
+        Number of permutations
+
+    random_state : int
+        Sets seed for random number generator
+
+    Returns
+    -------
+    p : float
+        Achieved significance level
+    """
+    codes, n_levels = category_codes(x)
+    if n_levels < 2: return 1.0
+
+    # Permuting the categories is equivalent to permuting the label
+    return permutation_test_mc(x=y, y=codes, B=B, n_classes=n_levels,
+                               random_state=random_state)
+
+
+######################
+"""LINEAR SELECTORS"""
+######################
+
+def linear_test(X, H):
+    """Asymptotic test of the quadratic Strasser-Weber linear statistic for
+    all columns of X in one pass, without permutations
+
+    Parameters
+    ----------
+    X : 2d array-like
+        Array of n samples and k features
+
+    H : 2d array-like
+        Array of n samples and q influence values of the label
+
+    Returns
+    -------
+    p : 1d array-like
+        Probability value of each column from chi-square distribution
+
+    c : 1d array-like
+        Quadratic statistic of each column
+    """
+    c, df = linear_statistic(X, H)
+    if df == 0: return np.ones(len(c)), c
+    return chi2.sf(c, df), c
+
+
+####################
+"""RANK SELECTORS"""
+####################
+
+def _null_seed(key):
+    """Seed for simulating null distribution that only depends on its key"""
+    return zlib.crc32(repr(key).encode('utf-8')) & 0x7fffffff
+
+
+def _null_pvalue(null, theta):
+    """Achieved significance level of statistic from sorted null distribution,
+    with a small tolerance for rounding differences between the observed and
+    simulated statistics"""
+    return (len(null) - np.searchsorted(null, theta - 1e-10))/float(len(null))
+
+
+@njit(cache=True, nogil=True)
+def _spearman_null(n, B, seed):
+    """Simulates sorted null distribution of absolute Spearman correlation of
+    n elements without ties
+
+    Parameters
+    ----------
+    n : int
+        Number of elements
+
+    B : int
+        Number of permutations
+
+    seed : int
+        Sets seed for random number generator
+
+    Returns
+    -------
+    null : 1d array-like
+        Sorted statistics of permutations
+    """
+    np.random.seed(seed)
+    r       = np.arange(1, n+1).astype(np.float64)
+    r_      = r.copy()
+    theta_p = np.zeros(B)
+    for i in range(B):
+        np.random.shuffle(r_)
+        theta_p[i] = np.fabs(pcor(r, r_))
+    return np.sort(theta_p)
+
+
+@njit(cache=True, nogil=True)
+def _kruskal_null(counts, B, seed):
+    """Simulates sorted null distribution of Kruskal-Wallis statistic for
+    classes of given sizes without ties
+
+    Parameters
+    ----------
+    counts : 1d array-like
+        Number of elements in each class
+
+    B : int
+        Number of permutations
+
+    seed : int
+        Sets seed for random number generator
+
+    Returns
+    -------
+    null : 1d array-like
+        Sorted statistics of permutations
+    """
+    np.random.seed(seed)
+    k, n = counts.shape[0], counts.sum()
+    r    = np.arange(1, n+1).astype(np.float64)
+    y_   = np.zeros(n, dtype=np.int64)
+    pos  = 0
+    for c in range(k):
+        y_[pos:pos+counts[c]] = c
+        pos += counts[c]
+
+    theta_p = np.zeros(B)
+    for i in range(B):
+        np.random.shuffle(y_)
+        theta_p[i] = kruskal_stat(r, y_, k)
+    return np.sort(theta_p)
+
+
+@njit(cache=True, nogil=True)
+def permutation_test_kruskal(r, y, B=100, n_classes=None, random_state=None,
+                             theta=None):
+    """Permutation test for Kruskal-Wallis statistic
+
+    Parameters
+    ----------
+    r : 1d array-like
+        Array of n ranks
+
+    y : 1d array-like
+        Array of n integers in [0, n_classes)
+
+    B : int
+        Number of permutations
+
+    n_classes : int
+        Number of classes
+
+    random_state : int
+        Sets seed for random number generator
+
+    theta : float
+        Observed statistic if already computed, otherwise it is computed from
+        r and y
+
+    Returns
+    -------
+    p : float
+        Achieved significance level
+    """
+    np.random.seed(random_state)
+
+    # Estimate statistic from original data unless already computed
+    if theta is None: theta = kruskal_stat(r, y, n_classes)
+
+    # Permutations
+    y_      = y.copy()
+    theta_p = np.zeros(B)
+    for i in range(B):
+        np.random.shuffle(y_)
+        theta_p[i] = kruskal_stat(r, y_, n_classes)
+
+    # Achieved significance level
+    return np.mean(theta_p >= theta)
+
+
+def spearman_test(x, y, B=100, random_state=None):
+    """Permutation test for Spearman correlation. Without ties the null
+    distribution only depends on n, so it is simulated once per (n, B) and
+    looked up in NULL_CACHE. With ties the ranks are permuted directly
+
+    Parameters
+    ----------
+    x : 1d array-like
+        Array of n elements
+
+    y : 1d array-like
+        Array of n elements
+
+    B : int
+        Number of permutations
+
+    random_state : int
+        Sets seed for random number generator when there are ties
+
+    Returns
+    -------
+    p : float
+        Achieved significance level
+    """
+    n      = x.shape[0]
+    rx, ry = rank(x), rank(y)
+    theta  = np.fabs(pcor(rx, ry))
+
+    if len(np.unique(rx)) < n or len(np.unique(ry)) < n:
+        return permutation_test_pcor(rx, ry, B=B, random_state=random_state,
+                                     theta=theta)
+
+    key  = ('spearman', n, B)
+    null = NULL_CACHE.get(key, lambda: _spearman_null(n, B, _null_seed(key)))
+    return _null_pvalue(null, theta)
+
+
+def kruskal_test(x, y, B=100, n_classes=None, random_state=None):
+    """Permutation test for Kruskal-Wallis statistic of feature ranks grouped
+    by class. Without ties the null distribution only depends on the class
+    sizes, so it is simulated once per (sorted class sizes, B) and looked up
+    in NULL_CACHE. With ties the classes are permuted directly
+
+    Parameters
+    ----------
+    x : 1d array-like
+        Array of n elements
+
+    y : 1d array-like
+        Array of n class labels
+
+    B : int
+        Number of permutations
+
+    n_classes : int
+        Number of classes, unused since empty classes do not change the
+        statistic
+
+    random_state : int
+        Sets seed for random number generator when there are ties
+
+    Returns
+    -------
+    p : float
+        Achieved significance level
+    """
+    r          = rank(x)
+    _, y       = np.unique(y, return_inverse=True)
+    y          = y.ravel().astype(np.int64)
+    counts     = np.bincount(y)
+    theta      = kruskal_stat(r, y, len(counts))
+    if len(counts) < 2: return 1.0
+
+    if len(np.unique(r)) < len(r):
+        return permutation_test_kruskal(r, y, B=B, n_classes=len(counts),
+                                        random_state=random_state, theta=theta)
+
+    # Statistic does not depend on class order so sort sizes for the key
+    counts = np.sort(counts)
+    key    = ('kruskal', tuple(int(c) for c in counts), B)
+    null   = NULL_CACHE.get(key, lambda: _kruskal_null(counts, B,
+                                                       _null_seed(key)))
+    return _null_pvalue(null, theta)
+
+
+######################
+"""KERNEL SELECTORS"""
+######################
+
+def permutation_test_hsic(x, y, B=100, n_classes=None, random_state=None,
+                          n_fourier=20, max_block=2**22):
+    """Permutation test for normalized HSIC with random Fourier features.
+    The feature maps are drawn once and shared by all permutations, so each
+    permutation only reorders the rows of the label features. Permutations
+    are evaluated in blocks as one matrix product of the feature map of x
+    with the column stacked, permuted label features
+
+    Parameters
+    ----------
+    x : 1d array-like
+        Array of n elements
+
+    y : 1d array-like
+        Array of n elements
+
+    B : int
+        Number of permutations
+
+    n_classes : int
+        Number of classes if y holds class labels, None for a continuous y
+
+    random_state : int
+        Sets seed for random features and permutations
+
+    n_fourier : int
+        Number of random Fourier features of each variable
+
+    max_block : int
+        Largest number of elements of the stacked label features in a block
+
+    Returns
+    -------
+    p : float
+        Achieved significance level
+    """
+    n   = x.shape[0]
+    rng = np.random.RandomState(random_state)
+    Fx  = rff_features(x, n_fourier, rng)
+    if n_classes is not None:
+        labels, codes = np.unique(y, return_inverse=True)
+        Fy            = label_features(codes.ravel(), len(labels))
+    else:
+        Fy = rff_features(y, n_fourier, rng)
+
+    # Normalization of HSIC does not change under permutation
+    theta = np.sum(np.dot(Fx.T, Fy)**2)
+    if theta == 0: return 1.0
+
+    q       = Fy.shape[1]
+    perms   = np.array([rng.permutation(n) for _ in range(B)])
+    theta_p = np.zeros(B)
+    step    = max(1, max_block//(n*q))
+    for i in range(0, B, step):
+        P                 = perms[i:i+step]
+        C                 = np.dot(Fx.T, Fy[P.T].reshape(n, -1))
+        theta_p[i:i+step] = np.sum((C*C).reshape(-1, P.shape[0], q),
+                                   axis=(0, 2))
+
+    # Relative tolerance so permutations with equal statistic are counted
+    return np.mean(theta_p >= theta*(1 - 1e-10))
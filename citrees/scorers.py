@@ -1,12 +1,16 @@
 from __future__ import absolute_import, division, print_function
 
 import ctypes
-from numba import njit
+from numba import njit, prange
 import numpy as np
-from os.path import dirname, join
-import pandas as pd
+import os
+from os.path import abspath, dirname, exists, getmtime, isdir, join
 from scipy.stats import rankdata as rank
 from sklearn.feature_selection import mutual_info_classif
+import subprocess
+import tempfile
+
+from utils import logger
 
 # from externals.six.moves import range
 
@@ -15,26 +19,121 @@ from sklearn.feature_selection import mutual_info_classif
 #######################
 
 # Define constants for wrapping C functions
-# SHARED_OBJECT_DIR = join(dirname(__file__), 'bin')
-
-# Weighted distance correlation
-# CFUNC_DCORS_PATH               = join(SHARED_OBJECT_DIR, 'dcor.so')
-# CFUNC_DCORS_DLL                = ctypes.CDLL(CFUNC_DCORS_PATH)
-# CFUNC_DCORS_DLL.wdcor.argtypes = (
-#         ctypes.POINTER(ctypes.c_double), # x
-#         ctypes.POINTER(ctypes.c_double), # y
-#         ctypes.c_int,                    # n
-#         ctypes.POINTER(ctypes.c_double)  # w
-#         )
-# CFUNC_DCORS_DLL.wdcor.restype  = ctypes.c_double
-
-# Unweighted distance correlation
-# CFUNC_DCORS_DLL.dcor.argtypes = (
-#         ctypes.POINTER(ctypes.c_double), # x
-#         ctypes.POINTER(ctypes.c_double), # y
-#         ctypes.c_int,                    # n
-#         )
-# CFUNC_DCORS_DLL.dcor.restype  = ctypes.c_double
+SHARED_OBJECT_DIR = join(dirname(abspath(__file__)), 'bin')
+CFUNC_DCORS_SRC   = join(dirname(abspath(__file__)), 'src', 'dcor.c')
+CFUNC_DCORS_PATH  = join(SHARED_OBJECT_DIR, 'dcor.so')
+CFLAGS            = ['-fPIC', '-Ofast', '-march=native', '-ffast-math']
+DOUBLE_ARRAY      = np.ctypeslib.ndpointer(dtype=np.float64, ndim=1,
+                                           flags='C_CONTIGUOUS')
+
+# Error codes of C functions
+C_ERRORS = {1: ValueError("C distance correlation needs at least 2 samples"),
+            2: MemoryError("C distance correlation could not allocate memory")}
+
+
+def _build_dcor_library():
+    """Compiles src/dcor.c into bin/dcor.so, with OpenMP if the compiler
+    supports it. The library is written to a temporary file and moved into
+    place so concurrent builds do not load a partial file
+
+    Returns
+    -------
+    None
+    """
+    if not isdir(SHARED_OBJECT_DIR): os.makedirs(SHARED_OBJECT_DIR)
+    fd, tmp = tempfile.mkstemp(suffix='.so', dir=SHARED_OBJECT_DIR)
+    os.close(fd)
+    try:
+        cc = os.environ.get('CC', 'gcc')
+        for flags in [CFLAGS + ['-fopenmp'], CFLAGS]:
+            cmd = [cc] + flags + ['-shared', '-o', tmp, CFUNC_DCORS_SRC]
+            if subprocess.call(cmd, stdout=subprocess.DEVNULL,
+                               stderr=subprocess.DEVNULL) == 0:
+                os.replace(tmp, CFUNC_DCORS_PATH)
+                return
+        raise OSError("Could not compile %s" % CFUNC_DCORS_SRC)
+    finally:
+        if exists(tmp): os.remove(tmp)
+
+
+def _load_dcor_library():
+    """Loads shared library of C distance correlation, building it first if
+    it is missing or older than the source
+
+    Returns
+    -------
+    dll : ctypes.CDLL or None
+        Library with argument types set, None if it can not be built or loaded
+    """
+    try:
+        if not exists(CFUNC_DCORS_PATH) or \
+           getmtime(CFUNC_DCORS_PATH) < getmtime(CFUNC_DCORS_SRC):
+            _build_dcor_library()
+        dll = ctypes.CDLL(CFUNC_DCORS_PATH)
+    except OSError as e:
+        logger("scorers", "C distance correlation unavailable (%s), c_dcor "
+                          "and c_wdcor fall back to py_dcor and py_wdcor" % e)
+        return None
+
+    # Weighted distance correlation
+    dll.wdcor.argtypes = (
+            DOUBLE_ARRAY,                    # x
+            DOUBLE_ARRAY,                    # y
+            ctypes.c_int64,                  # n
+            DOUBLE_ARRAY,                    # w
+            ctypes.POINTER(ctypes.c_double)  # result
+            )
+    dll.wdcor.restype  = ctypes.c_int
+
+    # Unweighted distance correlation
+    dll.dcor.argtypes = (
+            DOUBLE_ARRAY,                    # x
+            DOUBLE_ARRAY,                    # y
+            ctypes.c_int64,                  # n
+            ctypes.POINTER(ctypes.c_double)  # result
+            )
+    dll.dcor.restype  = ctypes.c_int
+
+    dll.has_openmp.argtypes = ()
+    dll.has_openmp.restype  = ctypes.c_int
+    return dll
+
+
+CFUNC_DCORS_DLL = _load_dcor_library()
+
+
+def has_openmp():
+    """Whether C distance correlation runs with OpenMP threads
+
+    Returns
+    -------
+    flag : bool
+        True if the C library is loaded and was compiled with OpenMP
+    """
+    if CFUNC_DCORS_DLL is None: return False
+    return bool(CFUNC_DCORS_DLL.has_openmp())
+
+
+def _check_lengths(x, *arrays):
+    """Checks that arrays passed to C functions are as long as x, since C
+    reads n elements from every pointer
+
+    Parameters
+    ----------
+    x : 1d array-like
+        Array of n elements
+
+    arrays : 1d array-like
+        Arrays that must also have n elements
+
+    Returns
+    -------
+    None
+    """
+    for a in arrays:
+        if a.shape[0] != x.shape[0]:
+            raise ValueError("Arrays must have the same length, got %d and %d"
+                             % (x.shape[0], a.shape[0]))
 
 
 ###################################
@@ -86,6 +185,59 @@ def pcor(x, y):
         return cov/np.sqrt(ssx*ssy)
 
 
+@njit(cache=True, nogil=True, fastmath=True, parallel=True)
+def pcor_matrix(X, y):
+    """Pearson correlation between each column of X and y, computed for all
+    columns in one parallel call that shares the sums of y
+
+    Parameters
+    ----------
+    X : 2d array-like
+        Array of n samples and p features
+
+    y : 1d array-like
+        Array of n elements
+
+    Returns
+    -------
+    cor : 1d array-like
+        Pearson correlation for each of the p features, 0 for constant
+        features
+    """
+    n, p = X.shape
+
+    # Label terms shared by all columns, centered so that large offsets do
+    # not cancel in the sums of squares
+    my = 0.0
+    for i in range(n): my += y[i]
+    my /= n
+    dy, ssy = np.empty(n), 0.0
+    for i in range(n):
+        dy[i] = y[i] - my
+        ssy  += dy[i]*dy[i]
+
+    cor = np.zeros(p)
+    if ssy == 0.0: return cor
+
+    for j in prange(p):
+        mx, const = 0.0, True
+        for i in range(n):
+            mx += X[i, j]
+            if X[i, j] != X[0, j]: const = False
+        if const: continue
+        mx /= n
+
+        ssx, sxy = 0.0, 0.0
+        for i in range(n):
+            dx   = X[i, j] - mx
+            ssx += dx*dx
+            sxy += dx*dy[i]
+
+        if ssx > 0.0: cor[j] = sxy/np.sqrt(ssx*ssy)
+
+    return cor
+
+
 def cca(X, Y):
     """Largest canonical correlation
 
@@ -294,10 +446,11 @@ def rdc_fast(x, y, k=10, s=1.0/6.0, f=np.sin):
 
 
 @njit(cache=True, nogil=True, fastmath=True)
-def py_wdcor(x, y, weights):
+def py_wdcor(x, y, weights, Edx=None, Edy=None):
     """Python port of C function for distance correlation
 
-    Note: Version is optimized for use with Numba
+    Note: Version is optimized for use with Numba. Pairwise distances are
+          accumulated as they are computed, so only the row sums are stored
 
     Parameters
     ----------
@@ -310,6 +463,10 @@ def py_wdcor(x, y, weights):
     weights : 1d array-like
         Weight vector that sums to 1
 
+    Edx, Edy : 1d array-like
+        Buffers of at least n elements for the row sums of the distance
+        matrices, for example from a Workspace. None allocates them
+
     Returns
     -------
     dcor : float
@@ -317,12 +474,8 @@ def py_wdcor(x, y, weights):
     """
     # Define initial variables
     n   = x.shape[0]
-    s   = int(n*(n-1)/2.)
-    Edx = np.zeros(n)
-    Edy = np.zeros(n)
-    DMY = np.zeros(s)
-    DMX = np.zeros(s)
-    F   = np.zeros(s)
+    edx = np.zeros(n) if Edx is None else Edx[:n]
+    edy = np.zeros(n) if Edy is None else Edy[:n]
     S1  = 0
     S2  = 0
     S3  = 0
@@ -334,31 +487,31 @@ def py_wdcor(x, y, weights):
     S2Y = 0
     S3X = 0
     S3Y = 0
-    k   = 0
+    edx[:] = 0
+    edy[:] = 0
 
     for i in range(n-1):
         for j in range(i+1, n):
 
-            # Distance matrices
-            DMX[k]  = np.fabs(x[i]-x[j])
-            DMY[k]  = np.fabs(y[i]-y[j])
-            F[k]    = weights[i]*weights[j]
-            S1     += DMX[k]*DMY[k]*F[k]
-            S1X    += DMX[k]*DMX[k]*F[k]
-            S1Y    += DMY[k]*DMY[k]*F[k]
-            Edx[i] += DMX[k]*weights[j]
-            Edy[j] += DMY[k]*weights[i]
-            Edx[j] += DMX[k]*weights[i]
-            Edy[i] += DMY[k]*weights[j]
-            k      += 1
+            # Distances
+            dx      = np.fabs(x[i]-x[j])
+            dy      = np.fabs(y[i]-y[j])
+            f       = weights[i]*weights[j]
+            S1     += dx*dy*f
+            S1X    += dx*dx*f
+            S1Y    += dy*dy*f
+            edx[i] += dx*weights[j]
+            edy[j] += dy*weights[i]
+            edx[j] += dx*weights[i]
+            edy[i] += dy*weights[j]
 
     # Means
     for i in range(n):
-        S3  += Edx[i]*Edy[i]*weights[i]
-        S2a += Edy[i]*weights[i]
-        S2b += Edx[i]*weights[i]
-        S3X += Edx[i]*Edx[i]*weights[i]
-        S3Y += Edy[i]*Edy[i]*weights[i]
+        S3  += edx[i]*edy[i]*weights[i]
+        S2a += edy[i]*weights[i]
+        S2b += edx[i]*weights[i]
+        S3X += edx[i]*edx[i]*weights[i]
+        S3Y += edy[i]*edy[i]*weights[i]
 
     # Variance and covariance terms
     S1  = 2*S1
@@ -375,10 +528,11 @@ def py_wdcor(x, y, weights):
 
 
 @njit(cache=True, nogil=True, fastmath=True)
-def py_dcor(x, y):
+def py_dcor(x, y, Edx=None, Edy=None):
     """Python port of C function for distance correlation
 
-    Note: Version is optimized for use with Numba
+    Note: Version is optimized for use with Numba. Pairwise distances are
+          accumulated as they are computed, so only the row sums are stored
 
     Parameters
     ----------
@@ -388,20 +542,21 @@ def py_dcor(x, y):
     y : 1d array-like
         Array of n elements
 
+    Edx, Edy : 1d array-like
+        Buffers of at least n elements for the row sums of the distance
+        matrices, for example from a Workspace. None allocates them
+
     Returns
     -------
     dcor : float
         Distance correlation
     """
     n   = x.shape[0]
-    s   = int(n*(n-1)/2.)
     n2  = n*n
     n3  = n2*n
     n4  = n3*n
-    Edx = np.zeros(n)
-    Edy = np.zeros(n)
-    DMY = np.zeros(s)
-    DMX = np.zeros(s)
+    edx = np.zeros(n) if Edx is None else Edx[:n]
+    edy = np.zeros(n) if Edy is None else Edy[:n]
     S1  = 0
     S2  = 0
     S3  = 0
@@ -413,30 +568,30 @@ def py_dcor(x, y):
     S2Y = 0
     S3X = 0
     S3Y = 0
-    k   = 0
+    edx[:] = 0
+    edy[:] = 0
 
     for i in range(n-1):
         for j in range(i+1, n):
 
-            # Distance matrices
-            DMX[k]  = np.fabs(x[i]-x[j])
-            DMY[k]  = np.fabs(y[i]-y[j])
-            S1     += DMX[k]*DMY[k]
-            S1X    += DMX[k]*DMX[k]
-            S1Y    += DMY[k]*DMY[k]
-            Edx[i] += DMX[k]
-            Edy[j] += DMY[k]
-            Edx[j] += DMX[k]
-            Edy[i] += DMY[k]
-            k      += 1
+            # Distances
+            dx      = np.fabs(x[i]-x[j])
+            dy      = np.fabs(y[i]-y[j])
+            S1     += dx*dy
+            S1X    += dx*dx
+            S1Y    += dy*dy
+            edx[i] += dx
+            edy[j] += dy
+            edx[j] += dx
+            edy[i] += dy
 
     # Means
     for i in range(n):
-        S3  += Edx[i]*Edy[i]
-        S2a += Edy[i]
-        S2b += Edx[i]
-        S3X += Edx[i]*Edx[i]
-        S3Y += Edy[i]*Edy[i]
+        S3  += edx[i]*edy[i]
+        S2a += edy[i]
+        S2b += edx[i]
+        S3X += edx[i]*edx[i]
+        S3Y += edy[i]*edy[i]
 
     # Variance and covariance terms
     S1   = (2*S1)/float(n2)
@@ -455,14 +610,432 @@ def py_dcor(x, y):
         return np.sqrt( (S1+S2-2*S3) / np.sqrt( (S1X+S2X-2*S3X)*(S1Y+S2Y-2*S3Y) ))
 
 
-# Lambda function used in approx_wdcor function
-MEAN = lambda z: sum(z)/float(len(z))
+@njit(cache=True, nogil=True, fastmath=True, parallel=True)
+def dcor_matrix(X, y):
+    """Distance correlation between each column of X and y, computed for all
+    columns in one parallel call that shares the distance terms of y
 
-def approx_wdcor(x, y):
-    """Approximate distance correlation by binning arrays
+    Parameters
+    ----------
+    X : 2d array-like
+        Array of n samples and p features
 
-    NOTE: Code ported from R function approx.dcor at:
-        https://rdrr.io/cran/extracat/src/R/wdcor.R
+    y : 1d array-like
+        Array of n elements
+
+    Returns
+    -------
+    cor : 1d array-like
+        Distance correlation for each of the p features, as py_dcor
+    """
+    n, p = X.shape
+    n2   = float(n*n)
+    n3   = n2*n
+    n4   = n3*n
+
+    # Label terms shared by all columns
+    edy = np.zeros(n)
+    S1Y = 0.0
+    for i in range(n-1):
+        for k in range(i+1, n):
+            dy      = np.fabs(y[i]-y[k])
+            S1Y    += dy*dy
+            edy[i] += dy
+            edy[k] += dy
+    S2a = edy.sum()
+    S3Y = np.sum(edy*edy)/n3
+    S1Y = 2*S1Y/n2
+    S2Y = S2a*S2a/n4
+
+    cor = np.zeros(p)
+    if S1Y == 0 or S2Y == 0 or S3Y == 0: return cor
+
+    for j in prange(p):
+        x   = np.ascontiguousarray(X[:, j])
+        edx = np.zeros(n)
+        S1  = 0.0
+        S1X = 0.0
+        for i in range(n-1):
+            for k in range(i+1, n):
+                dx      = np.fabs(x[i]-x[k])
+                S1     += dx*np.fabs(y[i]-y[k])
+                S1X    += dx*dx
+                edx[i] += dx
+                edx[k] += dx
+
+        S2b = edx.sum()
+        S3  = np.sum(edx*edy)/n3
+        S3X = np.sum(edx*edx)/n3
+        S1  = 2*S1/n2
+        S1X = 2*S1X/n2
+        S2  = S2a*S2b/n4
+        S2X = S2b*S2b/n4
+        if S1X == 0 or S2X == 0 or S3X == 0: continue
+        cor[j] = np.sqrt((S1+S2-2*S3)/np.sqrt((S1X+S2X-2*S3X)*(S1Y+S2Y-2*S3Y)))
+
+    return cor
+
+
+@njit(cache=True, nogil=True)
+def xi_ranks(y):
+    """Ranks used by Chatterjee's xi correlation
+
+    Parameters
+    ----------
+    y : 1d array-like
+        Array of n elements
+
+    Returns
+    -------
+    r : 1d array-like
+        Number of elements less than or equal to each element
+
+    l : 1d array-like
+        Number of elements greater than or equal to each element
+    """
+    n   = y.shape[0]
+    idx = np.argsort(y)
+    r   = np.zeros(n)
+    l   = np.zeros(n)
+    i   = 0
+    while i < n:
+        # Tied elements share both counts
+        j = i
+        while j+1 < n and y[idx[j+1]] == y[idx[i]]: j += 1
+        for k in range(i, j+1):
+            r[idx[k]] = j + 1
+            l[idx[k]] = n - i
+        i = j + 1
+    return r, l
+
+
+@njit(cache=True, nogil=True, fastmath=True)
+def xi_from_ranks(order, r, l):
+    """Chatterjee's xi correlation from ordering of x and ranks of y
+
+    Parameters
+    ----------
+    order : 1d array-like
+        Indices that sort x, ties broken at random
+
+    r : 1d array-like
+        First output of xi_ranks
+
+    l : 1d array-like
+        Second output of xi_ranks
+
+    Returns
+    -------
+    xi : float
+        Xi correlation, 0 if y is constant
+    """
+    n   = order.shape[0]
+    num = 0.0
+    for i in range(n-1): num += np.fabs(r[order[i+1]] - r[order[i]])
+    den = 2.0*np.sum(l*(n - l))
+    if den == 0: return 0.0
+    return 1.0 - n*num/den
+
+
+def xi_order(x, random_state=None):
+    """Indices that sort x with ties broken at random
+
+    Parameters
+    ----------
+    x : 1d array-like
+        Array of n elements
+
+    random_state : int
+        Sets seed for random number generator
+
+    Returns
+    -------
+    order : 1d array-like
+        Indices that sort x
+    """
+    rng = np.random.RandomState(random_state)
+    return np.lexsort((rng.rand(x.shape[0]), x))
+
+
+def xicor(x, y, random_state=None):
+    """Chatterjee's xi correlation, which is 0 under independence and 1 when
+    y is a measurable function of x. Costs O(n log n)
+
+    NOTE: Chatterjee (2021), A new coefficient of correlation
+
+    Parameters
+    ----------
+    x : 1d array-like
+        Array of n elements
+
+    y : 1d array-like
+        Array of n elements
+
+    random_state : int
+        Sets seed for random number generator breaking ties in x
+
+    Returns
+    -------
+    xi : float
+        Xi correlation
+    """
+    r, l = xi_ranks(y)
+    return xi_from_ranks(xi_order(x, random_state), r, l)
+
+
+@njit(cache=True, nogil=True)
+def _tie_pairs(a):
+    """Number of tied pairs in sorted array"""
+    ties, run = 0.0, 1.0
+    for i in range(1, a.shape[0]):
+        if a[i] == a[i-1]:
+            run += 1.0
+        else:
+            ties += run*(run-1)/2
+            run   = 1.0
+    return ties + run*(run-1)/2
+
+
+@njit(cache=True, nogil=True)
+def _merge_swaps(a):
+    """Sorts array in place with bottom up merge sort and counts the swaps of
+    adjacent elements an exchange sort would need, the number of inversions
+
+    Parameters
+    ----------
+    a : 1d array-like
+        Array of n elements, sorted in place
+
+    Returns
+    -------
+    swaps : float
+        Number of pairs i < j with a[i] > a[j]
+    """
+    n, swaps, width = a.shape[0], 0.0, 1
+    buf = np.empty_like(a)
+    while width < n:
+        for lo in range(0, n, 2*width):
+            mid, hi = min(lo+width, n), min(lo+2*width, n)
+            i, j, k = lo, mid, lo
+            while i < mid and j < hi:
+                # Equal elements are not inversions so left run goes first
+                if a[j] < a[i]:
+                    buf[k] = a[j]
+                    swaps += mid - i
+                    j     += 1
+                else:
+                    buf[k] = a[i]
+                    i     += 1
+                k += 1
+            while i < mid:
+                buf[k] = a[i]
+                i, k   = i+1, k+1
+            while j < hi:
+                buf[k] = a[j]
+                j, k   = j+1, k+1
+        a[:]   = buf
+        width *= 2
+    return swaps
+
+
+@njit(cache=True, nogil=True)
+def kendall_tau(x, y):
+    """Kendall tau-b correlation in O(n log n) with Knight's merge sort
+    algorithm
+
+    NOTE: Knight (1966), A computer method for calculating Kendall's tau with
+        ungrouped data
+
+    Parameters
+    ----------
+    x : 1d array-like
+        Array of n elements
+
+    y : 1d array-like
+        Array of n elements
+
+    Returns
+    -------
+    tau : float
+        Kendall tau-b, 0 if x or y is constant
+    """
+    # Sort by x and then by y
+    n     = x.shape[0]
+    order = np.argsort(y, kind='mergesort')
+    order = order[np.argsort(x[order], kind='mergesort')]
+    xs    = x[order]
+    ys    = y[order].astype(np.float64)
+
+    # Pairs tied in x, and tied in both x and y
+    n0, n1, n3     = n*(n-1)/2.0, _tie_pairs(xs), 0.0
+    run            = 1.0
+    for i in range(1, n):
+        if xs[i] == xs[i-1] and ys[i] == ys[i-1]:
+            run += 1.0
+        else:
+            n3 += run*(run-1)/2
+            run = 1.0
+    n3 += run*(run-1)/2
+
+    # Discordant pairs are inversions of y, pairs tied in y come after sort
+    swaps = _merge_swaps(ys)
+    n2    = _tie_pairs(ys)
+
+    den = (n0 - n1)*(n0 - n2)
+    if den <= 0: return 0.0
+    return (n0 - n1 - n2 + n3 - 2*swaps)/np.sqrt(den)
+
+
+def compress_ties(x, max_ratio=.25):
+    """Detects low cardinality arrays and compresses them to distinct values
+
+    Parameters
+    ----------
+    x : 1d array-like
+        Array of n elements
+
+    max_ratio : float
+        Largest ratio of distinct values to n for which x is compressed
+
+    Returns
+    -------
+    ties : tuple or None
+        Two element tuple with sorted distinct values and integer code of each
+        element, None if x has too many distinct values
+    """
+    levels, codes = np.unique(x, return_inverse=True)
+    if len(levels) > max_ratio*x.shape[0]: return None
+    return levels, codes.ravel().astype(np.int64)
+
+
+def _grouped_dcor_setup(levels, codes, y):
+    """Precomputes terms of distance correlation between grouped and
+    continuous arrays that do not change when y is permuted
+
+    Parameters
+    ----------
+    levels : 1d array-like
+        Distinct values of grouped array
+
+    codes : 1d array-like
+        Group of each element
+
+    y : 1d array-like
+        Array of n elements
+
+    Returns
+    -------
+    codes : 1d array-like
+        Group of each element in ascending order of y
+
+    D : 2d array-like
+        Distances between distinct values
+
+    A : 1d array-like
+        Row sums of distance matrix of grouped array for each group
+
+    ys : 1d array-like
+        Centered y in ascending order
+
+    by : 1d array-like
+        Row sums of distance matrix of y in ascending order
+
+    consts : 1d array-like
+        n, sum, sum of squares and sum of squared row sums of both distance
+        matrices
+    """
+    order  = np.argsort(y, kind='mergesort')
+    codes  = codes[order]
+    ys     = y[order] - y.mean()
+    n      = float(len(ys))
+    counts = np.bincount(codes, minlength=len(levels)).astype(float)
+
+    # Grouped array, only distinct values and their counts are needed
+    D   = np.fabs(levels[:, None] - levels[None, :]).astype(float)
+    A   = D.dot(counts)
+    sa  = counts.dot(A)
+    sa2 = counts.dot((D*D).dot(counts))
+    sra = counts.dot(A*A)
+
+    # Continuous array, row sums of distances from prefix sums of sorted y
+    r   = np.arange(len(ys))
+    P   = np.cumsum(ys) - ys
+    T   = ys.sum()
+    by  = ys*r - P + (T - P - ys) - ys*(n - r - 1)
+    sb  = by.sum()
+    sb2 = 2*n*np.dot(ys, ys) - 2*T*T
+    srb = by.dot(by)
+
+    return codes, D, A, ys, by, np.array([n, sa, sa2, sra, sb, sb2, srb])
+
+
+@njit(cache=True, nogil=True, fastmath=True)
+def _grouped_dcor(codes, D, A, ys, by, consts):
+    """Distance correlation between grouped and continuous arrays in O(n*k)
+    time for k groups by sweeping over y in ascending order
+
+    Parameters
+    ----------
+    codes : 1d array-like
+        Group of each element in ascending order of y
+
+    D : 2d array-like
+        Distances between distinct values
+
+    A : 1d array-like
+        Row sums of distance matrix of grouped array for each group
+
+    ys : 1d array-like
+        Centered y in ascending order
+
+    by : 1d array-like
+        Row sums of distance matrix of y in ascending order
+
+    consts : 1d array-like
+        Constants from _grouped_dcor_setup
+
+    Returns
+    -------
+    dcor : float
+        Distance correlation
+    """
+    # Counts and sums of y for each group among smaller values of y
+    k   = D.shape[0]
+    cnt = np.zeros(k)
+    sm  = np.zeros(k)
+    S1  = 0.0
+    S3  = 0.0
+    for r in range(ys.shape[0]):
+        g, yr = codes[r], ys[r]
+        for h in range(k):
+            S1 += D[g, h]*(yr*cnt[h] - sm[h])
+        cnt[g] += 1.0
+        sm[g]  += yr
+        S3     += A[g]*by[r]
+
+    # Variance and covariance terms as in py_dcor
+    n, sa, sa2, sra, sb, sb2, srb = consts[0], consts[1], consts[2], consts[3], \
+                                    consts[4], consts[5], consts[6]
+    n2, n3, n4 = n*n, n*n*n, n*n*n*n
+    S1   = 2*S1/n2
+    S2   = sa*sb/n4
+    S3  /= n3
+    S1X  = sa2/n2
+    S2X  = sa*sa/n4
+    S3X  = sra/n3
+    S1Y  = sb2/n2
+    S2Y  = sb*sb/n4
+    S3Y  = srb/n3
+
+    if S1X == 0 or S2X == 0 or S3X == 0 or S1Y == 0 or S2Y == 0 or S3Y == 0:
+        return 0.0
+    else:
+        return np.sqrt(max(0.0, S1+S2-2*S3) / np.sqrt( (S1X+S2X-2*S3X)*(S1Y+S2Y-2*S3Y) ))
+
+
+def grouped_dcor_terms(x, y, max_ratio=.25):
+    """Compresses ties of the array with fewer distinct values for distance
+    correlation
 
     Parameters
     ----------
@@ -472,41 +1045,180 @@ def approx_wdcor(x, y):
     y : 1d array-like
         Array of n elements
 
+    max_ratio : float
+        Largest ratio of distinct values to n for which an array is compressed
+
+    Returns
+    -------
+    terms : tuple or None
+        Arguments of _grouped_dcor, None if neither array has few distinct
+        values
+    """
+    tx, ty = compress_ties(x, max_ratio), compress_ties(y, max_ratio)
+    if tx is None and ty is None: return None
+
+    # Distance correlation is symmetric so group the array with fewer values
+    if ty is not None and (tx is None or len(ty[0]) < len(tx[0])):
+        return _grouped_dcor_setup(ty[0], ty[1], x.astype(float))
+    return _grouped_dcor_setup(tx[0], tx[1], y.astype(float))
+
+
+def compressed_dcor(x, y, max_ratio=.25):
+    """Distance correlation that compresses ties. If x or y has at most
+    max_ratio*n distinct values, the statistic is computed from the distinct
+    values and their counts in O(n*k) time and O(k^2) memory, otherwise
+    py_dcor is used
+
+    Parameters
+    ----------
+    x : 1d array-like
+        Array of n elements
+
+    y : 1d array-like
+        Array of n elements
+
+    max_ratio : float
+        Largest ratio of distinct values to n for which an array is compressed
+
     Returns
     -------
     dcor : float
         Distance correlation
     """
-    # Equal cuts and then create dataframe
-    n  = x.shape[0]
-    cx = pd.cut(x, n, include_lowest=True)
-    cy = pd.cut(y, n, include_lowest=True)
-    df = pd.DataFrame(
-            np.column_stack([x, y, cx, cy]), columns=['x', 'y', 'cx', 'cy']
-        )
+    terms = grouped_dcor_terms(x, y, max_ratio)
+    if terms is None: return py_dcor(x, y)
+    return _grouped_dcor(*terms)
+
+
+@njit(cache=True, nogil=True)
+def bin_codes(x, n_bins):
+    """Bins array into equal width intervals and drops empty intervals
+
+    Parameters
+    ----------
+    x : 1d array-like
+        Array of n elements
+
+    n_bins : int
+        Number of intervals
+
+    Returns
+    -------
+    codes : 1d array-like
+        Array of n integers in [0, k) for k nonempty intervals
+
+    values : 1d array-like
+        Mean of x in each nonempty interval
+    """
+    n, lo, hi = x.shape[0], x.min(), x.max()
+    codes     = np.zeros(n, dtype=np.int64)
+    if hi > lo:
+        width = (hi - lo)/n_bins
+        for i in range(n):
+            codes[i] = min(int((x[i] - lo)/width), n_bins - 1)
+
+    # Relabel nonempty intervals in ascending order
+    cnt, sm = np.zeros(n_bins), np.zeros(n_bins)
+    for i in range(n):
+        cnt[codes[i]] += 1.0
+        sm[codes[i]]  += x[i]
+
+    remap, values, k = np.zeros(n_bins, dtype=np.int64), np.zeros(n_bins), 0
+    for b in range(n_bins):
+        if cnt[b] > 0:
+            remap[b], values[k] = k, sm[b]/cnt[b]
+            k += 1
+
+    for i in range(n): codes[i] = remap[codes[i]]
+    return codes, values[:k]
+
+
+@njit(cache=True, nogil=True, fastmath=True)
+def binned_dcor(table, vx, vy):
+    """Weighted distance correlation of the cells of a contingency table, each
+    cell located at the values of its row and column and weighted by its
+    frequency
 
-    # Average values in interval
-    vx = df['x'].groupby(df['cx'], sort=False).agg(MEAN).values
-    vy = df['y'].groupby(df['cy'], sort=False).agg(MEAN).values
+    Parameters
+    ----------
+    table : 2d array-like
+        Array of counts with one row per value of vx and one column per value
+        of vy
 
-    # Calculate frequencies based on groupings
-    f = df[['x', 'y']].groupby([df['cx'], df['cy']], sort=False).size()
+    vx : 1d array-like
+        Values of rows
 
-    # Normalize weights and calculate weighted distance correlation
-    w = f.values/float(f.values.sum())
+    vy : 1d array-like
+        Values of columns
 
-    # Recompute n
-    n = len(w)
+    Returns
+    -------
+    dcor : float
+        Weighted distance correlation
+    """
+    # Joint and marginal frequencies
+    P  = table/table.sum()
+    px = P.sum(axis=1)
+    py = P.sum(axis=0)
+
+    # Distances between values and their weighted means
+    DX = np.fabs(vx.reshape(-1, 1) - vx.reshape(1, -1))
+    DY = np.fabs(vy.reshape(-1, 1) - vy.reshape(1, -1))
+    Ax = np.dot(DX, px)
+    Ay = np.dot(DY, py)
+
+    # Variance and covariance terms as in py_wdcor
+    S1  = np.sum(DX*np.dot(np.dot(P, DY), np.ascontiguousarray(P.T)))
+    S2  = np.dot(px, Ax)*np.dot(py, Ay)
+    S3  = np.dot(Ax, np.dot(P, Ay))
+    S1X = np.dot(px, np.dot(DX*DX, px))
+    S2X = np.dot(px, Ax)**2
+    S3X = np.dot(px, Ax*Ax)
+    S1Y = np.dot(py, np.dot(DY*DY, py))
+    S2Y = np.dot(py, Ay)**2
+    S3Y = np.dot(py, Ay*Ay)
 
-    # Call either the Python or C version based on array length
-    if n > 5000:
-        return c_wdcor(vx[f.index.labels[0]], vy[f.index.labels[1]], w)
+    if S1X == 0 or S2X == 0 or S3X == 0 or S1Y == 0 or S2Y == 0 or S3Y == 0:
+        return 0.0
     else:
-        return py_wdcor(vx[f.index.labels[0]], vy[f.index.labels[1]], w)
+        return np.sqrt(max(0.0, S1+S2-2*S3) / np.sqrt( (S1X+S2X-2*S3X)*(S1Y+S2Y-2*S3Y) ))
+
+
+@njit(cache=True, nogil=True)
+def approx_wdcor(x, y, n_bins=32):
+    """Approximate distance correlation by binning arrays. Each array is cut
+    into n_bins equal width intervals and the weighted distance correlation of
+    the nonempty cells of their contingency table is computed, so the cost is
+    O(n + n_bins^3) instead of O(n^2)
+
+    NOTE: Code ported from R function approx.dcor at:
+        https://rdrr.io/cran/extracat/src/R/wdcor.R
+
+    Parameters
+    ----------
+    x : 1d array-like
+        Array of n elements
+
+    y : 1d array-like
+        Array of n elements
+
+    n_bins : int
+        Number of intervals for each array
+
+    Returns
+    -------
+    dcor : float
+        Distance correlation
+    """
+    cx, vx = bin_codes(x, n_bins)
+    cy, vy = bin_codes(y, n_bins)
+    return binned_dcor(contingency_table(cx, cy, len(vx), len(vy)), vx, vy)
 
 
 def c_wdcor(x, y, weights):
-    """Wrapper for C version of weighted distance correlation
+    """Wrapper for C version of weighted distance correlation. Arrays are
+    passed by pointer without copying when they are contiguous float64, and
+    py_wdcor is used if the C library is unavailable
 
     Parameters
     ----------
@@ -524,16 +1236,22 @@ def c_wdcor(x, y, weights):
     dcor : float
         Distance correlation
     """
-    n          = x.shape[0]
-    array_type = ctypes.c_double*n
-    return CFUNC_DCORS_DLL.wdcor(array_type(*x),
-                                 array_type(*y),
-                                 ctypes.c_int(n),
-                                 array_type(*weights))
+    x, y, weights = [np.ascontiguousarray(a, dtype=np.float64).ravel()
+                     for a in (x, y, weights)]
+    _check_lengths(x, y, weights)
+    if CFUNC_DCORS_DLL is None: return py_wdcor(x, y, weights)
+
+    result = ctypes.c_double()
+    status = CFUNC_DCORS_DLL.wdcor(x, y, x.shape[0], weights,
+                                   ctypes.byref(result))
+    if status: raise C_ERRORS.get(status, RuntimeError("C error %d" % status))
+    return result.value
 
 
 def c_dcor(x, y):
-    """Wrapper for C version of distance correlation
+    """Wrapper for C version of distance correlation. Arrays are passed by
+    pointer without copying when they are contiguous float64, and py_dcor is
+    used if the C library is unavailable
 
     Parameters
     ----------
@@ -548,11 +1266,14 @@ def c_dcor(x, y):
     dcor : float
         Distance correlation
     """
-    n          = x.shape[0]
-    array_type = ctypes.c_double*n
-    return CFUNC_DCORS_DLL.dcor(array_type(*x),
-                                array_type(*y),
-                                ctypes.c_int(n))
+    x, y = [np.ascontiguousarray(a, dtype=np.float64).ravel() for a in (x, y)]
+    _check_lengths(x, y)
+    if CFUNC_DCORS_DLL is None: return py_dcor(x, y)
+
+    result = ctypes.c_double()
+    status = CFUNC_DCORS_DLL.dcor(x, y, x.shape[0], ctypes.byref(result))
+    if status: raise C_ERRORS.get(status, RuntimeError("C error %d" % status))
+    return result.value
 
 
 #################################
@@ -599,7 +1320,65 @@ def mc_fast(x, y, n_classes):
     return np.sqrt(ssb/sst)
 
 
-def mi(x, y):
+@njit(cache=True, nogil=True, fastmath=True, parallel=True)
+def mc_matrix(X, y, n_classes):
+    """Multiple correlation between each column of X and y, computed for all
+    columns in one parallel call that shares the class sizes of y
+
+    Parameters
+    ----------
+    X : 2d array-like
+        Array of n samples and p features
+
+    y : 1d array-like
+        Array of n class indices, samples outside [0, n_classes) do not
+        belong to any group as in mc_fast
+
+    n_classes : int
+        Number of classes
+
+    Returns
+    -------
+    cor : 1d array-like
+        Multiple correlation coefficient for each of the p features
+    """
+    n, p = X.shape
+
+    # Label terms shared by all columns
+    codes  = np.full(n, -1, dtype=np.int64)
+    counts = np.zeros(n_classes)
+    for i in range(n):
+        if y[i] >= 0 and y[i] < n_classes and y[i] == int(y[i]):
+            codes[i]          = int(y[i])
+            counts[codes[i]] += 1.0
+
+    cor = np.zeros(p)
+    for j in prange(p):
+        mu, const = 0.0, True
+        for i in range(n):
+            mu += X[i, j]
+            if X[i, j] != X[0, j]: const = False
+        if const: continue
+        mu /= n
+
+        # Centered class sums so that large offsets do not cancel
+        sums, sst = np.zeros(n_classes), 0.0
+        for i in range(n):
+            dx   = X[i, j] - mu
+            sst += dx*dx
+            if codes[i] >= 0: sums[codes[i]] += dx
+        if sst <= 0.0: continue
+
+        # Sum of squares between, n_k*(mean_k - mu)^2 = sum_k^2/n_k
+        ssb = 0.0
+        for k in range(n_classes):
+            if counts[k] > 0: ssb += sums[k]*sums[k]/counts[k]
+        cor[j] = np.sqrt(min(ssb/sst, 1.0))
+
+    return cor
+
+
+def mi(x, y, random_state=None):
     """Mutual information
 
     Parameters
@@ -610,13 +1389,385 @@ def mi(x, y):
     y : 1d array-like
         Array of n elements
 
+    random_state : int
+        Seed of the noise scikit-learn adds to continuous features, None to
+        draw it from the global random number generator
+
     Returns
     -------
     info : float
         Mutual information between x and y
     """
     if x.ndim == 1: x = x.reshape(-1, 1)
-    return mutual_info_classif(x, y)[0]
+    return mutual_info_classif(x, y, random_state=random_state)[0]
+
+
+def mi_matrix(X, y, random_state=None):
+    """Mutual information between each column of X and y in one call of
+    scikit-learn's nearest neighbor estimator
+
+    Parameters
+    ----------
+    X : 2d array-like
+        Array of n samples and p features
+
+    y : 1d array-like
+        Array of n class labels
+
+    random_state : int
+        Sets seed for noise added to continuous features
+
+    Returns
+    -------
+    info : 1d array-like
+        Mutual information for each of the p features
+    """
+    return mutual_info_classif(X, y, random_state=random_state)
+
+
+####################################
+"""FEATURE SELECTORS: CATEGORICAL"""
+####################################
+
+def category_codes(x):
+    """Encodes categories of feature as consecutive integers
+
+    Parameters
+    ----------
+    x : 1d array-like
+        Array of n category codes
+
+    Returns
+    -------
+    codes : 1d array-like
+        Array of n integers in [0, n_levels)
+
+    n_levels : int
+        Number of distinct categories
+    """
+    levels, codes = np.unique(x, return_inverse=True)
+    return codes.ravel().astype(np.int64), len(levels)
+
+
+@njit(cache=True, nogil=True, fastmath=True)
+def contingency_table(x, y, n_levels, n_classes):
+    """Contingency table of two integer coded arrays
+
+    Parameters
+    ----------
+    x : 1d array-like
+        Array of n integers in [0, n_levels)
+
+    y : 1d array-like
+        Array of n integers in [0, n_classes)
+
+    n_levels : int
+        Number of categories of x
+
+    n_classes : int
+        Number of classes of y
+
+    Returns
+    -------
+    table : 2d array-like
+        Array of counts with n_levels rows and n_classes columns
+    """
+    table = np.zeros((n_levels, n_classes))
+    for i in range(x.shape[0]): table[x[i], y[i]] += 1.0
+    return table
+
+
+@njit(cache=True, nogil=True, fastmath=True)
+def chi2_stat(x, y, n_levels, n_classes):
+    """Pearson chi-square statistic of independence between two integer coded
+    arrays. Empty rows and columns of the contingency table are ignored
+
+    Parameters
+    ----------
+    x : 1d array-like
+        Array of n integers in [0, n_levels)
+
+    y : 1d array-like
+        Array of n integers in [0, n_classes)
+
+    n_levels : int
+        Number of categories of x
+
+    n_classes : int
+        Number of classes of y
+
+    Returns
+    -------
+    stat : float
+        Chi-square statistic
+    """
+    table      = contingency_table(x, y, n_levels, n_classes)
+    n          = x.shape[0]
+    rows, cols = table.sum(axis=1), table.sum(axis=0)
+
+    stat = 0.0
+    for i in range(n_levels):
+        if rows[i] == 0: continue
+        for j in range(n_classes):
+            if cols[j] == 0: continue
+            e     = rows[i]*cols[j]/n
+            stat += (table[i, j]-e)*(table[i, j]-e)/e
+    return stat
+
+
+@njit(cache=True, nogil=True, fastmath=True)
+def cramers_v(x, y, n_levels, n_classes):
+    """Cramer's V association between two integer coded arrays
+
+    Parameters
+    ----------
+    x : 1d array-like
+        Array of n integers in [0, n_levels)
+
+    y : 1d array-like
+        Array of n integers in [0, n_classes)
+
+    n_levels : int
+        Number of categories of x
+
+    n_classes : int
+        Number of classes of y
+
+    Returns
+    -------
+    v : float
+        Cramer's V in [0, 1]
+    """
+    k = min(n_levels, n_classes) - 1
+    if k < 1: return 0.0
+    return min(1.0, np.sqrt(chi2_stat(x, y, n_levels, n_classes)/(x.shape[0]*k)))
+
+
+###############################
+"""FEATURE SELECTORS: LINEAR"""
+###############################
+
+def linear_statistic(X, H):
+    """Quadratic form of the Strasser-Weber linear statistic of each column
+    of X with the influence function H of the label, standardized by its
+    conditional expectation and covariance under permutation
+
+    NOTE: Follows the quadratic test statistic of R's partykit/coin:
+        Strasser and Weber (1999), On the asymptotic theory of permutation
+        statistics
+
+    Parameters
+    ----------
+    X : 2d array-like
+        Array of n samples and k features
+
+    H : 2d array-like
+        Array of n samples and q influence values, for example one hot
+        encoded classes or the label itself
+
+    Returns
+    -------
+    c : 1d array-like
+        Quadratic statistic of each column, 0 for constant columns
+
+    df : int
+        Degrees of freedom of asymptotic chi-square distribution, the rank of
+        the covariance of H
+    """
+    n  = X.shape[0]
+    Hc = H - H.mean(axis=0)
+    Xc = X - X.mean(axis=0)
+
+    # Covariance of influence function and variance factor of each column
+    V   = np.dot(Hc.T, Hc)/n
+    Vp  = np.linalg.pinv(V, hermitian=True)
+    df  = np.linalg.matrix_rank(V, hermitian=True)
+    s   = n*np.sum(Xc*Xc, axis=0)/(n - 1.0)
+
+    # Linear statistic minus its expectation is the centered cross product
+    D = np.dot(Xc.T, Hc)
+    c = np.einsum('jq,qr,jr->j', D, Vp, D)
+    c = np.where(s > 0, c/np.where(s > 0, s, 1.0), 0.0)
+    return c, int(df)
+
+
+#############################
+"""FEATURE SELECTORS: RANK"""
+#############################
+
+def spearman(x, y):
+    """Spearman correlation, Pearson correlation of average ranks
+
+    Parameters
+    ----------
+    x : 1d array-like
+        Array of n elements
+
+    y : 1d array-like
+        Array of n elements
+
+    Returns
+    -------
+    cor : float
+        Spearman correlation
+    """
+    return pcor(rank(x), rank(y))
+
+
+@njit(cache=True, nogil=True, fastmath=True)
+def kruskal_stat(r, y, n_classes):
+    """Kruskal-Wallis statistic of ranks grouped by class, without correction
+    for ties
+
+    Parameters
+    ----------
+    r : 1d array-like
+        Array of n ranks in [1, n]
+
+    y : 1d array-like
+        Array of n integers in [0, n_classes)
+
+    n_classes : int
+        Number of classes
+
+    Returns
+    -------
+    H : float
+        Kruskal-Wallis statistic
+    """
+    n      = r.shape[0]
+    counts = np.zeros(n_classes)
+    sums   = np.zeros(n_classes)
+    for i in range(n):
+        counts[y[i]] += 1.0
+        sums[y[i]]   += r[i]
+
+    H = 0.0
+    for k in range(n_classes):
+        if counts[k] > 0: H += sums[k]*sums[k]/counts[k]
+    return 12.0*H/(n*(n+1.0)) - 3.0*(n+1.0)
+
+
+###############################
+"""FEATURE SELECTORS: KERNEL"""
+###############################
+
+def rff_features(x, n_fourier=20, random_state=None):
+    """Random Fourier features of a Gaussian kernel on the standardized
+    feature, centered so that cross products are kernel covariances
+
+    NOTE: Based on Rahimi and Recht (2007), Random features for large-scale
+        kernel machines. The unit bandwidth on standardized data is close to
+        the median heuristic
+
+    Parameters
+    ----------
+    x : 1d array-like
+        Array of n elements
+
+    n_fourier : int
+        Number of random Fourier features
+
+    random_state : int or RandomState
+        Sets seed for random frequencies and phases
+
+    Returns
+    -------
+    F : 2d array-like
+        Array of n samples and n_fourier centered features, all zero for a
+        constant feature
+    """
+    rng = random_state if isinstance(random_state, np.random.RandomState) \
+        else np.random.RandomState(random_state)
+    w   = rng.randn(n_fourier)
+    b   = rng.uniform(0, 2*np.pi, n_fourier)
+
+    x  = np.asarray(x, dtype=float)
+    sd = x.std()
+    if sd == 0: return np.zeros((x.shape[0], n_fourier))
+
+    F = np.sqrt(2.0/n_fourier)*np.cos(np.outer((x - x.mean())/sd, w) + b)
+    return F - F.mean(axis=0)
+
+
+def label_features(y, n_classes):
+    """Centered one hot encoding of class labels, the feature map of the
+    delta kernel
+
+    Parameters
+    ----------
+    y : 1d array-like
+        Array of n integers in [0, n_classes)
+
+    n_classes : int
+        Number of classes
+
+    Returns
+    -------
+    F : 2d array-like
+        Array of n samples and n_classes centered features
+    """
+    F = np.zeros((y.shape[0], n_classes))
+    F[np.arange(y.shape[0]), y.astype(np.int64)] = 1.0
+    return F - F.mean(axis=0)
+
+
+def hsic_from_features(Fx, Fy):
+    """Normalized Hilbert-Schmidt independence criterion from centered
+    feature maps, HSIC(x, y)/sqrt(HSIC(x, x)*HSIC(y, y))
+
+    Parameters
+    ----------
+    Fx : 2d array-like
+        Array of n samples and p centered features
+
+    Fy : 2d array-like
+        Array of n samples and q centered features
+
+    Returns
+    -------
+    hsic : float
+        Normalized HSIC in [0, 1], 0 when either feature map is constant
+    """
+    sxy = np.sum(np.dot(Fx.T, Fy)**2)
+    sxx = np.sum(np.dot(Fx.T, Fx)**2)
+    syy = np.sum(np.dot(Fy.T, Fy)**2)
+    if sxx == 0 or syy == 0: return 0.0
+    return sxy/np.sqrt(sxx*syy)
+
+
+def rff_hsic(x, y, n_fourier=20, n_classes=None, random_state=None):
+    """Normalized Hilbert-Schmidt independence criterion with Gaussian
+    kernels approximated by random Fourier features, O(n*n_fourier)
+
+    Parameters
+    ----------
+    x : 1d array-like
+        Array of n elements
+
+    y : 1d array-like
+        Array of n elements
+
+    n_fourier : int
+        Number of random Fourier features of each variable
+
+    n_classes : int
+        Number of classes if y holds class labels, which then use the delta
+        kernel. None for a continuous y
+
+    random_state : int
+        Sets seed for random frequencies and phases
+
+    Returns
+    -------
+    hsic : float
+        Normalized HSIC in [0, 1]
+    """
+    rng = np.random.RandomState(random_state)
+    Fx  = rff_features(x, n_fourier, rng)
+    Fy  = label_features(y, n_classes) if n_classes is not None \
+        else rff_features(y, n_fourier, rng)
+    return hsic_from_features(Fx, Fy)
 
 
 ###############################
@@ -659,6 +1810,57 @@ def gini_index(y, labels):
     # Gini index
     return 1 - gini
 
+
+@njit(cache=True, nogil=True, fastmath=True)
+def table_split_gini(codes, y, n_levels, n_classes):
+    """Best split of low cardinality feature for Gini index using a table of
+    class counts for each distinct value
+
+    Parameters
+    ----------
+    codes : 1d array-like
+        Array of n integers in [0, n_levels) coding sorted distinct values
+
+    y : 1d array-like
+        Array of n class indices
+
+    n_levels : int
+        Number of distinct values
+
+    n_classes : int
+        Number of classes
+
+    Returns
+    -------
+    best : int
+        Last distinct value sent to left child, -1 if there is no split
+
+    impurities : 1d array-like
+        Gini index of node, left child and right child
+    """
+    table = contingency_table(codes, y, n_levels, n_classes)
+    total = table.sum(axis=0)
+    n     = total.sum()
+    node  = 1.0 - np.sum((total/n)*(total/n))
+
+    best, best_imp = -1, np.inf
+    impurities     = np.array([node, 0.0, 0.0])
+    left, n_left   = np.zeros(n_classes), 0.0
+    for l in range(n_levels-1):
+        left   += table[l]
+        n_left += table[l].sum()
+        right   = total - left
+        n_right = n - n_left
+        gl      = 1.0 - np.sum((left/n_left)*(left/n_left))
+        gr      = 1.0 - np.sum((right/n_right)*(right/n_right))
+        imp     = (n_left*gl + n_right*gr)/n
+        if imp < best_imp:
+            best, best_imp = l, imp
+            impurities[1], impurities[2] = gl, gr
+
+    return best, impurities
+
+
 #################################
 """SPLIT SELECTORS: CONTINUOUS"""
 #################################
@@ -679,3 +1881,58 @@ def mse(y):
     """
     mu = y.mean()
     return np.mean((y-mu)*(y-mu))
+
+
+@njit(cache=True, nogil=True, fastmath=True)
+def table_split_mse(codes, y, n_levels):
+    """Best split of low cardinality feature for mean squared error using a
+    table of counts, sums and sums of squares for each distinct value
+
+    Parameters
+    ----------
+    codes : 1d array-like
+        Array of n integers in [0, n_levels) coding sorted distinct values
+
+    y : 1d array-like
+        Array of n labels
+
+    n_levels : int
+        Number of distinct values
+
+    Returns
+    -------
+    best : int
+        Last distinct value sent to left child, -1 if there is no split
+
+    impurities : 1d array-like
+        Mean squared error of node, left child and right child
+    """
+    # Center labels for numerical stability
+    y   = y - y.mean()
+    cnt = np.zeros(n_levels)
+    sm  = np.zeros(n_levels)
+    sq  = np.zeros(n_levels)
+    for i in range(y.shape[0]):
+        cnt[codes[i]] += 1.0
+        sm[codes[i]]  += y[i]
+        sq[codes[i]]  += y[i]*y[i]
+
+    n, s, q = cnt.sum(), sm.sum(), sq.sum()
+    node    = q/n - (s/n)*(s/n)
+
+    best, best_imp = -1, np.inf
+    impurities     = np.array([node, 0.0, 0.0])
+    nl, sl, ql     = 0.0, 0.0, 0.0
+    for l in range(n_levels-1):
+        nl += cnt[l]
+        sl += sm[l]
+        ql += sq[l]
+        nr  = n - nl
+        el  = ql/nl - (sl/nl)*(sl/nl)
+        er  = (q-ql)/nr - ((s-sl)/nr)*((s-sl)/nr)
+        imp = (nl*el + nr*er)/n
+        if imp < best_imp:
+            best, best_imp = l, imp
+            impurities[1], impurities[2] = el, er
+
+    return best, impurities
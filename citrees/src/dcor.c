@@ -1,14 +1,31 @@
 #include <math.h>
-#include <stdio.h>
+#include <stdint.h>
 #include <stdlib.h>
+#ifdef _OPENMP
+#include <omp.h>
+#endif
 
-/* 
+/*
 Compiling example:
-    gcc -Ofast -march=native -ffast-math -fPIC -shared -o dcor.so dcor.c
+    gcc -Ofast -march=native -ffast-math -fopenmp -fPIC -shared -o dcor.so dcor.c
+
+Omit -fopenmp to build a single threaded library.
 */
 
-double wdcor(double* x, double* y, int n, double* w) {
-    /* Distance correlation allowing weights
+// Error codes returned by the exported functions
+#define DCOR_OK     0   // Success
+#define DCOR_EINVAL 1   // Null pointer or fewer than 2 samples
+#define DCOR_ENOMEM 2   // Memory allocation failed
+
+
+static int dcor_kernel(const double* x, const double* y, const double* w,
+                       int64_t n, double* result) {
+    /* Distance correlation with optional weights, shared by dcor and wdcor
+
+    Pairwise distances are accumulated as they are computed so only the row
+    sums of the distance matrices are stored. With OpenMP the outer loop is
+    split across threads and each thread accumulates row sums in its own
+    buffer, so memory is O(n) per thread
 
     Parameters
     ----------
@@ -18,91 +35,98 @@ double wdcor(double* x, double* y, int n, double* w) {
     y : 1d double array pointer
         Pointer to array of length n
 
-    n : int
+    w : 1d double array pointer
+        Pointer to array of weights that sum to 1, NULL for equal weights
+
+    n : int64
         Number of samples
 
-    w : 1d double array pointer
-        Pointer to array of weights that sum to 1
+    result : double pointer
+        Receives distance correlation
 
     Returns
     -------
-    wdcor : float
-        Weighted distance correlation
+    status : int
+        DCOR_OK on success, otherwise error code
     */
-   // Initialize integers and doubles
-    int i, j, k;
-    int s      = n*(n-1)/2;
-    double S1  = 0;
-    double S2  = 0;
-    double S3  = 0;
-    double S2a = 0;
-    double S2b = 0;
-    double S1X = 0;
-    double S1Y = 0;
-    double S2X = 0;
-    double S2Y = 0;
-    double S3X = 0;
-    double S3Y = 0;
-
-    // Allocate memory for arrays  
-    double *DMY = calloc(s, sizeof(double));
-    if (DMY == NULL)
-    {
-        printf("Error allocating memory for DMY. \n");
-        exit(1);
-    }
-
-    double *DMX = calloc(s, sizeof(double));
-    if (DMX == NULL)
-    {
-        printf("Error allocating memory for DMX. \n");
-        exit(1);
-    }
-
-    double *F = calloc(s, sizeof(double));
-    if (F == NULL)
+    int64_t i, t;
+    int     n_threads = 1;
+    double  S1  = 0;
+    double  S2  = 0;
+    double  S3  = 0;
+    double  S2a = 0;
+    double  S2b = 0;
+    double  S1X = 0;
+    double  S1Y = 0;
+    double  S2X = 0;
+    double  S2Y = 0;
+    double  S3X = 0;
+    double  S3Y = 0;
+
+    if (x == NULL || y == NULL || result == NULL || n < 2) return DCOR_EINVAL;
+
+#ifdef _OPENMP
+    n_threads = omp_get_max_threads();
+#endif
+
+    // Row sums of both distance matrices for each thread
+    double *Ed = calloc((size_t) (2*n*n_threads), sizeof(double));
+    if (Ed == NULL) return DCOR_ENOMEM;
+
+    #pragma omp parallel num_threads(n_threads) reduction(+:S1,S1X,S1Y)
     {
-        printf("Error allocating memory for F. \n");
-        exit(1);
+        int64_t i, j;
+        int     tid = 0;
+#ifdef _OPENMP
+        tid = omp_get_thread_num();
+#endif
+        double *Edx = Ed + 2*n*tid;
+        double *Edy = Edx + n;
+
+        // Rows get shorter so hand them out in small chunks
+        #pragma omp for schedule(dynamic, 64)
+        for (i=0; i<n-1; i++) {
+            double wi = (w == NULL) ? 1.0 : w[i];
+            double ex = 0;
+            double ey = 0;
+            for (j=i+1; j<n; j++) {
+                double wj = (w == NULL) ? 1.0 : w[j];
+                double dx = fabs(x[i]-x[j]);
+                double dy = fabs(y[i]-y[j]);
+                double f  = wi*wj;
+                S1     += dx*dy*f;
+                S1X    += dx*dx*f;
+                S1Y    += dy*dy*f;
+                ex     += dx*wj;
+                ey     += dy*wj;
+                Edx[j] += dx*wi;
+                Edy[j] += dy*wi;
+            }
+            Edx[i] += ex;
+            Edy[i] += ey;
+        }
     }
 
-    // Allocate other data structures
-    double Edx[n], Edy[n];
-    for (i=0; i<n; i++) Edx[i] = Edy[i] = 0;
-
-    // Begin calculations
-    k = 0;
-    for (i=0; i<n-1; i++) {
-        for (j=i+1; j<n; j++) {
-
-            // Distance matrices
-            DMX[k]  = fabs(x[i]-x[j]);
-            DMY[k]  = fabs(y[i]-y[j]);
-            F[k]    = w[i]*w[j];
-            S1     += DMX[k]*DMY[k]*F[k];
-            S1X    += DMX[k]*DMX[k]*F[k];
-            S1Y    += DMY[k]*DMY[k]*F[k];
-            Edx[i] += DMX[k]*w[j];
-            Edy[j] += DMY[k]*w[i];
-            Edx[j] += DMX[k]*w[i];
-            Edy[i] += DMY[k]*w[j];
-            k++;
+    // Combine row sums of all threads into first buffer
+    double *Edx = Ed;
+    double *Edy = Ed + n;
+    for (t=1; t<n_threads; t++) {
+        for (i=0; i<n; i++) {
+            Edx[i] += Ed[2*n*t + i];
+            Edy[i] += Ed[2*n*t + n + i];
         }
     }
 
-    // Free dynamically allocated memory
-    free(DMY);
-    free(DMX);
-    free(F);
-
     // Means
     for (i=0; i<n; i++) {
-        S3  += Edx[i]*Edy[i]*w[i];
-        S2a += Edy[i]*w[i]; 
-        S2b += Edx[i]*w[i];
-        S3X += Edx[i]*Edx[i]*w[i];
-        S3Y += Edy[i]*Edy[i]*w[i];
+        double wi = (w == NULL) ? 1.0 : w[i];
+        S3  += Edx[i]*Edy[i]*wi;
+        S2a += Edy[i]*wi;
+        S2b += Edx[i]*wi;
+        S3X += Edx[i]*Edx[i]*wi;
+        S3Y += Edy[i]*Edy[i]*wi;
     }
+    free(Ed);
 
     // Variance and covariance terms
     S1  = 2*S1;
@@ -112,18 +136,36 @@ double wdcor(double* x, double* y, int n, double* w) {
     S2X = S2b*S2b;
     S2Y = S2a*S2a;
 
+    // Equal weights of 1/n, applied once here instead of to every pair
+    if (w == NULL) {
+        double n2 = (double) n*n;
+        double n3 = n2*n;
+        double n4 = n3*n;
+        S1  /= n2;
+        S1X /= n2;
+        S1Y /= n2;
+        S2  /= n4;
+        S2X /= n4;
+        S2Y /= n4;
+        S3  /= n3;
+        S3X /= n3;
+        S3Y /= n3;
+    }
+
     // Calculate result
-    if (S1X == 0 || S2X == 0 || S3X == 0 || S1Y == 0 || S2Y == 0 || S3Y == 0){
-        return 0.0;
+    if (S1X == 0 || S2X == 0 || S3X == 0 || S1Y == 0 || S2Y == 0 || S3Y == 0) {
+        *result = 0.0;
     } else {
-        return pow((S1+S2-2*S3)/pow((S1X+S2X-2*S3X)*(S1Y+S2Y-2*S3Y), 0.5), 0.5);
-
+        double num = S1+S2-2*S3;
+        *result = sqrt((num > 0 ? num : 0)/sqrt((S1X+S2X-2*S3X)*(S1Y+S2Y-2*S3Y)));
     }
+    return DCOR_OK;
 }
 
 
-double dcor(double* x, double* y, int n) {
-    /* Distance correlation
+int wdcor(const double* x, const double* y, int64_t n, const double* w,
+          double* result) {
+    /* Distance correlation allowing weights
 
     Parameters
     ----------
@@ -133,107 +175,62 @@ double dcor(double* x, double* y, int n) {
     y : 1d double array pointer
         Pointer to array of length n
 
-    n : int
+    n : int64
         Number of samples
 
+    w : 1d double array pointer
+        Pointer to array of weights that sum to 1
+
+    result : double pointer
+        Receives weighted distance correlation
+
     Returns
     -------
-    dcor : float
-        Distance correlation
+    status : int
+        DCOR_OK on success, otherwise error code
     */
-    // Initialize integers and doubles
-    int i, j, k;
-    int s      = n*(n-1)/2;
-    long n2    = n*n;   // These numbers can blow up quick so keep as long type
-    long n3    = n2*n;
-    long n4    = n3*n;
-    double S1  = 0;
-    double S2  = 0;
-    double S3  = 0;
-    double S2a = 0;
-    double S2b = 0;
-    double S1X = 0;
-    double S1Y = 0;
-    double S2X = 0;
-    double S2Y = 0;
-    double S3X = 0;
-    double S3Y = 0;
-
-    // Allocate memory for arrays  
-    double *DMY = calloc(s, sizeof(double));
-    if (DMY == NULL)
-    {
-        printf("Error allocating memory for DMY. \n");
-        exit(1);
-    }
+    if (w == NULL) return DCOR_EINVAL;
+    return dcor_kernel(x, y, w, n, result);
+}
 
-    double *DMX = calloc(s, sizeof(double));
-    if (DMX == NULL)
-    {
-        printf("Error allocating memory for DMX. \n");
-        exit(1);
-    }
 
-    double *F = calloc(s, sizeof(double));
-    if (F == NULL)
-    {
-        printf("Error allocating memory for F. \n");
-        exit(1);
-    }
+int dcor(const double* x, const double* y, int64_t n, double* result) {
+    /* Distance correlation
 
-    // Allocate other data structures
-    double Edx[n], Edy[n];
-    for (i=0; i<n; i++) Edx[i] = Edy[i] = 0;
-
-    // Begin calculations
-    k = 0;
-    for (i=0; i<n-1; i++) {
-        for (j=i+1; j<n; j++) {
-
-            // Distance matrices
-            DMX[k]  = fabs(x[i]-x[j]);
-            DMY[k]  = fabs(y[i]-y[j]);
-            S1     += DMX[k]*DMY[k];
-            S1X    += DMX[k]*DMX[k];
-            S1Y    += DMY[k]*DMY[k];
-            Edx[i] += DMX[k];
-            Edy[j] += DMY[k];
-            Edx[j] += DMX[k];
-            Edy[i] += DMY[k];
-            k++;
-        }
-    }
+    Parameters
+    ----------
+    x : 1d double array pointer
+        Pointer to array of length n
 
-    // Free dynamically allocated memory
-    free(DMY);
-    free(DMX);
-    free(F);
+    y : 1d double array pointer
+        Pointer to array of length n
 
-    // Means
-    for (i=0; i<n; i++) {
-        S3  += Edx[i]*Edy[i];
-        S2a += Edy[i]; 
-        S2b += Edx[i];
-        S3X += Edx[i]*Edx[i];
-        S3Y += Edy[i]*Edy[i];
-    }
+    n : int64
+        Number of samples
 
-    // Variance and covariance terms
-    S1   = (2*S1)/n2;
-    S1Y  = (2*S1Y)/n2;
-    S1X  = (2*S1X)/n2;
-    S2   = (S2a*S2b)/n4;
-    S2X  = (S2b*S2b)/n4;
-    S2Y  = (S2a*S2a)/n4;
-    S3  /= n3;
-    S3X /= n3;
-    S3Y /= n3;
+    result : double pointer
+        Receives distance correlation
 
-    // Calculate result
-    if (S1X == 0 || S2X == 0 || S3X == 0 || S1Y == 0 || S2Y == 0 || S3Y == 0){
-        return 0.0;
-    } else {
-        return pow((S1+S2-2*S3)/pow((S1X+S2X-2*S3X)*(S1Y+S2Y-2*S3Y), 0.5), 0.5);
+    Returns
+    -------
+    status : int
+        DCOR_OK on success, otherwise error code
+    */
+    return dcor_kernel(x, y, NULL, n, result);
+}
 
-    }
+
+int has_openmp(void) {
+    /* Whether library was compiled with OpenMP
+
+    Returns
+    -------
+    flag : int
+        1 if compiled with OpenMP, 0 otherwise
+    */
+#ifdef _OPENMP
+    return 1;
+#else
+    return 0;
+#endif
 }
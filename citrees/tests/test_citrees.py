@@ -1,5 +1,6 @@
 from __future__ import absolute_import, division, print_function
 
+from concurrent.futures import ThreadPoolExecutor
 import numpy as np
 from os.path import abspath, dirname
 import sys
@@ -9,10 +10,16 @@ import unittest
 PATH = dirname(dirname(abspath(__file__)))
 if PATH not in sys.path: sys.path.append(PATH)
 
+from feature_selectors import (permutation_test_dcor, permutation_test_mc,
+                               permutation_test_mi, permutation_test_pcor,
+                               spearman_test)
 from citrees import (balanced_sampled_idx, balanced_unsampled_idx, 
                      normal_sampled_idx, normal_unsampled_idx,
                      stratify_sampled_idx, stratify_unsampled_idx, 
-                     CIForestClassifier, CITreeClassifier)
+                     CIForestClassifier, CIForestRegressor, CITreeClassifier,
+                     CITreeRegressor, FeatureMask)
+from scorers import CFUNC_DCORS_DLL, mc_fast, mi, pcor, py_dcor, rank
+from utils import Dataset, NULL_CACHE
 
 class TestClassificationTrees(unittest.TestCase):
 
@@ -41,6 +48,385 @@ class TestClassificationTrees(unittest.TestCase):
         self.assertEqual(acc, 1.0, msg=msg)
 
 
+    def test_max_test_samples(self):
+        """Test for permutation tests on subsamples of large nodes"""
+
+        # Selection on subsamples should still separate classes
+        clf = CITreeClassifier(max_test_samples=50,
+                               random_state=1718).fit(self.X, self.y)
+        acc = clf.score(self.X, self.y)
+        msg = "Accuracy for CITreeClassifier with max_test_samples (%.2f) " \
+              "should be 1.0 for simple toy data" % acc
+        self.assertEqual(acc, 1.0, msg=msg)
+
+        with self.assertRaises(ValueError):
+            CITreeClassifier(max_test_samples=0)
+
+        # Muting on the subsample should not carry over to the subtree
+        rng      = np.random.RandomState(1718)
+        X        = np.column_stack([self.X, rng.randn(self.n, 2)])
+        clf      = CITreeClassifier(max_test_samples=50, max_depth=2,
+                                    random_state=1718)
+        n_avail  = []
+
+        def selector(X, y, col_idx, mask):
+            """Selects first column and mutes others as if p-values were 1"""
+            n_avail.append(mask.n_available)
+            for col in col_idx[1:]: mask = mask.mute(col)
+            return col_idx[0], 0.0, mask
+
+        clf._selector = selector
+        clf.fit(X, self.y)
+        msg = "Features muted on a subsample should stay available in subtree"
+        self.assertEqual(n_avail[1], 3, msg=msg)
+
+
+    def test_splitter(self):
+        """Test for splits on sort of features cached at the root"""
+
+        rng  = np.random.RandomState(1718)
+        X    = np.column_stack([rng.randn(self.n).round(1), self.X])
+        rows = rng.choice(self.n, size=200, replace=False)
+        y    = X[:, 0] + .1*rng.randn(self.n)
+        for est, labels in [(CITreeClassifier, self.y), (CITreeRegressor, y)]:
+            tree = est(random_state=1718).fit(X, labels)
+            tree.feature_importances_ = np.zeros(2)
+            for col in range(2):
+                tree._data = Dataset(X)
+                cached     = tree._splitter(X[rows], labels[rows], 200, col,
+                                            rows=rows)
+                tree._data = None
+                sorted_    = tree._splitter(X[rows], labels[rows], 200, col)
+
+                msg = "Cached sort should give the same split as sorting node"
+                self.assertEqual(cached[:2], sorted_[:2], msg=msg)
+                for child, other in zip(cached[2:], sorted_[2:]):
+                    np.testing.assert_array_equal(child[0], other[0])
+                    np.testing.assert_array_equal(child[0], X[child[2]])
+                    np.testing.assert_array_equal(child[1], labels[child[2]])
+
+                msg = "Threshold should be a midpoint of distinct node values"
+                x   = np.unique(X[rows, col])
+                self.assertIn(cached[1], (x[1:] + x[:-1])/2., msg=msg)
+
+            msg = "Buffers of the build should be released after fit"
+            self.assertIsNone(tree._split_buffers, msg=msg)
+
+
+    def test_prescreen(self):
+        """Test for ordering columns by raw statistic before testing"""
+
+        # Informative feature placed last among noise features
+        rng = np.random.RandomState(1718)
+        X   = np.column_stack([rng.randn(self.n, 3), self.X])
+        clf = CITreeClassifier(prescreen=True, early_stopping=True,
+                               random_state=1718).fit(X, self.y)
+
+        msg = "Prescreen should test informative feature first"
+        self.assertEqual(clf._prescreen(X, self.y, [0, 1, 2, 3])[0], 3, msg=msg)
+
+        acc = clf.score(X, self.y)
+        msg = "Accuracy for CITreeClassifier with prescreen (%.2f) should be " \
+              "1.0 for simple toy data" % acc
+        self.assertEqual(acc, 1.0, msg=msg)
+
+
+    def test_racing(self):
+        """Test for racing permutation tests across columns"""
+
+        # Informative feature among noise features
+        rng = np.random.RandomState(1718)
+        X   = np.column_stack([rng.randn(self.n, 3), self.X])
+        clf = CITreeClassifier(racing=True, random_state=1718).fit(X, self.y)
+
+        acc = clf.score(X, self.y)
+        msg = "Accuracy for CITreeClassifier with racing (%.2f) should be " \
+              "1.0 for simple toy data" % acc
+        self.assertEqual(acc, 1.0, msg=msg)
+
+        msg = "Racing should select informative feature at root"
+        self.assertEqual(clf.root.col, 3, msg=msg)
+
+        # Selected column runs every permutation, so its p-value and pruned
+        # trees do not depend on the alpha used to fit
+        rng  = np.random.RandomState(4)
+        X    = rng.randn(200, 3)
+        y    = (.12*X[:, 0] + rng.randn(200) > 0).astype(int)
+        kw   = dict(racing=True, muting=False, early_stopping=False,
+                    random_state=5)
+        tree = CITreeClassifier(alpha=.95, **kw).fit(X, y)
+        for alpha in [.05, .2]:
+            refit = CITreeClassifier(alpha=alpha, **kw).fit(X, y)
+            msg   = "Racing p-value at root should not depend on alpha"
+            self.assertEqual(tree.root.col_pval, refit.root.col_pval, msg=msg)
+            msg   = "Pruned racing tree at alpha = %.2f does not match " \
+                    "refit" % alpha
+            self.assertTrue(np.allclose(tree.prune(alpha).predict_proba(X),
+                                        refit.predict_proba(X)), msg=msg)
+
+        # Hybrid selector is not supported
+        with self.assertRaises(ValueError):
+            CITreeClassifier(selector='hybrid', racing=True)
+
+
+    def test_hybrid(self):
+        """Test for hybrid selectors reusing observed statistics"""
+
+        # Features of varying strength so significant p-values are not tied
+        rng = np.random.RandomState(1718)
+        X   = rng.randn(200, 4)
+        y   = X.dot([.05, .2, 0, .1]) + rng.randn(200)
+        kw  = dict(selector='hybrid', n_permutations=200, muting=False,
+                   early_stopping=False, random_state=1718)
+
+        def pvalue(x, y, classes):
+            """Hybrid p-value as computed before statistics were reused"""
+            if classes:
+                if mc_fast(x, y, 2) >= mi(x, y, 1718):
+                    return permutation_test_mc(x, y, B=200, n_classes=2,
+                                               random_state=1718)
+                return permutation_test_mi(x, y, B=200, random_state=1718)
+            if abs(pcor(x, y)) >= abs(py_dcor(x, y)):
+                return permutation_test_pcor(x, y, B=200, random_state=1718)
+            return permutation_test_dcor(x, y, B=200, random_state=1718)
+
+        for Tree, y_ in [(CITreeClassifier, (y > 0).astype(int)),
+                         (CITreeRegressor, y)]:
+            classes = Tree is CITreeClassifier
+            pvals   = [pvalue(X[:, j], y_, classes) for j in range(4)]
+            trees   = [Tree(prescreen=prescreen, **kw).fit(X, y_)
+                       for prescreen in [False, True]]
+
+            # Root matches the selection made without reused statistics
+            for tree in trees:
+                msg = "%s hybrid root does not match the reference" % \
+                      Tree.__name__
+                self.assertEqual(tree.root.col, np.argmin(pvals), msg=msg)
+                self.assertEqual(tree.root.col_pval, min(pvals), msg=msg)
+
+            # Prescreen only changes the order columns are tested in
+            msg = "%s hybrid tree changed with prescreen" % Tree.__name__
+            self.assertTrue(np.array_equal(trees[0].predict(X),
+                                           trees[1].predict(X)), msg=msg)
+            self.assertTrue(np.allclose(trees[0].feature_importances_,
+                                        trees[1].feature_importances_), msg=msg)
+
+
+    def test_kruskal(self):
+        """Test for rank based selector with cached null distributions"""
+
+        # Informative feature among noise features
+        rng = np.random.RandomState(1718)
+        X   = np.column_stack([rng.randn(self.n, 3), self.X])
+        clf = CITreeClassifier(selector='kruskal',
+                               random_state=1718).fit(X, self.y)
+
+        acc = clf.score(X, self.y)
+        msg = "Accuracy for CITreeClassifier with kruskal selector (%.2f) " \
+              "should be 1.0 for simple toy data" % acc
+        self.assertEqual(acc, 1.0, msg=msg)
+
+
+    def test_spearman(self):
+        """Test for rank based regression selector with cached null
+        distributions"""
+
+        # Monotone nonlinear signal among noise features
+        rng = np.random.RandomState(1718)
+        X   = rng.randn(200, 4)
+        y   = np.exp(2*X[:, 2]) + .1*rng.randn(200)
+        reg = CITreeRegressor(selector='spearman',
+                              random_state=1718).fit(X, y)
+
+        msg = "Spearman selector should select feature 2 at root"
+        self.assertEqual(reg.root.col, 2, msg=msg)
+
+        # Without ties the null distribution comes from the cache
+        NULL_CACHE.clear()
+        p = spearman_test(X[:, 0], y, B=50)
+        self.assertEqual(len(NULL_CACHE), 1)
+        self.assertEqual(spearman_test(X[:, 0], y, B=50), p)
+
+        # With ties ranks are permuted directly and the cache is bypassed
+        x   = np.round(X[:, 0])
+        p   = spearman_test(x, y, B=50, random_state=1718)
+        p_B = permutation_test_pcor(rank(x), rank(y), B=50, random_state=1718)
+        msg = "Spearman p-value with ties (%.2f) should equal permutation " \
+              "p-value of ranks (%.2f)" % (p, p_B)
+        self.assertEqual(p, p_B, msg=msg)
+        self.assertEqual(len(NULL_CACHE), 1)
+
+
+    def test_linear(self):
+        """Test for permutation free linear statistic selector"""
+
+        # Informative feature among noise features
+        rng = np.random.RandomState(1718)
+        X   = np.column_stack([rng.randn(self.n, 3), self.X])
+        clf = CITreeClassifier(selector='linear',
+                               random_state=1718).fit(X, self.y)
+
+        acc = clf.score(X, self.y)
+        msg = "Accuracy for CITreeClassifier with linear selector (%.2f) " \
+              "should be 1.0 for simple toy data" % acc
+        self.assertEqual(acc, 1.0, msg=msg)
+
+        msg = "Linear selector should select informative feature at root"
+        self.assertEqual(clf.root.col, 3, msg=msg)
+
+        with self.assertRaises(ValueError):
+            CITreeClassifier(selector='linear', racing=True)
+
+
+    def test_feature_mask(self):
+        """Test for per subtree feature muting with FeatureMask"""
+
+        mask  = FeatureMask(70)
+        muted = mask.mute(3).protect(5).mute(5)
+
+        msg = "Muting should return new mask and leave original unchanged"
+        self.assertEqual(mask.n_available, 70, msg=msg)
+        self.assertTrue(mask.is_available(3), msg=msg)
+        self.assertEqual(muted.n_available, 69, msg=msg)
+
+        msg = "Protected features should not be muted"
+        self.assertTrue(muted.is_available(5), msg=msg)
+        self.assertEqual(list(muted.features()[:5]), [0, 1, 2, 4, 5], msg=msg)
+
+        # Refitting should not depend on max_feats resolved in previous fit
+        rng = np.random.RandomState(1718)
+        X   = np.column_stack([rng.randn(self.n, 15), self.X])
+        clf = CITreeClassifier(max_feats='sqrt', random_state=1718).fit(X, self.y)
+        clf.fit(X[:, -4:], self.y)
+        msg = "max_feats should not be overwritten during fit"
+        self.assertEqual(clf.max_feats, 'sqrt', msg=msg)
+        self.assertEqual(clf.max_feats_, 2, msg=msg)
+
+        # Constant features count towards max_feats
+        clf.fit(np.column_stack([X[:, -8:], np.zeros(self.n)]), self.y)
+        msg = "Constant features should not be muted before max_feats"
+        self.assertEqual(clf.max_feats_, 3, msg=msg)
+
+
+    def test_categorical_features(self):
+        """Test for categorical features with category splits"""
+
+        # Classes are determined by non-contiguous categories
+        rng  = np.random.RandomState(1718)
+        cats = rng.randint(0, 6, self.n)
+        X    = np.column_stack([cats, rng.randn(self.n)])
+        y    = np.isin(cats, [1, 3, 4]).astype(float)
+        clf  = CITreeClassifier(categorical_features=[0],
+                                random_state=1718).fit(X, y)
+
+        msg = "Categorical split should separate classes with one split"
+        self.assertEqual(clf.score(X, y), 1.0, msg=msg)
+        self.assertIn(set(clf.root.categories), [{1, 3, 4}, {0, 2, 5}], msg=msg)
+
+        msg = "Flattened tree should route samples like recursive predictions"
+        self.assertTrue(np.allclose(clf.predict_proba(X), np.array(
+                        [clf.predict_label(x) for x in X])), msg=msg)
+
+        # Indices outside of feature range are invalid
+        with self.assertRaises(ValueError):
+            CITreeClassifier(categorical_features=[2]).fit(X, y)
+
+
+    def test_approx_distance(self):
+        """Test for approximate distance correlation selector"""
+
+        # Nonlinear signal that Pearson correlation misses
+        rng = np.random.RandomState(1718)
+        X   = rng.uniform(-1, 1, (self.n, 3))
+        y   = X[:, 2]**2 + .05*rng.randn(self.n)
+        reg = CITreeRegressor(selector='approx_distance', n_bins=16,
+                              random_state=1718).fit(X, y)
+
+        msg = "Approximate distance selector should select feature 2 at root"
+        self.assertEqual(reg.root.col, 2, msg=msg)
+
+        with self.assertRaises(ValueError):
+            CITreeRegressor(selector='approx_distance', n_bins=1)
+
+
+    @unittest.skipIf(CFUNC_DCORS_DLL is None, "C distance correlation "
+                     "library could not be built or loaded")
+    def test_distance_engine(self):
+        """Test for C distance correlation engine of regression trees"""
+
+        # Continuous features do not compress, so the engine runs the tests
+        rng   = np.random.RandomState(1718)
+        X     = rng.uniform(-1, 1, (150, 3))
+        y     = X[:, 1]**2 + .1*rng.randn(150)
+        trees = [CITreeRegressor(selector=selector, engine=engine,
+                                 n_permutations=50, max_depth=2,
+                                 random_state=1718).fit(X, y)
+                 for selector in ['distance', 'hybrid']
+                 for engine in ['numba', 'c']]
+
+        msg = "C engine should grow the same tree as the numba engine"
+        for numba_tree, c_tree in [trees[:2], trees[2:]]:
+            self.assertEqual(c_tree.root.col, numba_tree.root.col, msg=msg)
+            self.assertAlmostEqual(c_tree.root.col_pval,
+                                   numba_tree.root.col_pval, msg=msg)
+            np.testing.assert_allclose(c_tree.predict(X), numba_tree.predict(X))
+
+        reg = CIForestRegressor(selector='distance', engine='c')
+        self.assertEqual(reg.params['engine'], 'c')
+        for Model in [CITreeRegressor, CIForestRegressor]:
+            with self.assertRaises(ValueError): Model(engine='fortran')
+
+
+    def test_hsic(self):
+        """Test for random Fourier feature HSIC selector"""
+
+        # Nonlinear signal that Pearson correlation misses
+        rng = np.random.RandomState(1718)
+        X   = rng.uniform(-1, 1, (self.n, 3))
+        y   = X[:, 2]**2 + .05*rng.randn(self.n)
+        reg = CITreeRegressor(selector='hsic', n_fourier=10,
+                              random_state=1718).fit(X, y)
+
+        msg = "HSIC selector should select feature 2 at root"
+        self.assertEqual(reg.root.col, 2, msg=msg)
+
+        # Classes use the delta kernel
+        X   = np.column_stack([rng.randn(self.n, 3), self.X])
+        clf = CITreeClassifier(selector='hsic',
+                               random_state=1718).fit(X, self.y)
+
+        acc = clf.score(X, self.y)
+        msg = "Accuracy for CITreeClassifier with hsic selector (%.2f) " \
+              "should be 1.0 for simple toy data" % acc
+        self.assertEqual(acc, 1.0, msg=msg)
+
+        with self.assertRaises(ValueError):
+            CITreeRegressor(selector='hsic', n_fourier=0)
+
+        # Positional arguments keep their original meaning
+        for tree in [CITreeClassifier(2, .05, 'mc', 5),
+                     CITreeRegressor(2, .05, 'pearson', 5)]:
+            self.assertEqual((tree.max_depth, tree.n_fourier), (5, 20))
+
+
+    def test_xi(self):
+        """Test for Chatterjee's xi selector"""
+
+        # Nonmonotone signal that Pearson correlation misses
+        rng = np.random.RandomState(1718)
+        X   = rng.uniform(-1, 1, (self.n, 3))
+        y   = np.cos(3*X[:, 1]) + .05*rng.randn(self.n)
+        reg = CITreeRegressor(selector='xi', random_state=1718).fit(X, y)
+
+        msg = "Xi selector should select feature 1 at root"
+        self.assertEqual(reg.root.col, 1, msg=msg)
+
+        r2  = reg.score(X, y)
+        msg = "R^2 for CITreeRegressor with xi selector (%.2f) should be " \
+              "above 0.9" % r2
+        self.assertGreater(r2, .9, msg=msg)
+
+
     def test_CIForestClassifier(self):
         """Test for CIForestClassifier"""
 
@@ -52,6 +438,170 @@ class TestClassificationTrees(unittest.TestCase):
         self.assertAlmostEqual(acc, 1.0, delta=.05, msg=msg)
 
 
+    def test_CIForestClassifier_fit_iter(self):
+        """Test for streaming trees with fit_iter"""
+
+        # Train with thread pool and check every tree is yielded once
+        with ThreadPoolExecutor(max_workers=2) as pool:
+            clf     = CIForestClassifier(n_estimators=10, executor=pool,
+                                         random_state=1718)
+            indices = [tree_idx for tree_idx, _ in clf.fit_iter(self.X, self.y)]
+
+        msg = "fit_iter should yield each of the 10 trees once, got %s" % indices
+        self.assertEqual(sorted(indices), list(range(10)), msg=msg)
+
+        acc = clf.score(self.X, self.y)
+        msg = "Accuracy for streamed CIForestClassifier (%.2f) should be 1.0 " \
+              "for simple toy data" % acc
+        self.assertAlmostEqual(acc, 1.0, delta=.05, msg=msg)
+
+
+    def test_screening(self):
+        """Test for forest screening of features before growing trees"""
+
+        # Informative feature among noise features
+        rng = np.random.RandomState(1718)
+        X   = np.column_stack([rng.randn(self.n, 20), self.X])
+        for screening in ['bh', 'bonferroni']:
+            clf = CIForestClassifier(n_estimators=5, screening=screening,
+                                     random_state=1718).fit(X, self.y)
+
+            msg = "%s screening should keep only informative feature" % screening
+            self.assertEqual(clf.available_features_.tolist(), [20], msg=msg)
+            self.assertEqual(clf.screening_pvalues_.shape, (21,))
+            for tree in clf.estimators_:
+                self.assertEqual(tree.available_features_.tolist(), [20])
+
+            acc = clf.score(X, self.y)
+            msg = "Accuracy for screened CIForestClassifier (%.2f) should be " \
+                  "1.0 for simple toy data" % acc
+            self.assertAlmostEqual(acc, 1.0, delta=.05, msg=msg)
+
+        with self.assertRaises(ValueError):
+            CIForestClassifier(screening='holm')
+
+
+    def test_alpha_path(self):
+        """Test for deriving models for smaller alphas without refitting"""
+
+        rng  = np.random.RandomState(0)
+        X    = rng.randn(300, 4)
+        y    = (X[:, 0] + .5*rng.randn(300) > 0).astype(int)
+        kw   = dict(muting=False, early_stopping=False, random_state=5)
+        tree = CITreeClassifier(alpha=.95, **kw).fit(X, y)
+        path = tree.predict_proba_path(X, [.01, .05])
+
+        # Without muting and early stopping, pruning should match a refit
+        for i, alpha in enumerate([.01, .05]):
+            refit = CITreeClassifier(alpha=alpha, **kw).fit(X, y)
+            msg   = "Pruned tree at alpha = %.2f does not match refit" % alpha
+            self.assertTrue(np.allclose(tree.prune(alpha).predict_proba(X),
+                                        refit.predict_proba(X)), msg=msg)
+            self.assertTrue(np.allclose(path[i], refit.predict_proba(X)),
+                            msg=msg)
+            self.assertTrue(np.allclose(tree.prune(alpha).feature_importances_,
+                                        refit.feature_importances_), msg=msg)
+
+        # Alphas larger than the fitted alpha cannot be derived
+        with self.assertRaises(ValueError):
+            CITreeClassifier(alpha=.05, **kw).fit(X, y).predict_path(X, [.5])
+
+        # Forest paths average tree paths
+        clf  = CIForestClassifier(n_estimators=5, alpha=.5,
+                                  random_state=1718).fit(self.X, self.y)
+        path = clf.predict_path(self.X, [.01, .5])
+        msg  = "Forest path at fitted alpha should match predictions"
+        self.assertEqual(path.shape, (2, self.n))
+        self.assertTrue(np.array_equal(path[1], clf.predict(self.X)), msg=msg)
+
+
+    def test_staged_prediction(self):
+        """Test for staged predictions over trees and depths"""
+
+        clf    = CIForestClassifier(n_estimators=5, random_state=1718) \
+                    .fit(self.X, self.y)
+        staged = list(clf.staged_predict_proba(self.X, max_depth=1))
+
+        msg = "Number of stages (%d) should equal number of trees (5)" % len(staged)
+        self.assertEqual(len(staged), 5, msg=msg)
+
+        msg = "Last stage should match predictions of the full forest"
+        self.assertTrue(np.allclose(staged[-1],
+                                    clf.predict_proba(self.X, max_depth=1)),
+                        msg=msg)
+
+        msg = "First stage should match predictions of the first tree"
+        self.assertTrue(np.allclose(staged[0], clf.estimators_[0].predict_proba(
+                                    self.X, max_depth=1)), msg=msg)
+
+        # Depth path should match truncated predictions
+        path = clf.predict_proba_depth_path(self.X, [0, 1, 100])
+        for i, depth in enumerate([0, 1, 100]):
+            msg = "Depth path at depth %d does not match truncated " \
+                  "predictions" % depth
+            self.assertTrue(np.allclose(path[i], clf.predict_proba(
+                                        self.X, max_depth=depth)), msg=msg)
+
+
+    def test_oob_score(self):
+        """Test for out-of-bag predictions computed during fit"""
+
+        clf = CIForestClassifier(n_estimators=20, oob_score=True,
+                                 random_state=1718).fit(self.X, self.y)
+
+        msg = "Out-of-bag accuracy (%.2f) should be close to 1.0 for simple " \
+              "toy data" % clf.oob_score_
+        self.assertAlmostEqual(clf.oob_score_, 1.0, delta=.05, msg=msg)
+
+        msg = "Out-of-bag decision function should have one row per sample " \
+              "and one column per class"
+        self.assertEqual(clf.oob_decision_function_.shape, (self.n, 2), msg=msg)
+        self.assertEqual(clf.oob_margin_.shape, (self.n,), msg=msg)
+
+        # Bootstrap sampling is required
+        with self.assertRaises(ValueError):
+            CIForestClassifier(bootstrap=False, oob_score=True)
+
+
+    def test_permutation_importance_oob(self):
+        """Test for out-of-bag permutation importance"""
+
+        # Append noise feature to toy data
+        X   = np.column_stack([self.X, np.random.RandomState(1718).randn(self.n)])
+        clf = CIForestClassifier(n_estimators=20, max_feats='all',
+                                 random_state=1718).fit(X, self.y)
+        imp = clf.permutation_importance_oob(X, self.y, n_repeats=2, n_jobs=2)
+
+        msg = "Informative feature should have largest permutation importance"
+        self.assertEqual(np.argmax(imp), 0, msg=msg)
+        self.assertGreater(imp[0], .1, msg=msg)
+
+        # Bootstrap sampling is required
+        clf = CIForestClassifier(n_estimators=2, bootstrap=False).fit(X, self.y)
+        with self.assertRaises(ValueError):
+            clf.permutation_importance_oob(X, self.y)
+
+
+    def test_conditional_permutation_importance_oob(self):
+        """Test for out-of-bag conditional permutation importance"""
+
+        # Append noisy copy of informative feature to toy data
+        rng = np.random.RandomState(1718)
+        X   = np.column_stack([self.X, self.X.ravel() + 50*rng.randn(self.n)])
+        clf = CIForestClassifier(n_estimators=20, max_feats='all',
+                                 random_state=1718).fit(X, self.y)
+        imp  = clf.permutation_importance_oob(X, self.y, n_repeats=2)
+        cimp = clf.conditional_permutation_importance_oob(X, self.y,
+                                                          n_repeats=2)
+
+        msg = "Conditioning should not increase importance of correlated " \
+              "feature (%.3f > %.3f)" % (cimp[1], imp[1])
+        self.assertLessEqual(cimp[1], imp[1], msg=msg)
+
+        msg = "Informative feature should have largest conditional importance"
+        self.assertEqual(np.argmax(cimp), 0, msg=msg)
+
+
     def test_stratify_sampling(self):
         """Test for stratified sampling in classification"""
 
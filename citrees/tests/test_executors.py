@@ -0,0 +1,61 @@
+from __future__ import absolute_import, division, print_function
+
+from concurrent.futures import ThreadPoolExecutor
+from os.path import abspath, dirname
+import sys
+import unittest
+
+# Add path to avoid relative imports
+PATH = dirname(dirname(abspath(__file__)))
+if PATH not in sys.path: sys.path.append(PATH)
+
+from executors import (FuturesExecutor, get_executor, JoblibExecutor,
+                       LocalSocketCluster)
+
+
+def square(x):
+    """Squares number"""
+    return x*x
+
+
+class TestExecutors(unittest.TestCase):
+
+    def setUp(self):
+        """Generate toy tasks"""
+
+        self.tasks    = [(i,) for i in range(20)]
+        self.expected = dict((i, i*i) for i in range(20))
+
+
+    def check_results(self, executor, name):
+        """Checks that every task returns once with correct index"""
+
+        results = dict(executor.map_unordered(square, self.tasks))
+        msg     = "%s: results (%s) do not match expected results" % \
+                  (name, results)
+        self.assertEqual(results, self.expected, msg=msg)
+
+
+    def test_joblib_executor(self):
+        """Test for JoblibExecutor"""
+
+        self.check_results(JoblibExecutor(n_jobs=2, backend='threading'), 'Joblib')
+
+
+    def test_futures_executor(self):
+        """Test for FuturesExecutor"""
+
+        with ThreadPoolExecutor(max_workers=2) as pool:
+            self.check_results(FuturesExecutor(pool), 'Futures')
+            self.assertIsInstance(get_executor(pool), FuturesExecutor)
+
+
+    def test_socket_executor(self):
+        """Test for SocketExecutor with local socket workers"""
+
+        with LocalSocketCluster(n_workers=2) as cluster:
+            self.check_results(cluster.executor(), 'Socket')
+
+
+if __name__ == '__main__':
+    unittest.main()
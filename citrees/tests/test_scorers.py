@@ -2,6 +2,7 @@ from __future__ import absolute_import, division, print_function
 
 import numpy as np
 from os.path import abspath, dirname
+from scipy.stats import kendalltau, norm
 import sys
 import unittest
 
@@ -9,8 +10,16 @@ import unittest
 PATH = dirname(dirname(abspath(__file__)))
 if PATH not in sys.path: sys.path.append(PATH)
 
+from feature_selectors import (_approximate_pvalue, _check_method,
+                               permutation_test_dcor, permutation_test_mc,
+                               permutation_test_mi, permutation_test_pcor,
+                               permutation_test_kendall, permutation_test_rdc,
+                               permutation_test_xi, kendall_test, xi_test)
 from scorers import *
 
+# C tests are skipped, not silently run against the Python fallback
+NO_C_LIBRARY = "C distance correlation library could not be built or loaded"
+
 
 class TestScorers(unittest.TestCase):
 
@@ -62,6 +71,31 @@ class TestScorers(unittest.TestCase):
         self.assertAlmostEqual(wdcor, self.pearson_r, delta=.05, msg=msg)
 
 
+    def test_matrix_statistics(self):
+        """Test for pcor_matrix, mc_matrix and dcor_matrix"""
+
+        # Compare against statistics of single columns
+        X       = np.column_stack([self.x[:200], self.y[:200], np.ones(200)])
+        y       = self.y[:200]**2
+        classes = (self.y[:200] > 0).astype(int)
+        np.testing.assert_allclose(
+            pcor_matrix(X, y), [pcor(X[:, j], y) for j in range(3)], atol=1e-10)
+        np.testing.assert_allclose(
+            mc_matrix(X, classes, 2), [mc_fast(X[:, j], classes, 2)
+                                       for j in range(3)], atol=1e-10)
+        np.testing.assert_allclose(
+            dcor_matrix(X, y), [py_dcor(X[:, j], y) for j in range(3)],
+            atol=1e-10)
+
+        # Large offsets should not cancel in the sums of squares
+        for offset in [1e5, 1e8]:
+            np.testing.assert_allclose(pcor_matrix(X + offset, y + offset),
+                                       pcor_matrix(X, y), atol=1e-6)
+            np.testing.assert_allclose(mc_matrix(X + offset, classes, 2),
+                                       mc_matrix(X, classes, 2), atol=1e-6)
+
+
+    @unittest.skipIf(CFUNC_DCORS_DLL is None, NO_C_LIBRARY)
     def test_c_dcor(self):
         """Test for c_dcor"""
 
@@ -74,6 +108,7 @@ class TestScorers(unittest.TestCase):
         self.assertAlmostEqual(dcor, self.pearson_r, delta=.05, msg=msg)
 
 
+    @unittest.skipIf(CFUNC_DCORS_DLL is None, NO_C_LIBRARY)
     def test_c_wdcor(self):
         """Test for c_wdcor"""
 
@@ -85,6 +120,180 @@ class TestScorers(unittest.TestCase):
                 (diff, self.pearson_r, wdcor)
         self.assertAlmostEqual(wdcor, self.pearson_r, delta=.05, msg=msg)
 
+        # Compare against Python version with unequal weights
+        x, y    = self.x[:500], self.y[:500]
+        weights = np.random.exponential(size=500)
+        weights = weights/weights.sum()
+        self.assertAlmostEqual(c_wdcor(x, y, weights),
+                               py_wdcor(x, y, weights), places=8)
+
+
+    @unittest.skipIf(CFUNC_DCORS_DLL is None, NO_C_LIBRARY)
+    def test_c_errors(self):
+        """Test for errors raised by c_dcor and c_wdcor"""
+
+        # Error code for fewer than 2 samples
+        with self.assertRaises(ValueError): c_dcor([1.0], [2.0])
+        with self.assertRaises(ValueError): c_wdcor([1.0], [2.0], [1.0])
+
+        # Lengths are checked before passing pointers to C
+        with self.assertRaises(ValueError): c_dcor(self.x, self.y[:10])
+        with self.assertRaises(ValueError):
+            c_wdcor(self.x, self.y, self.weights[:10])
+
+        self.assertIsInstance(has_openmp(), bool)
+        self.assertEqual(has_openmp(), bool(CFUNC_DCORS_DLL.has_openmp()))
+
+
+    @unittest.skipIf(CFUNC_DCORS_DLL is None, NO_C_LIBRARY)
+    def test_c_engine(self):
+        """Test for permutation_test_dcor with C engine"""
+
+        # Same permutations so p-values of both engines agree
+        x, y = self.x[:300], self.y[:300]
+        for method in ['permutation', 'approximate']:
+            p_c = permutation_test_dcor(x, y, B=50, random_state=1,
+                                        engine='c', method=method)
+            p_n = permutation_test_dcor(x, y, B=50, random_state=1,
+                                        engine='numba', method=method)
+            self.assertAlmostEqual(p_c, p_n, places=6)
+
+        with self.assertRaises(ValueError):
+            permutation_test_dcor(x, y, engine='fortran')
+
+
+    def test_observed_theta(self):
+        """Test for passing observed statistics to permutation tests"""
+
+        # P-values should not change when the kernel is given the statistic
+        x, y    = self.x[:300], self.y[:300]
+        classes = (y > 0).astype(int)
+        tests   = [(permutation_test_pcor, y, np.fabs(pcor(x, y)), {}),
+                   (permutation_test_dcor, y, np.fabs(py_dcor(x, y)), {}),
+                   (permutation_test_mc, classes, mc_fast(x, classes, 2),
+                    {'n_classes': 2}),
+                   (permutation_test_mi, classes, mi(x, classes, 1718), {})]
+        for test, y_, theta, kwargs in tests:
+            p     = test(x, y_, B=50, random_state=1718, **kwargs)
+            p_obs = test(x, y_, B=50, random_state=1718, theta=theta, **kwargs)
+            msg   = "%s p-value changed with observed theta" % test.__name__
+            self.assertEqual(p, p_obs, msg=msg)
+
+
+    def test_compressed_dcor(self):
+        """Test for compressed_dcor"""
+
+        # Compare against py_dcor on a low cardinality feature
+        x     = np.round(self.x[:1000])
+        y     = self.y[:1000]
+        dcor  = py_dcor(x, y)
+        cdcor = compressed_dcor(x, y)
+        msg   = "Compressed distance correlation (%.4f) should equal distance " \
+                "correlation (%.4f)" % (cdcor, dcor)
+        self.assertAlmostEqual(cdcor, dcor, places=8, msg=msg)
+
+        # Arguments are compressed either way round
+        self.assertAlmostEqual(compressed_dcor(y, x), dcor, places=8)
+
+
+    def test_xicor(self):
+        """Test for xicor"""
+
+        # Near 1 for noiseless nonmonotone function, near 0 for independence
+        xi  = xicor(self.x, np.cos(3*self.x), random_state=1718)
+        msg = "Xi correlation (%.4f) should be near 1.0 for function of x" % xi
+        self.assertAlmostEqual(xi, 1.0, delta=.01, msg=msg)
+
+        xi  = xicor(self.x, np.random.permutation(self.y), random_state=1718)
+        msg = "Xi correlation (%.4f) should be near 0.0 for independent " \
+              "arrays" % xi
+        self.assertAlmostEqual(xi, 0.0, delta=.05, msg=msg)
+
+
+    def test_xi_test(self):
+        """Test for xi_test"""
+
+        # Without ties the variance of sqrt(n)*xi under independence is 2/5
+        rng   = np.random.RandomState(1718)
+        n     = 300
+        x, y  = rng.randn(n), rng.randn(n)
+        theta = xicor(x, y, random_state=1718)
+        p     = xi_test(x, y, random_state=1718)
+        var   = (np.sqrt(n)*theta/norm.isf(p))**2
+        msg   = "Variance of xi without ties (%.4f) should be 2/5" % var
+        self.assertAlmostEqual(var, .4, delta=1e-3, msg=msg)
+
+        # With ties in y the asymptotic p-value should agree with permutations
+        y     = np.round(y)
+        x     = np.abs(y) + 1.5*rng.randn(n)
+        p     = xi_test(x, y, random_state=1718)
+        p_B   = permutation_test_xi(xi_order(x, 1718), *xi_ranks(y), B=4000,
+                                    random_state=1718)
+        msg   = "Asymptotic p-value (%.4f) with ties should be near permutation " \
+                "p-value (%.4f)" % (p, p_B)
+        self.assertAlmostEqual(p, p_B, delta=.02, msg=msg)
+
+        # Small samples use the permutation test
+        p     = xi_test(x[:30], y[:30], B=50, random_state=1718)
+        p_B   = permutation_test_xi(xi_order(x[:30], 1718), *xi_ranks(y[:30]),
+                                    B=50, random_state=1718)
+        self.assertEqual(p, p_B)
+
+        # Constant y has no association
+        for m in [30, n]:
+            self.assertEqual(xi_test(x[:m], np.ones(m), random_state=1718), 1.0)
+
+
+    def test_kendall_tau(self):
+        """Test for kendall_tau"""
+
+        # Compare against scipy on data with ties in both arrays
+        x    = np.round(self.x[:500])
+        y    = np.round(self.y[:500])
+        tau  = kendall_tau(x, y)
+        true = kendalltau(x, y)[0]
+        msg  = "Kendall tau-b (%.4f) should equal scipy's value (%.4f)" % \
+               (tau, true)
+        self.assertAlmostEqual(tau, true, places=10, msg=msg)
+
+
+    def test_kendall_test(self):
+        """Test for kendall_test"""
+
+        # Compare against scipy's asymptotic p-value on data with ties
+        x = np.round(self.x[:500])
+        for y in [np.round(self.y[:500]), np.round(self.x[:500] +
+                                                   5*self.y[:500])]:
+            p    = kendall_test(x, y)
+            true = kendalltau(x, y, method='asymptotic')[1]
+            msg  = "Kendall p-value (%.6f) should equal scipy's value " \
+                   "(%.6f)" % (p, true)
+            self.assertAlmostEqual(p, true, places=10, msg=msg)
+
+        # Small samples use the permutation test
+        x, y = x[:30], np.round(self.y[:30])
+        p    = kendall_test(x, y, B=50, random_state=1718)
+        p_B  = permutation_test_kendall(x, y, B=50, random_state=1718)
+        self.assertEqual(p, p_B)
+        self.assertEqual(kendall_test(x, np.ones(30)), 1.0)
+
+
+    def test_table_split(self):
+        """Test for table_split_gini and table_split_mse"""
+
+        levels, codes = compress_ties(np.array([0., 0., 1., 1., 2., 2.]), 1.0)
+        y             = np.array([0, 0, 0, 0, 1, 1])
+
+        best, impurities = table_split_gini(codes, y, len(levels), 2)
+        msg              = "Best split (%d) should be after level 1" % best
+        self.assertEqual(best, 1, msg=msg)
+        np.testing.assert_allclose(impurities, [4/9., 0.0, 0.0])
+
+        best, impurities = table_split_mse(codes, y.astype(float), len(levels))
+        msg              = "Best split (%d) should be after level 1" % best
+        self.assertEqual(best, 1, msg=msg)
+        np.testing.assert_allclose(impurities, [2/9., 0.0, 0.0], atol=1e-12)
+
 
     def test_rdc(self):
         """Test for rdc"""
@@ -98,6 +307,39 @@ class TestScorers(unittest.TestCase):
         self.assertAlmostEqual(cor, self.pearson_r, delta=1.0, msg=msg)
 
 
+    def test_approximate_pvalue(self):
+        """Test for moment matched approximate p-values"""
+
+        # P-values are probabilities with and without signal
+        x, y  = self.x[:200], self.y[:200]
+        noise = np.random.RandomState(1718).randn(200)
+        for test in [permutation_test_dcor, permutation_test_rdc]:
+            for y_ in [y, noise]:
+                p = test(x, y_, B=30, random_state=1718, method='approximate')
+                self.assertTrue(0 <= p <= 1, msg="%s p-value (%.4f) should "
+                                "be in [0, 1]" % (test.__name__, p))
+
+        # Strong signal resolves p-values below the 1/B floor of permutations
+        y_ = x + .1*noise
+        p  = permutation_test_dcor(x, y_, B=30, random_state=1718,
+                                   method='approximate')
+        msg = "Approximate p-value (%g) should be in (0, 1/B)" % p
+        self.assertTrue(0 < p < 1/30., msg=msg)
+        self.assertEqual(permutation_test_dcor(x, y_, B=30,
+                                               random_state=1718), 0.0)
+
+        # Permuted statistics without variance fall back to the fraction
+        theta_p = np.full(10, .5)
+        self.assertEqual(_approximate_pvalue(.4, theta_p), 1.0)
+        self.assertEqual(_approximate_pvalue(.6, theta_p), 0.0)
+
+        for method in ['permutation', 'approximate']: _check_method(method)
+        for test in [_check_method,
+                     lambda m: permutation_test_dcor(x, y, method=m),
+                     lambda m: permutation_test_rdc(x, y, method=m)]:
+            with self.assertRaises(ValueError): test('exact')
+
+
     def test_gini_index(self):
         """Test for gini_index"""
 
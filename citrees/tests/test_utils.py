@@ -2,7 +2,9 @@ from __future__ import absolute_import, division, print_function
 
 import numpy as np
 from os.path import abspath, dirname
+import shutil
 import sys
+import tempfile
 import unittest
 
 # Add path to avoid relative imports
@@ -10,7 +12,10 @@ PATH = dirname(dirname(abspath(__file__)))
 if PATH not in sys.path: sys.path.append(PATH)
 
 from externals.six.moves import zip
-from utils import auc_score, estimate_margin
+from feature_selectors import permutation_test_dcor, permutation_test_pcor
+from utils import (auc_score, constant_columns, Dataset, estimate_margin,
+                   NullCache, partition_rows, reject_null, take_rows,
+                   wilson_interval, Workspace)
 
 
 class TestScorers(unittest.TestCase):
@@ -62,5 +67,131 @@ class TestScorers(unittest.TestCase):
         self.assertAlmostEqual(diff, 0.0, delta=1e-12)
 
 
+    def test_wilson_interval(self):
+        """Test for wilson_interval"""
+
+        # 95% interval for 0 successes in 10 trials is [0, .2775]
+        lower, upper = wilson_interval(0, 10, z=1.96)
+        self.assertAlmostEqual(lower, 0.0, delta=1e-12)
+        self.assertAlmostEqual(upper, .2775, delta=1e-4)
+
+        # Intervals contain estimated proportion and shrink with more trials
+        lower, upper = wilson_interval(np.array([5, 50]), np.array([10, 100]))
+        self.assertTrue(np.all(lower < .5) and np.all(upper > .5))
+        self.assertLess(upper[1]-lower[1], upper[0]-lower[0])
+
+
+    def test_null_cache(self):
+        """Test for NullCache"""
+
+        calls    = []
+        simulate = lambda: calls.append(1) or np.arange(3.0)
+
+        # Least recently used key is evicted
+        cache = NullCache(max_size=2)
+        cache.get('a', simulate)
+        cache.get('b', simulate)
+        cache.get('a', simulate)
+        cache.get('c', simulate)
+        self.assertEqual(len(calls), 3)
+        self.assertEqual(len(cache), 2)
+        cache.get('b', simulate)
+        self.assertEqual(len(calls), 4)
+
+        # Shared null distributions can not be modified by callers
+        null = cache.get('b', simulate)
+        self.assertFalse(null.flags.writeable)
+        with self.assertRaises(ValueError): null[0] = 1.0
+
+        # Null distributions persist on disk across caches
+        path = tempfile.mkdtemp()
+        try:
+            NullCache(path=path).get(('n', 10), simulate)
+            null = NullCache(path=path).get(('n', 10), simulate)
+            self.assertEqual(len(calls), 5)
+            np.testing.assert_array_equal(null, np.arange(3.0))
+        finally:
+            shutil.rmtree(path)
+
+
+    def test_reject_null(self):
+        """Test for reject_null"""
+
+        pvals = np.array([.001, .008, .039, .041, .042, .06, .074, .205])
+
+        # Benjamini-Hochberg rejects up to largest p-value under its threshold
+        reject = reject_null(pvals, alpha=.05, method='bh')
+        self.assertEqual(reject.tolist(), [True, True, False, False, False,
+                                           False, False, False])
+        reject = reject_null(pvals[::-1], alpha=.2, method='bh')
+        self.assertEqual(reject.sum(), 7)
+
+        reject = reject_null(pvals, alpha=.05, method='bonferroni')
+        self.assertEqual(reject.tolist(), [True] + [False]*7)
+
+        with self.assertRaises(ValueError):
+            reject_null(pvals, method='holm')
+
+
+    def test_workspace(self):
+        """Test for Workspace"""
+
+        rng  = np.random.RandomState(1718)
+        x    = rng.randn(40)
+        y    = x**2 + rng.randn(40)
+        work = Workspace(50, 100).buffers
+
+        # Kernels give the same p-values with and without buffers, also for
+        # more permutations than the workspace holds
+        for B in [100, 200]:
+            for test in [permutation_test_pcor, permutation_test_dcor]:
+                p1 = test(x, y, B=B, random_state=1718)
+                p2 = test(x, y, B=B, random_state=1718, work=work)
+                self.assertEqual(p1, p2)
+
+
+    def test_dataset(self):
+        """Test for Dataset, constant_columns, take_rows and partition_rows"""
+
+        X    = np.array([[0, 1, 5], [2, 1, 5], [2, 1, 7], [4, 1, 5]])
+        data = Dataset(X)
+        msg  = "Dataset should store columns contiguously"
+        self.assertTrue(data.X.flags['F_CONTIGUOUS'], msg=msg)
+        self.assertTrue(data.XT[0].flags['C_CONTIGUOUS'], msg=msg)
+
+        self.assertEqual(data.constant_.tolist(), [False, True, False])
+        self.assertEqual(constant_columns(X[1:]).tolist(), [False, True, False])
+        self.assertEqual(constant_columns(X[:2]).tolist(), [False, True, True])
+
+        # Row gathers stay column-major, also into a buffer
+        rows = np.array([True, False, True, True])
+        np.testing.assert_array_equal(take_rows(data.X, rows), X[rows])
+        self.assertTrue(take_rows(data.X, rows).flags['F_CONTIGUOUS'], msg=msg)
+        out = np.empty((3, 2))
+        np.testing.assert_array_equal(take_rows(data.X, [3, 0], out=out),
+                                      X[[3, 0]])
+
+        # Metadata of features comes from one cached sort of each feature
+        self.assertEqual(data.min_.tolist(), [0, 1, 5])
+        self.assertEqual(data.max_.tolist(), [4, 1, 7])
+        self.assertEqual(data.n_unique_.tolist(), [3, 1, 2])
+        levels, codes = data.levels(0)
+        self.assertEqual(levels.tolist(), [0, 2, 4])
+        self.assertEqual(codes.tolist(), [0, 1, 1, 2])
+        self.assertIs(data.levels(0)[1], codes)
+        for rows in [[3, 0], [2, 1, 3], [2]]:
+            levels, codes = data.node_levels(0, np.array(rows))
+            np.testing.assert_array_equal(levels[codes], X[rows, 0])
+            self.assertEqual(levels.tolist(), sorted(set(X[rows, 0])))
+
+        # Children are written side by side in one buffer, keeping row order
+        go_left         = X[:, 2] == 5
+        out             = np.empty((3, 6))
+        X_left, X_right = partition_rows(data.X, go_left, out=out)
+        np.testing.assert_array_equal(X_left, X[go_left])
+        np.testing.assert_array_equal(X_right, X[~go_left])
+        self.assertTrue(np.shares_memory(X_left, out))
+
+
 if __name__ == '__main__':
     unittest.main()
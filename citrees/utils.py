@@ -1,7 +1,13 @@
 from __future__ import absolute_import, print_function
 
+from collections import OrderedDict
+import hashlib
 from numba import jit
 import numpy as np
+import os
+from os.path import exists, isdir, join
+import tempfile
+import threading
 
 # from externals.six.moves import range
 
@@ -94,3 +100,433 @@ def estimate_margin(y_probs, y_true):
     
     # Margin is P(y == j) - max(P(y != j))
     return true_probs - other_probs
+
+
+def wilson_interval(k, n, z=2.576):
+    """Wilson score interval for a binomial proportion
+
+    Parameters
+    ----------
+    k : int or 1d array-like
+        Number of successes
+
+    n : int or 1d array-like
+        Number of trials
+
+    z : float
+        Quantile of standard normal distribution, 2.576 gives a 99% interval
+
+    Returns
+    -------
+    lower : float or 1d array-like
+        Lower bound of interval
+
+    upper : float or 1d array-like
+        Upper bound of interval
+    """
+    p      = np.asarray(k, dtype=float)/n
+    z2     = z*z
+    center = (p + z2/(2*n))/(1 + z2/n)
+    half   = z*np.sqrt(p*(1-p)/n + z2/(4*n*n))/(1 + z2/n)
+    return np.maximum(center - half, 0.0), np.minimum(center + half, 1.0)
+
+
+def reject_null(pvals, alpha=.05, method='bh'):
+    """Multiple testing correction of p-values
+
+    Parameters
+    ----------
+    pvals : 1d array-like
+        Array of p-values
+
+    alpha : float
+        False discovery rate for 'bh' or family-wise error rate for
+        'bonferroni'
+
+    method : str
+        'bh' for the Benjamini-Hochberg step-up procedure or 'bonferroni'
+
+    Returns
+    -------
+    reject : 1d array-like
+        Boolean array, True where the null hypothesis is rejected
+    """
+    pvals = np.asarray(pvals, dtype=float)
+    m     = len(pvals)
+    if method == 'bonferroni':
+        return pvals <= alpha/m
+    elif method == 'bh':
+        order  = np.argsort(pvals, kind='mergesort')
+        below  = np.flatnonzero(pvals[order] <= alpha*np.arange(1, m+1)/m)
+        reject = np.zeros(m, dtype=bool)
+        if len(below): reject[order[:below[-1]+1]] = True
+        return reject
+    else:
+        raise ValueError("%s not a valid method, valid methods are bh and "
+                         "bonferroni" % str(method))
+
+
+class NullCache(object):
+    """Cache of simulated null distributions with least recently used
+    eviction and optional persistence to disk. Permutation nulls of rank
+    statistics only depend on sample size and class counts, so trees and
+    forests share them through the process wide instance NULL_CACHE
+
+    Note: Processes do not share memory, so workers of a process based
+          executor each fill their own cache unless path is set
+
+    Parameters
+    ----------
+    max_size : int
+        Maximum number of null distributions kept in memory
+
+    path : str
+        Directory where null distributions are saved and looked up, None keeps
+        them in memory only
+    """
+    def __init__(self, max_size=1024, path=None):
+        self.max_size = int(max_size)
+        self.path     = path
+        self._tables  = OrderedDict()
+        self._lock    = threading.Lock()
+
+
+    def _file(self, key):
+        """File name of null distribution for key"""
+        digest = hashlib.md5(repr(key).encode('utf-8')).hexdigest()
+        return join(self.path, 'null_%s.npy' % digest)
+
+
+    def get(self, key, simulate):
+        """Returns null distribution for key, simulating it on a miss
+
+        Parameters
+        ----------
+        key : tuple
+            Hashable key with a stable repr, for example name of statistic,
+            sample size and number of permutations
+
+        simulate : function handle
+            Function without arguments that returns the null distribution
+
+        Returns
+        -------
+        null : 1d array-like
+            Null distribution, read-only since callers share it
+        """
+        with self._lock:
+            if key in self._tables:
+                self._tables.move_to_end(key)
+                return self._tables[key]
+
+        # Simulate outside of lock so other keys are not blocked
+        null = None
+        if self.path is not None and exists(self._file(key)):
+            try:
+                null = np.load(self._file(key))
+            except (IOError, ValueError):
+                null = None
+        if null is None:
+            null = np.asarray(simulate())
+            if self.path is not None: self._save(key, null)
+        null.flags.writeable = False
+
+        with self._lock:
+            self._tables[key] = null
+            self._tables.move_to_end(key)
+            while len(self._tables) > self.max_size:
+                self._tables.popitem(last=False)
+        return null
+
+
+    def _save(self, key, null):
+        """Writes null distribution to temporary file and moves it into place
+        so readers never see a partial file"""
+        if not isdir(self.path): os.makedirs(self.path)
+        fd, tmp = tempfile.mkstemp(suffix='.npy', dir=self.path)
+        try:
+            with os.fdopen(fd, 'wb') as f: np.save(f, null)
+            os.replace(tmp, self._file(key))
+        finally:
+            if exists(tmp): os.remove(tmp)
+
+
+    def clear(self):
+        """Removes all null distributions from memory"""
+        with self._lock: self._tables.clear()
+
+
+    def __len__(self):
+        return len(self._tables)
+
+
+# Process wide cache of null distributions
+NULL_CACHE = NullCache()
+
+
+class Workspace(object):
+    """Preallocated buffers reused by the permutation kernels. A tree sizes
+    one workspace for its training samples and number of permutations, so
+    the permutation loops of its nodes reuse the same memory instead of
+    allocating a label copy, permuted statistics and distance row sums for
+    every feature
+
+    Note: Buffers are overwritten by every kernel call, so a workspace must
+          not be shared between threads
+
+    Parameters
+    ----------
+    n : int
+        Largest number of samples passed to a kernel
+
+    B : int
+        Largest number of permutations
+    """
+    def __init__(self, n, B):
+        self.n       = int(n)
+        self.B       = int(B)
+        self.values  = np.zeros((3, self.n))
+        self.theta_p = np.zeros(max(1, self.B))
+
+
+    @property
+    def buffers(self):
+        """Tuple of buffers passed to kernels as work. Row 0 of values holds
+        the permuted labels and rows 1 and 2 the distance row sums"""
+        return self.values, self.theta_p
+
+
+@jit(nopython=True, cache=True, nogil=True)
+def _gather_columns(XT, rows, out):
+    """Copies XT[:, rows] into out one contiguous feature at a time"""
+    for j in range(XT.shape[0]):
+        xj, oj = XT[j], out[j]
+        for k in range(rows.shape[0]):
+            oj[k] = xj[rows[k]]
+    return out
+
+
+def take_rows(X, rows, out=None):
+    """Gathers rows of a column-major feature array into a new column-major
+    array, so columns of the result stay contiguous
+
+    Parameters
+    ----------
+    X : 2d array-like
+        Array of n samples and p features, ideally column-major
+
+    rows : 1d array-like
+        Integer indices or boolean mask of rows
+
+    out : 2d array-like
+        C-contiguous buffer of shape (p, number of rows) that receives the
+        transposed result, None to allocate
+
+    Returns
+    -------
+    X_rows : 2d array-like
+        Column-major array of the selected rows, a view of out if given
+    """
+    rows = np.asarray(rows)
+    rows = np.flatnonzero(rows) if rows.dtype == bool else rows.astype(np.int64)
+    XT   = np.asarray(X).T
+    if out is None: out = np.empty((XT.shape[0], len(rows)), dtype=XT.dtype)
+    return _gather_columns(XT, rows, out).T
+
+
+@jit(nopython=True, cache=True, nogil=True)
+def _partition_columns(XT, go_left, n_left, out):
+    """Copies XT into out one feature at a time, rows going left first and
+    rows going right after them, each in their original order"""
+    for j in range(XT.shape[0]):
+        xj, oj = XT[j], out[j]
+        l, r   = 0, n_left
+        for k in range(go_left.shape[0]):
+            if go_left[k]:
+                oj[l] = xj[k]
+                l    += 1
+            else:
+                oj[r] = xj[k]
+                r    += 1
+    return out
+
+
+def partition_rows(X, go_left, out=None):
+    """Splits rows of a column-major feature array into the features of two
+    child nodes, written side by side into one buffer in a single pass
+
+    Parameters
+    ----------
+    X : 2d array-like
+        Array of n samples and p features, ideally column-major
+
+    go_left : 1d array-like
+        Boolean array of n elements, True for rows sent to the left child
+
+    out : 2d array-like
+        C-contiguous buffer of shape (p, at least n) that receives the
+        transposed result, None to allocate
+
+    Returns
+    -------
+    X_left : 2d array-like
+        Column-major array of rows sent left, a view of out
+
+    X_right : 2d array-like
+        Column-major array of rows sent right, a view of out
+    """
+    go_left = np.asarray(go_left, dtype=np.bool_)
+    n, XT   = go_left.shape[0], np.asarray(X).T
+    n_left  = int(go_left.sum())
+    if out is None: out = np.empty((XT.shape[0], n), dtype=XT.dtype)
+    out = _partition_columns(XT, go_left, n_left, out[:, :n])
+    return out[:, :n_left].T, out[:, n_left:].T
+
+
+@jit(nopython=True, cache=True, nogil=True)
+def _constant_rows(XT):
+    """Flags rows of XT whose values are all equal, stopping each scan at the
+    first value that differs"""
+    constant = np.ones(XT.shape[0], dtype=np.bool_)
+    for j in range(XT.shape[0]):
+        xj = XT[j]
+        for i in range(1, xj.shape[0]):
+            if xj[i] != xj[0]:
+                constant[j] = False
+                break
+    return constant
+
+
+def constant_columns(X):
+    """Whether each column of X is constant. Column-major arrays are scanned
+    in place and each scan stops at the first value that differs, so only
+    constant columns are read in full
+
+    Parameters
+    ----------
+    X : 2d array-like
+        Array of n samples and p features, ideally column-major
+
+    Returns
+    -------
+    constant : 1d array-like
+        Boolean array of p elements
+    """
+    return _constant_rows(np.asarray(X).T)
+
+
+class Dataset(object):
+    """Column-major storage of features built once per fit. Every column is
+    contiguous in memory, so the column reads of the selectors and splitters
+    and the row gathers of take_rows do not stride across rows. Metadata of
+    each feature is computed on first access and cached, in particular the
+    distinct values and the code of every sample from one sort of the
+    feature, which splitters reuse at every node instead of sorting node
+    samples again
+
+    Parameters
+    ----------
+    X : 2d array-like
+        Array of n samples and p features
+    """
+    def __init__(self, X):
+        self.XT      = np.ascontiguousarray(np.asarray(X).T, dtype=np.float64)
+        self.X       = self.XT.T
+        self._min    = None
+        self._max    = None
+        self._levels = {}
+
+        self.n_samples, self.n_features = self.X.shape
+
+
+    @property
+    def min_(self):
+        """Smallest value of each feature, computed on first access"""
+        if self._min is None: self._min = self.XT.min(axis=1)
+        return self._min
+
+
+    @property
+    def max_(self):
+        """Largest value of each feature, computed on first access"""
+        if self._max is None: self._max = self.XT.max(axis=1)
+        return self._max
+
+
+    @property
+    def constant_(self):
+        """Whether each feature is constant"""
+        return self.min_ == self.max_
+
+
+    @property
+    def n_unique_(self):
+        """Number of distinct values of each feature, sorts every feature
+        not sorted yet"""
+        return np.array([len(self.levels(j)[0])
+                         for j in range(self.n_features)])
+
+
+    def levels(self, col):
+        """Sorted distinct values of a feature and the code of each sample,
+        computed with one stable sort on first access
+
+        Parameters
+        ----------
+        col : int
+            Index of feature
+
+        Returns
+        -------
+        levels : 1d array-like
+            Sorted distinct values
+
+        codes : 1d array-like
+            Index in levels of the value of each of the n samples
+        """
+        if col not in self._levels:
+            xj      = self.XT[col]
+            order   = np.argsort(xj, kind='mergesort')
+            xs      = xj[order]
+            new     = np.ones(xs.shape[0], dtype=bool)
+            new[1:] = xs[1:] != xs[:-1]
+
+            codes        = np.empty(xs.shape[0], dtype=np.int64)
+            codes[order] = np.cumsum(new) - 1
+            self._levels[col] = (xs[new], codes)
+        return self._levels[col]
+
+
+    def node_levels(self, col, rows):
+        """Sorted distinct values of a feature on a subset of samples and the
+        code of each sample in the subset. Codes of the whole data set are
+        compacted with a table over all distinct values when the subset is
+        large, otherwise the integer codes of the subset are sorted, so no
+        float values are sorted either way
+
+        Parameters
+        ----------
+        col : int
+            Index of feature
+
+        rows : 1d array-like
+            Integer indices of samples in the subset
+
+        Returns
+        -------
+        levels : 1d array-like
+            Sorted distinct values in the subset
+
+        codes : 1d array-like
+            Index in levels of the value of each sample in the subset
+        """
+        levels, codes = self.levels(col)
+        codes         = codes[rows]
+        m             = codes.shape[0]
+        if len(levels) <= m*np.log2(m+1):
+            present        = np.zeros(len(levels), dtype=bool)
+            present[codes] = True
+            return levels[present], (np.cumsum(present) - 1)[codes]
+
+        used, codes = np.unique(codes, return_inverse=True)
+        return levels[used], codes.ravel().astype(np.int64)